@@ -4,229 +4,125 @@
 # formal and informal output. The remaining configurability features are 
 # implemented in program.py.
 
-from preferences import extract_prefs
-from classifiers import vectorizeUnknown
-import pandas as pd
+from preferences import ADDITIONAL_PREFS
+from restaurant_db import NO_PREFERENCE, NO_RESULTS, SLOTS, RestaurantDB
+from restaurant_table import is_missing, read_table
+from transition_table import DMS_TABLE
+import os
 
+# The first system utterance, informal and formal.
+WELCOME_UTTERANCES = ["Welcome to the system, enter your preferences for a restaurant. You can exit at any moment by typing 'quit'. ",
+                      "Hello, welcome to the restaurant recommendation system. "
+                      "You can ask for restaurants by area, price range or food type. How may I help you? (You can exit at any moment by typing 'quit'.) "]
 
-class DMS:
 
-    def __init__(self, input_classifier, vectorizer, data_dir):
+class DMS:
+    # The state of a dialog is kept in slots, with the preferences as codes
+    # into the values of the shared database and the results as row numbers,
+    # so an idle dialog takes little memory.
+    __slots__ = ["classifier", "db", "extractor", "formalOn", "state", "end_dialog", "system_utterance",
+                 "results", "current_suggestion", "pricerange", "area", "food", "additional", "unknown"]
+
+    def __init__(self, input_classifier, data_dir, extractor=None):
+        # Classifier (pipeline) that predicts the dialog acts of raw sentences,
+        # for example a CachedClassifier or a BatchingClassifier shared by many
+        # dialogs.
         self.classifier = input_classifier
-        self.vectorizer = vectorizer
-        self.data = pd.read_csv(data_dir)
+        # The restaurant database: the path to the CSV file (read without
+        # pandas), or a Table, dataframe or RestaurantDB that is shared between
+        # dialogs.
+        if not isinstance(data_dir, RestaurantDB):
+            data = read_table(data_dir) if isinstance(data_dir, (str, os.PathLike)) else data_dir
+            data_dir = RestaurantDB(data, extractor)
+        self.db = data_dir
+        # The preference extractor can be shared between dialogs.
+        if extractor is None:
+            extractor = self.db.extractor
+        self.extractor = extractor
 
         self.formalOn = 0
         self.state = "Welcome"
         self.end_dialog = False
-        self.system_utterance = ["Welcome to the system, enter your preferences for a restaurant. You can exit at any moment by typing 'quit'. ",
-                                 "Hello, welcome to the restaurant recommendation system. " 
-                                "You can ask for restaurants by area, price range or food type. How may I help you? (You can exit at any moment by typing 'quit'.) "][self.formalOn]
-        self.results = pd.DataFrame()
-        self.current_suggestion = 0
-        self.current_info = pd.Series()
-        self.preferences = {"pricerange": "", "area": "", "food": "", "touristic": False, "assigned seats": False, "children": False, "romantic": False}
+        self.system_utterance = WELCOME_UTTERANCES[self.formalOn]
+        self.set_initial_values()
 
-    def transition(self, user_input):
+    @property
+    def data(self):
         """
-        Transition of states depending on the class of the user input.
-        user_input: the user input to be classified.
+        The restaurant database (Table or dataframe).
         """
-        dialog_act = self.classify(user_input)
-        match self.state:
-            case "Welcome":
-                match dialog_act:
-                    case "thankyou" | "bye":
-                        self.state = "Exit"
-                    case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "reqmore" | "request":
-                        self.state = "RequestPreferences"
-                    case "inform" | "reqalts":
-                        # Update the user preferences if present in the input
-                        self.update_preferences(user_input)
-                        # Change the state
-                        self.choose_and_set_state()
-                    case "restart" | "repeat":
-                        pass
-
-            case "RequestPreferences":
-                match dialog_act:
-                    case "thankyou" | "bye":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "Welcome"
-                        # Initialize the preferences, so no preference for now.
-                        self.set_initial_values()
-                    case "inform" | "reqalts":
-                        self.update_preferences(user_input)
-                        self.choose_and_set_state()
-                    case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
-                        pass
-
-            case "AskFoodType":
-                match dialog_act:
-                    case "thankyou" | "bye":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "Welcome"
-                        self.set_initial_values()
-                    case "inform" | "reqalts":
-                        self.update_preferences(user_input)
-                        self.choose_and_set_state()
-                    case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
-                        pass
-
-            case "AskArea":
-                match dialog_act:
-                    case "thankyou" | "bye":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "Welcome"
-                        self.set_initial_values()
-                    case "inform" | "reqalts":
-                        self.update_preferences(user_input)
-                        self.choose_and_set_state()
-                    case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
-                        pass
+        return self.db.data
 
-            case "AskPriceRange":
-                match dialog_act:
-                    case "thankyou" | "bye":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "Welcome"
-                        self.set_initial_values()
-                    case "inform" | "reqalts":
-                        self.update_preferences(user_input)
-                        self.choose_and_set_state()
-                    case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
-                        pass
-
-            case "AskForFurtherRequirements":
-                match dialog_act:
-                    case "thankyou" | "bye":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "welcome"
-                        self.set_initial_values()
-                    case "inform" | "reqalts":
-                        # Collect any additional preferences
-                        self.retrieve_extra_preferences(user_input)
-                        # Lookup results that satisfy the (additional) 
-                        # preferences given by the user.
-                        self.results = self.lookup()
-                        self.state = "TellLookupResults"
-                    case "deny":
-                        self.state = "RequestPreferences"
-                    case "affirm":
-                        self.state = "RequestPreferences"
-                    case "negate":
-                        self.choose_and_set_state()
-                    case "ack"| "confirm" | "hello"| "null" | "repeat" | "reqmore" | "request":
-                        pass
+    @property
+    def preferences(self):
+        """
+        Returns a dictionary of the preferences of the user: the pricerange,
+        area and food ("" for no preference) and whether every additional
+        preference was given.
+        """
+        preferences = {column: self.preference(column) for column in SLOTS}
+        for bit, pref in enumerate(ADDITIONAL_PREFS):
+            preferences[pref] = bool(self.additional >> bit & 1)
+        return preferences
 
-            case "TellLookupResults":
-                if len(self.results) > 0:
-                    match dialog_act:
-                        case "thankyou" | "bye":
-                            self.state = "Exit"
-                        case "restart":
-                            self.state = "Welcome"
-                            self.set_initial_values()
-                        case "ack" | "affirm" | "request":
-                            # Collect the information about a restaurant.
-                            self.retrieve_restaurant_info()
-                            self.state = "OfferFurtherInformation"
-                        case "deny":
-                            self.state = "RequestPreferences"
-                        case "inform" | "reqalts":
-                            self.update_preferences(user_input)
-                            self.results = self.lookup()
-                            self.state = "TellLookupResults"
-                        case "reqmore":
-                            self.choose_and_set_state(reqmore=True)
-                        case "confirm" | "hello" | "negate" | "null" | "repeat":
-                            return
-                else:
-                    match dialog_act:
-                        case "thankyou" | "bye":
-                            self.state = "Exit"
-                        case "restart":
-                            self.state = "Welcome"
-                            self.set_initial_values()
-                        case "ack" | "affirm" | "deny":
-                            self.state = "RequestPreferences"
-                            self.set_initial_values()
-                        case "inform" | "reqalts":
-                            self.set_initial_values()
-                            self.update_preferences(user_input)
-                            self.choose_and_set_state()
-                        case "confirm" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
-                            return
+    def preference(self, column):
+        """
+        Returns the preference of the user for the column ("" for no
+        preference).
+        column: "pricerange", "area" or "food"
+        """
+        code = getattr(self, column)
+        if self.db.is_unknown(column, code):
+            return self.unknown[column]
+        return self.db.decode(column, code)
 
-            case "OfferFurtherInformation":
-                match dialog_act:
-                    case "thankyou" | "bye" | "negate":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "Welcome"
-                        self.set_initial_values()
-                    case "inform" | "reqalts":
-                        self.update_preferences(user_input)
-                        self.results = self.lookup()
-                        self.state = "TellLookupResults"
-                    case "deny":
-                        self.state = "RequestPreferences"
-                    case "confirm":
-                        self.state = "TellLookupResults"
-                    case "reqmore":
-                        self.choose_and_set_state(reqmore=True)
-                    case "ack" | "affirm" | "hello" | "null" | "repeat" | "request":
-                        pass
+    def set_preference(self, column, value):
+        """
+        Set the preference of the user for the column. A value that is not in
+        the database is kept by the dialog, not added to the shared database.
+        column: "pricerange", "area" or "food"
+        value: the preference
+        """
+        code = self.db.encode(column, value)
+        if self.db.is_unknown(column, code):
+            self.unknown = {**(self.unknown or {}), column: value}
+        setattr(self, column, code)
 
-            case "AskForAcceptance":
-                match dialog_act:
-                    case "thankyou" | "bye" | "ack" | "affirm":
-                        self.state = "Exit"
-                    case "restart":
-                        self.state = "Welcome"
-                        self.set_initial_values()
-                    case "confirm":
-                        self.state = "TellLookupResults"
-                    case "deny" | "negate":
-                        self.set_initial_values()
-                        self.state = "RequestPreferences"
-                    case "inform" | "reqalts":
-                        self.update_preferences(user_input)
-                        self.results = self.lookup()
-                        self.state = "TellLookupResults"
-                    case "hello" | "null" | "repeat" | "reqmore" | "request":
-                        pass
+    def transition(self, user_input):
+        """
+        Transition of states depending on the class of the user input.
+        user_input: the user input to be classified.
+        """
+        dialog_act = self.classify(user_input)
+        # The rule of the dialog policy (transition_table.py) for the state and
+        # the dialog act, compiled into a function (see make_rule) that
+        # returns whether the system utterance is updated.
+        update = RULES.get(self.state, NO_RULES)[dialog_act](self, user_input)
 
         # Update the utterance that the dialog system will return to the user.
-        self.update_utterance()
-        return
+        if update:
+            self.update_utterance()
 
     def classify(self, user_input):
         """
         Classify the user input to get the dialog act:
         user_input: the input from the user.
         """
-        user_input = vectorizeUnknown(self.vectorizer, user_input)
-
-        vectorized_sentence = self.vectorizer.transform([user_input])
-        return self.classifier.predict(vectorized_sentence)
+        return self.classifier.predict([user_input])[0]
 
     def lookup(self):
         """
         Lookup the restaurants that satisfy the preferences of the user.
+        Returns their row numbers in the database.
         """
-        results = self.data.copy()
-        masks = [results[column] == value for column, value in self.preferences.items() if value != "any" and type(value) is not bool]
-        if len(masks) > 0:
-            combined_mask = pd.concat(masks, axis=1).all(axis=1)
-            return self.filter_on_additional_requirements(results[combined_mask])
-        else:
-            return results
+        return self.db.lookup((self.pricerange, self.area, self.food), self.additional)
+
+    def update_results(self):
+        """
+        Lookup the restaurants that satisfy the preferences of the user and
+        keep them as the results.
+        """
+        self.results = self.lookup()
 
     def update_preferences(self, user_input):
         """
@@ -235,20 +131,20 @@ class DMS:
         """
         match self.state:
             case "AskFoodType":
-                foodType, area, priceRange = extract_prefs(user_input, category="food")
+                area, foodType, priceRange = self.extractor.extract_prefs(user_input, category="food")
             case "AskArea":
-                foodType, area, priceRange = extract_prefs(user_input, category="area")
+                area, foodType, priceRange = self.extractor.extract_prefs(user_input, category="area")
             case "AskPriceRange":
-                foodType, area, priceRange = extract_prefs(user_input, category="pricerange")
+                area, foodType, priceRange = self.extractor.extract_prefs(user_input, category="pricerange")
             case _:
-                foodType, area, priceRange = extract_prefs(user_input)
+                area, foodType, priceRange = self.extractor.extract_prefs(user_input)
 
         if foodType != "":
-            self.preferences["food"] = foodType
+            self.set_preference("food", foodType)
         if area != "":
-            self.preferences["area"] = area
+            self.set_preference("area", area)
         if priceRange != "":
-            self.preferences["pricerange"] = priceRange
+            self.set_preference("pricerange", priceRange)
 
     def update_utterance(self):
         """
@@ -273,19 +169,20 @@ class DMS:
                                          "What prices are you looking for?"][self.formalOn]
             case "TellLookupResults":
                 if len(self.results) > 0:
-                    name = self.results.iloc[self.current_suggestion].restaurantname
-                    food = self.results.iloc[self.current_suggestion].food
-                    area = self.results.iloc[self.current_suggestion].area
-                    pricerange = self.results.iloc[self.current_suggestion].pricerange
+                    restaurant = self.db.restaurant(self.results[self.current_suggestion])
+                    name = restaurant.restaurantname
+                    food = restaurant.food
+                    area = restaurant.area
+                    pricerange = restaurant.pricerange
                     utterance = f"{name} is a restaurant which"
-                    if not pd.isna(food):
+                    if not is_missing(food):
                         utterance += f" serves {food} food"
-                    if not pd.isna(pricerange):
+                    if not is_missing(pricerange):
                         utterance += f" has {pricerange} prices"
-                    if not pd.isna(area):
+                    if not is_missing(area):
                         utterance += f" and is in the {area} of town"
                     utterance += ". This is all known information about food type, price range and area."
-                    self.system_utterance = utterance + self.get_string_for_additional_requirements(self.results.iloc[self.current_suggestion])
+                    self.system_utterance = utterance + self.get_string_for_additional_requirements(restaurant)
                 else:
                     self.system_utterance = ["No restaurant meets your preferences. Change them. ",
                                              "Sorry, but there is no restaurant that meets your preferences. "
@@ -293,7 +190,7 @@ class DMS:
             case "OfferFurtherInformation":
                 utterance = ["This is all the info known:\n",
                              "The following information about the restaurant is known:\n"][self.formalOn]
-                for cat, val in self.current_info.items():
+                for cat, val in self.retrieve_restaurant_info():
                     utterance += f"{cat}: {val}\n"
                 utterance += ["Anything else I can do? ",
                               "How can I help you further? "][self.formalOn]
@@ -314,11 +211,11 @@ class DMS:
         Change the state of the state machine.
         reqmore: if more recommendations are being asked
         """
-        if self.preferences["food"] == "":
+        if self.food == NO_PREFERENCE:
             self.state = "AskFoodType"
-        elif self.preferences["area"] == "":
+        elif self.area == NO_PREFERENCE:
             self.state = "AskArea"
-        elif self.preferences["pricerange"] == "":
+        elif self.pricerange == NO_PREFERENCE:
             self.state = "AskPriceRange"
         elif reqmore:
             if len(self.results) - (self.current_suggestion + 1) > 0:
@@ -326,7 +223,7 @@ class DMS:
                 self.state = "TellLookupResults"
             else:
                 self.state = "AskForAcceptance"
-        elif self.state != "AskForFurtherRequirements" and not self.preferences["touristic"] and not self.preferences["assigned seats"] and not self.preferences["children"] and not self.preferences["romantic"]:
+        elif self.state != "AskForFurtherRequirements" and self.additional == 0:
             self.state = "AskForFurtherRequirements"
         elif self.state == "AskForFurtherRequirements" or self.state =="RequestPreferences":
             self.results = self.lookup()
@@ -338,55 +235,33 @@ class DMS:
         """
         Set all the preferences to their initial values.
         """
-        self.results = pd.DataFrame()
+        self.results = NO_RESULTS
         self.current_suggestion = 0
-        self.preferences = {"pricerange": "",
-                            "area": "",
-                            "food": "",
-                            "touristic": False,
-                            "assigned seats": False,
-                            "children": False,
-                            "romantic": False}
+        self.pricerange = NO_PREFERENCE
+        self.area = NO_PREFERENCE
+        self.food = NO_PREFERENCE
+        # Bit mask of the additional preferences, in the order of
+        # ADDITIONAL_PREFS.
+        self.additional = 0
+        # The preferences that are not in the database, by column, or None.
+        self.unknown = None
 
     def retrieve_restaurant_info(self):
         """
-        Get the relevant information for the selected restaurant.
+        Get the relevant information for the selected restaurant, as a list
+        of (category, value) tuples.
         """
-        info = self.results.iloc[self.current_suggestion][["phone", "addr", "postcode"]]
-        for cat, val in info.items():
-            if pd.isna(val):
-                info[cat] = "unknown"
-
-        self.current_info = info
+        return self.db.contact_info(self.results[self.current_suggestion])
 
     def retrieve_extra_preferences(self, user_input):
         """
         Collect the additional preferences from the user_input
         user_input: the input of the user.
         """
-        additional_prefs = ["touristic", "assigned seats", "children", "romantic"]
-
         # If keywords are present in the input, additional preference is true.
-        for pref in additional_prefs:
-            if pref in user_input:
-                self.preferences[pref] = True
-
-    def filter_on_additional_requirements(self, df):
-        """
-        Return the restaurant from the database that satisfy the additional
-        preferences:
-        df: the database/dataframe with restaurants.
-        """
-        if self.preferences["touristic"]:
-            return df[((df["pricerange"] == "cheap") & (df["quality"] == "good")) | (df["food"].isin(["chinese", "italian", "european", "indian", "british", "asian oriental"]))]
-        elif self.preferences["assigned seats"]:
-            return df[df["crowdedness"] == "busy"]
-        elif self.preferences["children"]:
-            return df[df["stay"] == "short"]
-        elif self.preferences["romantic"]:
-            return df[(df["stay"] == "long") | (df["crowdedness"] == "not busy")]
-        else:
-            return df
+        found, _ = self.extractor.find_additional_prefs(user_input)
+        for pref in found:
+            self.additional |= 1 << ADDITIONAL_PREFS.index(pref)
 
     def get_string_for_additional_requirements(self, df):
         """
@@ -394,20 +269,21 @@ class DMS:
         by the user.
         df: the database/dataframe with restaurants.
         """
-        if self.preferences["touristic"]:
+        preferences = self.preferences
+        if preferences["touristic"]:
             if df.pricerange == "cheap" and df.quality == "good":
                 return [" This is touristic because it is cheap and has good food. ",
                         " This restaurant is touristic, because it is cheap and has good food quality."][self.formalOn]
             elif df.food in ["chinese", "italian", "european", "indian", "british", "asian oriental"]:
                 return [f" This is touristic because the {df.food} food is popular. ",
                         f" This restaurant is touristic, because the {df.food} food it serves is popular."][self.formalOn]
-        elif df.crowdedness == "busy" and self.preferences["assigned seats"]:
+        elif df.crowdedness == "busy" and preferences["assigned seats"]:
             return [" It is very busy so it has assigned seats. ",
                     " This restaurant most likely has assigned seats, because it is a busy restaurant."][self.formalOn]
-        elif df.stay == "short" and self.preferences["children"]:
+        elif df.stay == "short" and preferences["children"]:
             return [" Perfect for kids since they do not allow you to stay long. ",
                     " Because this restaurant does not allow you to stay long, it is perfect for children."][self.formalOn]
-        elif self.preferences["romantic"]:
+        elif preferences["romantic"]:
             if df.stay == "long":
                 return [" This is a romantic place because you can stay longer. ",
                         " This restaurant is romantic, because it allows you to stay long."][self.formalOn]
@@ -425,3 +301,54 @@ class DMS:
         print(self.preferences)
 
 
+def make_rule(next_state, actions, update):
+    """
+    Returns the function of a rule of the dialog policy, called with the DMS
+    and the user input. It does the actions, sets the next state and returns
+    whether the system utterance is updated.
+    next_state: the next state, or None to keep the state (or leave it to
+    the actions).
+    actions: tuple of the functions of the actions.
+    update: whether the system utterance is updated.
+    """
+    if len(actions) == 0:
+        if next_state is None:
+            return lambda dms, user_input: update
+
+        def set_state(dms, user_input):
+            dms.state = next_state
+            return update
+        return set_state
+
+    def rule(dms, user_input):
+        for action in actions:
+            action(dms, user_input)
+        if next_state is not None:
+            dms.state = next_state
+        return update
+    return rule
+
+
+def make_guard(without_results, with_results):
+    """
+    Returns the function of a rule that depends on whether there are results.
+    without_results: the function of the rule without results.
+    with_results: the function of the rule with results.
+    """
+    def rule(dms, user_input):
+        if len(dms.results) > 0:
+            return with_results(dms, user_input)
+        return without_results(dms, user_input)
+    return rule
+
+
+# The rules of the dialog policy compiled into functions, by state and dialog
+# act. The actions are called with the DMS and the user input.
+RULES, NO_RULES = DMS_TABLE.bind_rules({
+    "update_preferences": DMS.update_preferences,
+    "retrieve_extra_preferences": DMS.retrieve_extra_preferences,
+    "choose_and_set_state": lambda dms, user_input: dms.choose_and_set_state(),
+    "choose_more": lambda dms, user_input: dms.choose_and_set_state(reqmore=True),
+    "set_initial_values": lambda dms, user_input: dms.set_initial_values(),
+    "lookup": lambda dms, user_input: dms.update_results(),
+}, make_rule, make_guard)
@@ -1,51 +1,148 @@
 # This file implements a Rule-based Baseline Systems for classifying dialogue acts.
 # The system always returns the majority class in the given data.
 
-import pandas as pd
-
-# Read the data into a dataframe and split the data into a training set (85%) and a test set (15%) 
-df = pd.read_fwf('data\dialog_acts.dat', colspecs='infer', header=None)
-df.insert(0,'dialog_act', 0)                                        # create a column called 'dialog_act' and set all values to 0
-trainingdata = df.iloc[:21676]                                      # 85% of the data 
-testdata = df.iloc[-3326:]                                          # 15% of the data
-
-# Define the dialog_acts as strings. We compare them later in the for-loop to the first word of each line in the dataframe
-dialog_array = ['ack', 'affirm', 'bye', 'confirm', 'deny', 'hello', 'inform', 'negate', 'null', 'rpeat', 'reqalts', 'reqmore', 'request', 'restart', 'thankyou']
-
-# Define the 15 dialog act counts so we can keep track of which one occurs the most
-dialog_counts = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-
-# Check which dialog act occurs the most in the training data                                 
-for index, row in trainingdata.iterrows():                          # iterate over the trainingdata           
-    first_word = row[0].split()                                     # row[0] is the current line that we are at in the dataframe, split makes it so that we can get the first word (dialog_act)
-    dialog_act = first_word[0]                                      # define the dialog act as the first word of the current line
-    for n in range(15):                                             # values 0 to 14, so we loop over the whole array
-        if dialog_act == dialog_array[n]:                           # if the dialog_act of the current line == to the corresponding dialog act in the array
-            trainingdata.at[index, 'dialog_act'] = dialog_array[n]  # we insert that dialog act string value into the new column 'dialog_act', so we have the dialog acts in a separate column
-            dialog_counts[n]+=1                                     # increment the dialog_act count of the corresponding dialog act  
-
-# Determine which dialog_act is the majority label
-iterate = 0                                         # initialize the iterater to 0
-majority_label = dialog_array[0]                    # set the majority_label at the beginning of the loop as a default to the first entry of dialog_array ('ack')
-for n in range(15):                                 # loop for n values 0 to 14
-    if dialog_counts[n] > iterate:                  # check if the value of count at n is bigger than the current value of the iterater
-        iterate = dialog_counts[n]                  # if that is the case, set the iterate to that value, so we can compare it to other values
-        majority_label = dialog_array[n]            # set the majority_label to the corresponding value in the dialog_array at value n (because that count is the largest thus far)                                      # now we have counted and set the majority label to the dialog act that has occured the most, in this case inform
+from collections import Counter
+from itertools import islice
+import numpy as np
+import sys
+
+PATH = "data/dialog_acts.dat"
+TRAIN_PERC = 0.85
+
+
+def count_labels(lines):
+    """
+    Returns a Counter of the dialog acts (the first word of every line) of
+    the labeled lines. The lines are read one by one, so an open file of any
+    size can be given.
+    lines: iterable of labeled lines, e.g. an open data file.
+    """
+    counts = Counter()
+    for line in lines:
+        words = line.split(maxsplit=1)
+        if len(words) > 0:
+            counts[words[0]] += 1
+    return counts
+
+
+class MajorityClassifier:
+    """
+    Classifies every utterance as the dialog act that occurs most often in
+    the training data.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.majority_label = "NONE"
+
+    def fit(self, dialog_act, utterance=None, sample_weight=None):
+        """
+        Count the dialog acts of the training set. Returns the classifier.
+        dialog_act: The dialog acts from the training set
+        utterance: The utterances from the training set (not used).
+        sample_weight: the number of times every dialog act occurs, or None
+        if every dialog act occurs once.
+        """
+        counts = Counter()
+        if sample_weight is None:
+            counts.update(dialog_act)
+        else:
+            for act, weight in zip(dialog_act, sample_weight):
+                counts[act] += weight
+        return self.fit_counts(counts)
+
+    def fit_file(self, path, n_lines=None):
+        """
+        Count the dialog acts in a data file in one pass, without reading the
+        whole file into memory. Returns the classifier.
+        path: the path to the data file.
+        n_lines: the number of lines at the start of the file to count, or
+        None to count the whole file.
+        """
+        with open(path) as f:
+            return self.fit_counts(count_labels(islice(f, n_lines)))
+
+    def fit_counts(self, counts):
+        """
+        Take the most common dialog act of the counts, the first one in
+        alphabetical order if there is a tie. Returns the classifier.
+        counts: Counter of the dialog acts.
+        """
+        self.counts = counts
+        if len(counts) > 0:
+            self.majority_label = max(sorted(counts), key=counts.get)
+        return self
+
+    def predict(self, sentences):
+        """
+        Returns a list of the predicted dialog acts of the sentences, like the
+        predict of the trained classifiers.
+        sentences: list of sentences
+        """
+        return [self.majority_label] * len(sentences)
+
+    def predict_one(self, utt):
+        """
+        Predict the dialog act for the given utterance
+        utt: the given utterance
+        """
+        return self.majority_label
+
+    def predict_batch(self, utterances):
+        """
+        Predict the dialog acts of a list of utterances at once.
+        utterances: the utterances
+        """
+        return np.full(len(utterances), self.majority_label)
+
+    def evaluate(self, dialog_act, utterance):
+        """
+        Returns the accuracy of the predictions for the utterances.
+        dialog_act: the correct dialog acts
+        utterance: the utterances
+        """
+        return float(np.mean(self.predict_batch(utterance) == np.asarray(dialog_act)))
+
 
 # baseline function1 that takes in the user input and always assigns it the majority label as the dialog act
-def userinput():
+def userinput(classifier):
+    import pandas as pd
+
     file = open("userinput.txt", "a")                                       # open a file to write user input to
-    print("Hi there! Please answer the prompt and type 'exit' to leave.")   # Ask the user for input and tell them how to leave    
+    print("Hi there! Please answer the prompt and type 'exit' to leave.")   # Ask the user for input and tell them how to leave
     while True:
-            user_input = input("Enter your input: ")                        # save the user input in a variable
-            if user_input == "exit":                                        # if the input was exit, exit the while loop    
-                break                                                                                      
-            file.write(user_input)                                          # write the user_input to the file    
+            try:
+                user_input = input("Enter your input: ")                    # save the user input in a variable
+            except (EOFError, KeyboardInterrupt):                           # stop at the end of the input or on ctrl-c
+                print()
+                break
+            if user_input == "exit":                                        # if the input was exit, exit the while loop
+                break
+            file.write(user_input)                                          # write the user_input to the file
             file.write("\n")                                                # write a new line to the file
-            print("Predicted class of your input:", majority_label)
+            print("Predicted class of your input:", classifier.predict_one(user_input))
     file.close()                                                            # close the file
     df_userinput = pd.read_fwf('userinput.txt', header=None)                # read the textfile with the user input into a dataframe
-    df_userinput.insert(0,'dialog_act', majority_label)                     # create a column called dialog_act in the dataframe and give it the value of the majority label
-    return df_userinput                                                     # return the dataframe of the userinput with the assigned dialog_act 
+    df_userinput.insert(0,'dialog_act', classifier.majority_label)          # create a column called dialog_act in the dataframe and give it the value of the majority label
+    return df_userinput                                                     # return the dataframe of the userinput with the assigned dialog_act
+
+
+if __name__ == '__main__':
+    # Split the data into a training set (85%) and a test set (15%), reading
+    # the file line by line
+    with open(PATH) as f:
+        n_lines = sum(1 for _ in f)
+    n_train = int(TRAIN_PERC * n_lines)
+
+    classifier = MajorityClassifier().fit_file(PATH, n_train)
+    with open(PATH) as f:
+        test_data = [line.split(maxsplit=1) + [""] for line in islice(f, n_train, None) if line.strip()]
+    test_act = [words[0] for words in test_data]
+    test_utt = [words[1] for words in test_data]
+    print(f"Majority label: {classifier.majority_label}")
+    print("accuracy ", classifier.evaluate(test_act, test_utt))
 
-userinput()                                                                 # call the function to start asking the user for data
\ No newline at end of file
+    # Only ask for input when a user is typing, so that running the file from
+    # a script or a pipe does not block
+    if sys.stdin.isatty():
+        userinput(classifier)                                               # call the function to start asking the user for data
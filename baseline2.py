@@ -1,21 +1,35 @@
 # This file implements a Rule-based Baseline Systems for classifying dialogue acts.
-# The system looks at the words from the utterances that are not stopwords 
+# The system looks at the words from the utterances that are not stopwords
 # (Nltk). It takes the class that has the highest frequency of a given word.
 # The system scores around 0.85 accuracy on the test set.
 
+import json
 import numpy as np
-from collections import Counter, defaultdict
-import nltk
-from nltk.corpus import stopwords 
 
-PATH = "data\dialog_acts.dat"
+PATH = "data/dialog_acts.dat"
+RULES_DIR = "data/rules.json"
 TRAIN_PERC = 0.85
 
+# The English stopwords of Nltk, so they do not have to be downloaded.
+STOPWORDS = frozenset([
+    "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "you're", "you've", "you'll",
+    "you'd", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself", "she", "she's",
+    "her", "hers", "herself", "it", "it's", "its", "itself", "they", "them", "their", "theirs",
+    "themselves", "what", "which", "who", "whom", "this", "that", "that'll", "these", "those", "am",
+    "is", "are", "was", "were", "be", "been", "being", "have", "has", "had", "having", "do", "does",
+    "did", "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as", "until", "while",
+    "of", "at", "by", "for", "with", "about", "against", "between", "into", "through", "during",
+    "before", "after", "above", "below", "to", "from", "up", "down", "in", "out", "on", "off", "over",
+    "under", "again", "further", "then", "once", "here", "there", "when", "where", "why", "how", "all",
+    "any", "both", "each", "few", "more", "most", "other", "some", "such", "no", "nor", "not", "only",
+    "own", "same", "so", "than", "too", "very", "s", "t", "can", "will", "just", "don", "don't",
+    "should", "should've", "now", "d", "ll", "m", "o", "re", "ve", "y", "ain", "aren", "aren't",
+    "couldn", "couldn't", "didn", "didn't", "doesn", "doesn't", "hadn", "hadn't", "hasn", "hasn't",
+    "haven", "haven't", "isn", "isn't", "ma", "mightn", "mightn't", "mustn", "mustn't", "needn",
+    "needn't", "shan", "shan't", "shouldn", "shouldn't", "wasn", "wasn't", "weren", "weren't", "won",
+    "won't", "wouldn", "wouldn't",
+])
 
-# Dictionary of most common words with their dialog act. If a word is in the 
-# dictionary, the utterance is of that corresponding act. 
-rules = {}
-duplicates = []
 
 def extract_data(path):
     """
@@ -34,142 +48,178 @@ def extract_data(path):
     return set(dialog_act), np.array(dialog_act), np.array(utterance)
 
 
-def total_act_word_counter(dialog_act, utterance):
+class KeywordRuleClassifier:
     """
-    return a Counter object of dialog_act and utterance pair occurences.
-    dialog_act: the list of dialog acts of all utterances
-    utterance: the list of corresponding utterances
+    Classifies an utterance by its first keyword: a word that is not a
+    stopword and was seen during training. The dialog act is the act the
+    keyword was seen with most often. If there is no keyword, the dialog act
+    is "NONE".
     """
-    act_utt_list = []
 
-    for (act, sent) in zip(dialog_act, utterance):
-        for u in sent.split():
-            act_utt_list.append((act, u))
-
-    count_act_utt = Counter(act_utt_list)
-    return count_act_utt
-
-
-def act_word_dict(total_count_act_utt):
-    """
-    Returns a dictionary of Counter objects of the word for a given act as
-    dict[act][word]
-    total_count_act_utt: Counter object with counts for all (act, word) pairs.
-    """
-    # Nested dictionary. count_dict[act][word] will give the occurences for the
-    # given act and word
-    count_dict = defaultdict(lambda: Counter())
-
-    for ((act, word), cnt) in total_count_act_utt.items():
-        # Inserts for the given act and word the corresponsing count.
-        count_dict[act][word] += cnt
-
-    return count_dict
-
-
-def create_rule(act_word_cnt_dict, act_set):
-    """
-    Create the keyword rules
-    act_word_cnt_dict: dictionary of every act with their possible words and 
-    corresponding counts.
-    act_set: The set of possible dialog acts.
-    """
-    # Download the collection of stopwords from nltk.
-    nltk.download('stopwords')
-    
-    for act in act_set:
-        for (word, cnt) in act_word_cnt_dict[act].items():
-            # Leave out any stopwords.
-            if word not in stopwords.words('english'):
-                if word in rules:
-                    rules[word].append((act, cnt))
-                else:
-                    rules[word] = [(act, cnt)]
-
-    
-def train(act_set, dialog_act, utterance):
-    """
-    Get the keyword rules by using the train set
-    act_set: The set of dialog acts seen in the training set
-    dialog_act: The dialog acts from the training set
-    utterance: The utterances from the training set.
-    """
-    
-    # Counter object of all dialog act and word pairs. Counter[(act, word)]
-    total_count_act_word = total_act_word_counter(dialog_act, utterance)
-    
-    # Dictionary of Counter objects for a given act and word. Dict[act][word]    
-    act_word_cnt_dict = act_word_dict(total_count_act_word)
-
-    create_rule(act_word_cnt_dict, act_set)
-
-
-def predict(utt):
-    """
-    Predict the dialog act for the given utterance
-    utt: the given utterance
-    """
-    predict_act = "NONE"
-    possible_acts = []
-    
-    # For every word in the utterance
-    for word in utt.split():
-        if word in rules:                                
-            possible_acts.extend(rules[word])
-            # The word is in the dictionary, so it can be classified. 
-            # End the forloop for this sentence.
-            break
-
-    if len(possible_acts) > 0:                        
-        predict_act = max(possible_acts, key=lambda item: item[1])[0]
-
-    return predict_act
+    def __init__(self):
+        # The possible dialog acts, the keywords and the table of how often
+        # every keyword (row) was seen with every dialog act (column).
+        self.classes = np.array([], dtype=str)
+        self.vocabulary = {}
+        self.counts = np.zeros((0, 0))
+        self.compile()
+
+    def fit(self, dialog_act, utterance, sample_weight=None):
+        """
+        Count the words of the utterances per dialog act. Returns the
+        classifier.
+        dialog_act: The dialog acts from the training set
+        utterance: The utterances from the training set.
+        sample_weight: the number of times every utterance occurs, or None if
+        every utterance occurs once.
+        """
+        self.classes = np.array(sorted(set(dialog_act)))
+        class_index = {act: i for i, act in enumerate(self.classes)}
+        if sample_weight is None:
+            sample_weight = np.ones(len(dialog_act))
+
+        # Code every (keyword, act) occurrence as keyword * n_classes + act
+        self.vocabulary = {}
+        codes, weights = [], []
+        for act, utt, weight in zip(dialog_act, utterance, sample_weight):
+            for word in utt.split():
+                # Leave out any stopwords.
+                if word not in STOPWORDS:
+                    word_index = self.vocabulary.setdefault(word, len(self.vocabulary))
+                    codes.append(word_index * len(self.classes) + class_index[act])
+                    weights.append(weight)
+
+        n_cells = len(self.vocabulary) * len(self.classes)
+        self.counts = np.bincount(np.array(codes, dtype=np.int64), weights=weights,
+                                  minlength=n_cells).reshape(len(self.vocabulary), len(self.classes))
+        self.compile()
+        return self
+
+    def compile(self):
+        """
+        Compute the dialog act and the margin of every keyword from the
+        counts. The margin is the difference between the counts of the most
+        and second most common act, as a fraction of all counts of the
+        keyword: 1 if the keyword was only seen with one act.
+        """
+        # The last entries are for utterances without a keyword.
+        n_words = len(self.vocabulary)
+        self.best = np.append(self.counts.argmax(axis=1) if n_words > 0 else [], -1).astype(np.int64)
+        self.labels = np.append(self.classes, "NONE")
+        ordered = -np.sort(-self.counts, axis=1)
+        top = ordered[:, 0] if self.counts.shape[1] > 0 else np.zeros(n_words)
+        second = ordered[:, 1] if self.counts.shape[1] > 1 else np.zeros(n_words)
+        total = self.counts.sum(axis=1)
+        total[total == 0] = 1
+        self.margins = np.append((top - second) / total, 0.0)
+
+    def keyword(self, utt):
+        """
+        Returns the index of the first keyword of the utterance, or -1 if
+        there is none.
+        utt: the given utterance
+        """
+        for word in utt.split():
+            if word in self.vocabulary:
+                return self.vocabulary[word]
+        return -1
+
+    def predict(self, utt, return_margin=False):
+        """
+        Predict the dialog act for the given utterance
+        utt: the given utterance
+        return_margin: also return the margin of the keyword (0 if there is
+        no keyword).
+        """
+        word_index = self.keyword(utt)
+        act = self.labels[self.best[word_index]]
+        if return_margin:
+            return act, self.margins[word_index]
+        return act
+
+    def predict_batch(self, utterances, return_margin=False):
+        """
+        Predict the dialog acts of a list of utterances at once.
+        utterances: the utterances
+        return_margin: also return the array of margins of the keywords.
+        """
+        # The index of every word of all utterances in the vocabulary (-1 if
+        # it is not a keyword), and the utterance it belongs to.
+        words = [utt.split() for utt in utterances]
+        word_index = np.array([self.vocabulary.get(word, -1) for utt in words for word in utt], dtype=np.int64)
+        utt_index = np.repeat(np.arange(len(words)), [len(utt) for utt in words])
+
+        # The first keyword of every utterance, -1 if there is none.
+        keywords = np.full(len(words), -1, dtype=np.int64)
+        found = word_index >= 0
+        utts_with_keyword, first = np.unique(utt_index[found], return_index=True)
+        keywords[utts_with_keyword] = word_index[found][first]
+
+        acts = self.labels[self.best[keywords]]
+        if return_margin:
+            return acts, self.margins[keywords]
+        return acts
+
+    def evaluate(self, dialog_act, utterance):
+        """
+        Returns the accuracy of the predictions for the utterances.
+        dialog_act: the correct dialog acts
+        utterance: the utterances
+        """
+        return float(np.mean(self.predict_batch(utterance) == np.asarray(dialog_act)))
+
+    def save(self, path=RULES_DIR):
+        """
+        Save the keyword rules to a JSON file.
+        path: the path to the file.
+        """
+        words = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path, "w") as f:
+            json.dump({"classes": self.classes.tolist(), "words": words, "counts": self.counts.tolist()}, f)
+
+    @classmethod
+    def load(cls, path=RULES_DIR):
+        """
+        Returns the keyword rules saved in a JSON file.
+        path: the path to the file.
+        """
+        with open(path) as f:
+            saved = json.load(f)
+        classifier = cls()
+        classifier.classes = np.array(saved["classes"], dtype=str)
+        classifier.vocabulary = {word: i for i, word in enumerate(saved["words"])}
+        classifier.counts = np.array(saved["counts"], dtype=float).reshape(len(saved["words"]), len(saved["classes"]))
+        classifier.compile()
+        return classifier
 
 
 if __name__ == '__main__':
+    import time
+
     # Set of possible dialog acts, lists of dialog acts and utterances.
     act_set, dialog_act, utterance = extract_data(PATH)
-    
+
     # Split the data set into a train set and test set.
     train_act = dialog_act[:int(TRAIN_PERC * len(dialog_act))]
     train_utt = utterance[:int(TRAIN_PERC * len(utterance))]
-    train(act_set, train_act, train_utt)
-
     test_act = dialog_act[int(TRAIN_PERC * len(dialog_act)):]
     test_utt = utterance[int(TRAIN_PERC * len(utterance)):]
 
-    # The list of predicted dialog acts
-    predictions = []
-    ratio_list = []
-    for utt in test_utt:
-        predict_act = "NONE"
-        possible_acts = []
-        
-        # For every word in the utterance
-        for word in utt.split():
-            if word in rules:                                
-                possible_acts.extend(rules[word])
-                # The word is in the dictionary, so it can be classified. 
-                # End the forloop for this sentence.
-                break
-        
-        if len(possible_acts) > 0:                        
-            predict_act = max(possible_acts, key=lambda item: item[1])[0]
-                
-        predictions.append(predict_act)
+    rules = KeywordRuleClassifier().fit(train_act, train_utt)
+    rules.save(RULES_DIR)
 
     # To print the accuracy of the predictions on the test set.
-    print("accuracy ", sum([True for (ref_act, pred) in zip(test_act, predictions) if ref_act == pred]) / len(test_act))
-
+    start = time.perf_counter()
+    print("accuracy ", rules.evaluate(test_act, test_utt))
+    print(f"{len(test_utt) / (time.perf_counter() - start):.0f} utterances per second")
 
     print("Enter sentence:")
     try:
         while True:
-            utt = input() 
-            if utt == "quit": 
+            utt = input()
+            if utt == "quit":
                 quit()
-            else:                
-                print(f"[{predict(utt)}] {utt}")
+            else:
+                print(f"[{rules.predict(utt)}] {utt}")
     except KeyboardInterrupt:
         print("\nKeyboardInterrupt. Quitting")
- 
@@ -0,0 +1,257 @@
+# This file compares the dialog act classifiers (the baselines and every type
+# of trained classifier) on their accuracy and measured cost. Every classifier
+# is trained and validated on the same split of the data by sentence, so no
+# classifier is scored on a sentence it was trained on. Every labeled sentence
+# occurs once, weighted by the number of times it occurs in the data file. The
+# accuracy, macro F1 score, recall per dialog act, training time, peak memory
+# during training, latency of classifying a single utterance (as in a dialog
+# turn), throughput of classifying a batch of utterances and the size of the
+# saved model are reported. The results are written to a JSON file, and can be
+# compared with the results of an earlier run to catch regressions.
+#
+# Usage: python benchmark.py [classifier ...] [--output FILE] [--baseline FILE]
+
+from baseline1 import MajorityClassifier
+from baseline2 import KeywordRuleClassifier
+from classifiers import CLASSIFIER_TYPES, create_classifier, get_weighted_train_val_data, train, vectorize
+import argparse
+import json
+import numpy as np
+import pickle
+import sys
+import time
+import tracemalloc
+
+DATA_DIR = "data/dialog_acts.dat"
+RESULTS_DIR = "data/benchmark_results.json"
+# The split of the data the results are measured on. Results of another
+# split cannot be compared.
+SPLIT = "sentence, weighted"
+# The number of utterances used to measure the latency of a single utterance.
+LATENCY_SAMPLES = 300
+# The rule-based classifiers, next to the types of classifiers in
+# CLASSIFIER_TYPES.
+BASELINES = {
+    "baseline1": MajorityClassifier,
+    "baseline2": KeywordRuleClassifier,
+}
+# The maximal loss in accuracy and the maximal factor by which the latency
+# may grow (or the throughput shrink) compared to the baseline results.
+ACCURACY_TOLERANCE = 0.01
+COST_TOLERANCE = 1.5
+# The time (in seconds) the latency of a single utterance and the time per
+# utterance of a batch may grow in any case, so timing noise of very fast
+# classifiers is not reported.
+LATENCY_SLACK = 1e-4
+BATCH_SLACK = 1e-6
+
+
+def latency_percentiles(predict, sentences, percentiles=(50, 99)):
+    """
+    Returns the percentiles of the time (in seconds) it takes to predict the
+    dialog act of a single sentence.
+    predict: function that predicts the dialog acts of a list of sentences
+    sentences: the sentences to classify one by one
+    percentiles: the percentiles to return
+    """
+    latencies = []
+    for sentence in sentences:
+        start = time.perf_counter()
+        predict([sentence])
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, percentiles)
+
+
+def batch_throughput(predict, sentences):
+    """
+    Returns the number of sentences per second when the dialog acts of all
+    sentences are predicted at once.
+    predict: function that predicts the dialog acts of a list of sentences
+    sentences: the sentences to classify
+    """
+    start = time.perf_counter()
+    predict(sentences)
+    return len(sentences) / (time.perf_counter() - start)
+
+
+def serialized_size(model):
+    """
+    Returns the size (in bytes) of the pickled model.
+    model: the model
+    """
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def fit_model(type, sen_train, lab_train, weight_train=None):
+    """
+    Train a classifier of the given type on the raw sentences. Returns the
+    model and a function that predicts the dialog acts of a list of raw
+    sentences.
+    type: "baseline1", "baseline2" or a type in CLASSIFIER_TYPES
+    sen_train: training set of sentences
+    lab_train: the dialog acts of the training sentences
+    weight_train: the number of times every training sentence occurs, or
+    None if every sentence occurs once.
+    """
+    if type in BASELINES:
+        model = BASELINES[type]().fit(lab_train, sen_train, sample_weight=weight_train)
+        return model, model.predict_batch
+
+    from sklearn.pipeline import Pipeline
+
+    x_train, _, vectorizer = vectorize(list(sen_train), [], None)
+    classifier = train(create_classifier(type), x_train, lab_train, None, sample_weight=weight_train)
+    pipeline = Pipeline([("vectorizer", vectorizer), ("classifier", classifier)])
+    return pipeline, pipeline.predict
+
+
+def peak_memory(type, sen_train, lab_train, weight_train=None):
+    """
+    Returns the peak memory (in bytes) allocated while training a classifier
+    of the given type. The training is repeated for this, because tracing
+    the memory slows it down. Only memory allocated by Python and NumPy is
+    traced, not memory allocated in compiled code (such as the trees of a
+    random forest while they are grown).
+    """
+    tracemalloc.start()
+    try:
+        fit_model(type, sen_train, lab_train, weight_train)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def compare_models(types, data_dir=DATA_DIR):
+    """
+    Train every classifier on the same data and return a list with a
+    dictionary of the measured accuracy and cost per classifier. The
+    accuracy, macro F1 and recall are weighted by the number of times every
+    validation sentence occurs.
+    types: the classifiers to compare
+    data_dir: data file
+    """
+    from sklearn.metrics import f1_score, recall_score
+
+    sen_train, sen_val, lab_train, lab_val, weight_train, weight_val = get_weighted_train_val_data(
+        data_dir, test_size=.15, random_state=42)
+    labels = sorted(set(lab_train) | set(lab_val))
+
+    results = []
+    for type in types:
+        start = time.perf_counter()
+        model, predict = fit_model(type, sen_train, lab_train, weight_train)
+        train_time = time.perf_counter() - start
+
+        predictions = predict(sen_val)
+        recall = recall_score(lab_val, predictions, labels=labels, average=None, sample_weight=weight_val,
+                              zero_division=0)
+        p50, p95, p99 = latency_percentiles(predict, sen_val[:LATENCY_SAMPLES], (50, 95, 99))
+
+        results.append({"type": type,
+                        "accuracy": float(np.average(predictions == np.array(lab_val), weights=weight_val)),
+                        "macro_f1": float(f1_score(lab_val, predictions, labels=labels, average="macro",
+                                                   sample_weight=weight_val, zero_division=0)),
+                        "recall": {label: float(r) for label, r in zip(labels, recall)},
+                        "train_time": train_time,
+                        "peak_memory": peak_memory(type, sen_train, lab_train, weight_train),
+                        "latency_p50": float(p50),
+                        "latency_p95": float(p95),
+                        "latency_p99": float(p99),
+                        "throughput": batch_throughput(predict, sen_val),
+                        "model_size": serialized_size(model)})
+    return results
+
+
+def print_comparison(results):
+    """
+    Print the results of compare_models as a table.
+    results: the list of results per classifier
+    """
+    print(f"{'type':<14}{'accuracy':>10}{'macro F1':>10}{'train (s)':>11}{'peak (MB)':>11}{'p50 (ms)':>10}"
+          f"{'p95 (ms)':>10}{'p99 (ms)':>10}{'batch (utt/s)':>15}{'size (KB)':>11}")
+    for result in results:
+        print(f"{result['type']:<14}{result['accuracy']:>10.4f}{result['macro_f1']:>10.4f}"
+              f"{result['train_time']:>11.2f}{result['peak_memory'] / 2**20:>11.1f}"
+              f"{result['latency_p50'] * 1e3:>10.3f}{result['latency_p95'] * 1e3:>10.3f}"
+              f"{result['latency_p99'] * 1e3:>10.3f}{result['throughput']:>15.0f}"
+              f"{result['model_size'] / 1024:>11.0f}")
+
+    print("\nRecall per dialog act")
+    labels = sorted({label for result in results for label in result["recall"]})
+    print(f"{'type':<14}" + "".join(f"{label[:8]:>9}" for label in labels))
+    for result in results:
+        print(f"{result['type']:<14}" + "".join(f"{result['recall'].get(label, 0):>9.2f}" for label in labels))
+
+
+def save_results(results, results_dir=RESULTS_DIR, data_dir=DATA_DIR):
+    """
+    Write the results to a JSON file, with the time of the run and the split
+    of the data.
+    results: the list of results per classifier
+    results_dir: the path to the JSON file
+    data_dir: the data file the classifiers were trained on
+    """
+    with open(results_dir, "w") as file:
+        json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "data": data_dir, "split": SPLIT, "results": results},
+                  file, indent=2)
+
+
+def find_regressions(results, baseline, accuracy_tolerance=ACCURACY_TOLERANCE, cost_tolerance=COST_TOLERANCE):
+    """
+    Returns a list of messages about the classifiers that became less
+    accurate, slower or bigger than in the baseline results. Classifiers that
+    are not in the baseline are not checked.
+    results: the list of results per classifier
+    baseline: the list of results per classifier of an earlier run
+    accuracy_tolerance: the maximal loss in accuracy (and macro F1).
+    cost_tolerance: the maximal factor by which the latency and model size
+    may grow and the throughput may shrink (apart from LATENCY_SLACK and
+    BATCH_SLACK).
+    """
+    baseline = {result["type"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["type"])
+        if old is None:
+            continue
+        for metric in ["accuracy", "macro_f1"]:
+            if result[metric] < old[metric] - accuracy_tolerance:
+                regressions.append(f"{result['type']}: {metric} {result[metric]:.4f} < {old[metric]:.4f}")
+        for metric, slack in [("latency_p50", LATENCY_SLACK), ("latency_p99", LATENCY_SLACK), ("model_size", 0)]:
+            if result[metric] > old[metric] * cost_tolerance + slack:
+                regressions.append(f"{result['type']}: {metric} {result[metric]:.6g} > {old[metric]:.6g}")
+        if 1 / result["throughput"] > cost_tolerance / old["throughput"] + BATCH_SLACK:
+            regressions.append(f"{result['type']}: throughput {result['throughput']:.0f} "
+                               f"< {old['throughput']:.0f}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the dialog act classifiers.")
+    parser.add_argument("types", nargs="*", default=list(BASELINES) + list(CLASSIFIER_TYPES),
+                        help="classifiers to compare")
+    parser.add_argument("--output", default=RESULTS_DIR, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON file with earlier results to compare with")
+    parser.add_argument("--accuracy-tolerance", type=float, default=ACCURACY_TOLERANCE)
+    parser.add_argument("--cost-tolerance", type=float, default=COST_TOLERANCE)
+    args = parser.parse_args()
+
+    results = compare_models(args.types)
+    print_comparison(results)
+    save_results(results, args.output)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("split") != SPLIT:
+            print(f"The results in {args.baseline} were measured on another split of the data; "
+                  f"run the baseline again to compare")
+            sys.exit(1)
+        baseline = baseline["results"]
+        regressions = find_regressions(results, baseline, args.accuracy_tolerance, args.cost_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if len(regressions) > 0:
+            sys.exit(1)
+        print(f"OK: no regressions compared to {args.baseline}")
@@ -0,0 +1,134 @@
+# This file implements a cascade of the keyword rules of baseline2.py and the
+# dialog act classifier. The keyword rules cost a dictionary lookup, the
+# classifier (a random forest) is much more expensive. The dialog act is
+# taken from the rules when the keyword is clear enough (the margin of its
+# counts exceeds a threshold), and predicted by the classifier otherwise. The
+# threshold is tuned on the validation set, so that the cascade is about as
+# accurate as the classifier alone while skipping it as often as possible.
+# The cascade can be given to the DMS in place of the classifier.
+
+from baseline2 import KeywordRuleClassifier
+from classifiers import get_weighted_train_val_data
+import numpy as np
+
+DATA_DIR = "data/dialog_acts.dat"
+# The maximal loss in accuracy compared to the classifier alone.
+TOLERANCE = 0.005
+
+
+class CascadeClassifier:
+    """
+    Predicts the dialog act with the keyword rules of baseline2 if the margin
+    of the rule exceeds the threshold, and with the classifier otherwise.
+    """
+
+    def __init__(self, classifier, rules, threshold=1.0):
+        """
+        classifier: classifier that predicts the dialog acts of a list of
+        sentences.
+        rules: the trained KeywordRuleClassifier.
+        threshold: the margin (between 0 and 1) a rule must exceed to be
+        used. With the default, the classifier predicts every dialog act.
+        """
+        self.classifier = classifier
+        self.rules = rules
+        self.threshold = threshold
+        # The number of sentences classified by the rules and by the
+        # classifier.
+        self.rule_turns = 0
+        self.model_turns = 0
+
+    def predict(self, sentences):
+        """
+        Returns the dialog acts of the sentences. The sentences without a
+        clear keyword are classified together.
+        sentences: list of user inputs
+        """
+        dialog_acts, margins = self.rules.predict_batch(sentences, return_margin=True)
+        dialog_acts = dialog_acts.astype(object)
+        unclear = np.flatnonzero(margins <= self.threshold)
+
+        if len(unclear) > 0:
+            predictions = self.classifier.predict([sentences[i] for i in unclear])
+            for i, dialog_act in zip(unclear, predictions):
+                dialog_acts[i] = dialog_act
+        self.rule_turns += len(sentences) - len(unclear)
+        self.model_turns += len(unclear)
+
+        return dialog_acts.astype(str)
+
+
+def tune_threshold(classifier, rules, sentences, labels, sample_weight=None, tolerance=TOLERANCE):
+    """
+    Returns the threshold that lets the rules classify the largest fraction
+    of the sentences while the accuracy of the cascade stays within tolerance
+    of the accuracy of the classifier alone, together with the accuracy of
+    the classifier, the accuracy of the cascade and the fraction of sentences
+    classified by the rules.
+    classifier: classifier that predicts the dialog acts of a list of
+    sentences.
+    rules: the trained KeywordRuleClassifier.
+    sentences: the validation sentences
+    labels: the dialog acts of the validation sentences
+    sample_weight: the number of times every sentence occurs, or None if
+    every sentence occurs once.
+    tolerance: the maximal loss in accuracy compared to the classifier alone.
+    """
+    labels = np.array(labels)
+    weights = np.ones(len(labels)) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    weights = weights / weights.sum()
+
+    rule_acts, margins = rules.predict_batch(sentences, return_margin=True)
+    rule_correct = (rule_acts == labels) * weights
+    model_correct = (classifier.predict(sentences) == labels) * weights
+    model_accuracy = model_correct.sum()
+
+    # With one of the margins as threshold, the rules classify the sentences
+    # with a larger margin. Go through the margins from large to small, so
+    # that the rules classify more sentences at every step, and keep the last
+    # threshold that is accurate enough.
+    best = (1.0, model_accuracy, 0.0)
+    for threshold in np.unique(margins)[::-1]:
+        by_rules = margins > threshold
+        accuracy = rule_correct[by_rules].sum() + model_correct[~by_rules].sum()
+        if accuracy >= model_accuracy - tolerance:
+            best = (float(threshold), float(accuracy), float(weights[by_rules].sum()))
+    return best[0], float(model_accuracy), best[1], best[2]
+
+
+def build_cascade(classifier, data_dir=DATA_DIR, tolerance=TOLERANCE):
+    """
+    Train the keyword rules on the training set, tune the threshold on the
+    validation set (the split of classifiers.py) and return the cascade.
+    classifier: classifier that predicts the dialog acts of a list of
+    sentences, trained on the same training set.
+    data_dir: data file
+    tolerance: the maximal loss in accuracy compared to the classifier alone.
+    """
+    sen_train, sen_val, lab_train, lab_val, weight_train, weight_val = get_weighted_train_val_data(data_dir)
+    # The rules count every occurrence of a sentence.
+    rules = KeywordRuleClassifier().fit(lab_train, sen_train, sample_weight=weight_train)
+
+    threshold, model_accuracy, accuracy, skipped = tune_threshold(classifier, rules, sen_val, lab_val, weight_val,
+                                                                  tolerance)
+    print(f"Threshold {threshold:.3f}: accuracy {accuracy:.4f} (classifier alone {model_accuracy:.4f}), "
+          f"{skipped:.1%} of the turns classified by the rules")
+    return CascadeClassifier(classifier, rules, threshold)
+
+
+if __name__ == '__main__':
+    import time
+    from forest_predictor import load_classifier
+
+    classifier = load_classifier()
+    cascade = build_cascade(classifier)
+
+    with open(DATA_DIR) as file:
+        sentences = [line.split(" ", 1)[1].strip() for line in file][:3000]
+    for name, model in [("Classifier", classifier), ("Cascade", cascade)]:
+        start = time.perf_counter()
+        for sentence in sentences:
+            model.predict([sentence])
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / len(sentences) * 1e6:.0f} us per turn")
+    print(f"Turns classified by the rules: {cascade.rule_turns}, by the classifier: {cascade.model_turns}")
@@ -0,0 +1,148 @@
+# This file implements a dialog act classification service that is shared by
+# many concurrent dialogs. Instead of classifying every utterance on its own,
+# the service collects the utterances of all dialogs during a short time window
+# and classifies them together, which is much cheaper per utterance for a
+# random forest. The service can be given to the DMS (or system.classify) in
+# place of the classifier.
+
+from concurrent.futures import Future
+from joblib import load
+import numpy as np
+import queue
+import threading
+import time
+
+# The maximal number of utterances classified at once.
+MAX_BATCH_SIZE = 64
+# The maximal time (in seconds) an utterance waits for other utterances.
+MAX_LATENCY = 0.002
+
+
+class BatchingClassifier:
+    """
+    Classifies the utterances of many dialogs in batches. Utterances are
+    collected until the batch is full or the first utterance in the batch has
+    waited for max_latency seconds.
+    """
+
+    def __init__(self, classifier, max_batch_size=MAX_BATCH_SIZE, max_latency=MAX_LATENCY):
+        """
+        classifier: pipeline that predicts the dialog acts of raw sentences.
+        max_batch_size: the maximal number of utterances classified at once.
+        max_latency: the maximal time (in seconds) an utterance waits for
+        other utterances.
+        """
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        # The number of batches and utterances that have been classified.
+        self.batches = 0
+        self.utterances = 0
+
+        # Whether the service is closed. The lock makes sure no utterance is
+        # queued after the service is told to stop.
+        self.closed = False
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, sentence):
+        """
+        Returns a future of the dialog act of the sentence. In asyncio code,
+        the future can be awaited with asyncio.wrap_future. Raises a
+        RuntimeError if the service is closed.
+        sentence: the user input
+        """
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("the classification service is closed")
+            self.queue.put((sentence, future))
+        return future
+
+    def predict(self, sentences):
+        """
+        Returns the dialog acts of the sentences. Blocks until they are
+        classified.
+        sentences: list of user inputs
+        """
+        futures = [self.submit(sentence) for sentence in sentences]
+        return np.array([future.result() for future in futures])
+
+    def close(self):
+        """
+        Stop the service after the utterances that are waiting have been
+        classified. New utterances are refused from then on.
+        """
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.queue.put(None)
+        self.worker.join()
+
+    def run(self):
+        """
+        Collect and classify batches of utterances until the service is
+        closed. Runs in the worker thread.
+        """
+        closed = False
+        while not closed:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+
+            sentences = [sentence for (sentence, _) in batch]
+            try:
+                dialog_acts = self.classifier.predict(sentences)
+            except Exception as e:
+                for (_, future) in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), dialog_act in zip(batch, dialog_acts):
+                future.set_result(dialog_act)
+            self.batches += 1
+            self.utterances += len(batch)
+
+
+if __name__ == '__main__':
+    # Compare classifying the turns of many concurrent dialogs one by one with
+    # classifying them through the service.
+    N_DIALOGS = 64
+    N_TURNS = 20
+    classifier = load("data/pipeline.joblib")
+    with open("data/dialog_acts.dat") as file:
+        sentences = [line.split(" ", 1)[1].strip() for line in file][:N_DIALOGS * N_TURNS]
+
+    def dialog(classifier, turns, results):
+        for sentence in turns:
+            results.append(classifier.predict([sentence])[0])
+
+    for name, service in [("Direct", classifier), ("Batched", BatchingClassifier(classifier))]:
+        results = [[] for _ in range(N_DIALOGS)]
+        threads = [threading.Thread(target=dialog, args=(service, sentences[i::N_DIALOGS], results[i]))
+                   for i in range(N_DIALOGS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {len(sentences) / elapsed:.0f} turns/s")
+        if isinstance(service, BatchingClassifier):
+            print(f"Average batch size: {service.utterances / service.batches:.1f}")
+            service.close()
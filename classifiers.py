@@ -2,29 +2,37 @@
 # validated and its accuracy is being reported.
 # The possible classifiers to be learned are random forest or support vector
 # machine.
+# The scikit-learn modules that are only needed for training are imported in 
+# the functions that use them.
 
-from sklearn import svm
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics import accuracy_score, classification_report
 from joblib import dump
+from featurizer import UnknownWordVectorizer, vectorizeUnknown
+from itertools import islice
+from zlib import crc32
+import numpy as np
+import os
+import random
+import sys
 # import statistics
 
 
-def validate_and_report(classifier, x_val, y_val):
+def validate_and_report(classifier, x_val, y_val, sample_weight=None):
     """
     Validate the accuracy and report the accuracy of the classifier.
     classifier: The classifier being used.
     x_val: input values used for prediction
     y_val: labeled output values
+    sample_weight: the number of times every input occurs, or None if every
+    input occurs once.
     """
+    from sklearn.metrics import accuracy_score, classification_report
+
     val_predictions = classifier.predict(x_val)
 
     # Compare the predictions to the real labeled output values and calculate 
     # the accuracy.
-    accuracy = accuracy_score(y_val, val_predictions)
-    report = classification_report(y_val, val_predictions, zero_division=0)
+    accuracy = accuracy_score(y_val, val_predictions, sample_weight=sample_weight)
+    report = classification_report(y_val, val_predictions, sample_weight=sample_weight, zero_division=0)
 
     print(f"Validation Accuracy: {accuracy:.2f}")
     print("Classification Report:\n", report)
@@ -32,36 +40,136 @@ def validate_and_report(classifier, x_val, y_val):
     return accuracy, report
 
 
-def train(classifier, x_train, y_train, clfr_dir):
+def train(classifier, x_train, y_train, clfr_dir, sample_weight=None):
     """
     Train the model
     classifier: the classifier
     x_train: the input to predict on 
     y_train: the correctly labeled output
-    clfr_dir: the path to the classifier file.
+    clfr_dir: the path to the classifier file, or None to not save it.
+    sample_weight: the number of times every input occurs, or None if every
+    input occurs once.
     """
-    classifier.fit(x_train[:-1], y_train)
-    dump(classifier, clfr_dir) # Save the classifier
+    if sample_weight is None:
+        classifier.fit(x_train[:-1], y_train)
+    elif hasattr(classifier, "steps"):
+        # A pipeline passes the weights on to its last step by name.
+        classifier.fit(x_train[:-1], y_train, **{f"{classifier.steps[-1][0]}__sample_weight": sample_weight})
+    else:
+        classifier.fit(x_train[:-1], y_train, sample_weight=sample_weight)
+    if clfr_dir is not None:
+        dump(classifier, clfr_dir) # Save the classifier
 
     return classifier
 
 
-def create_classifier(type = "rf" , n_estimators = 100, random_state = 42):
+def random_forest(n_estimators=100, random_state=42, **params):
+    """
+    Create a random forest classifier.
+    n_estimators: amount of trees in random forest algorithm
+    random_state: random state to control randomness of the bootstrapping
+    params: other hyperparameters of the classifier
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, **params)
+
+
+def support_vector_machine(n_estimators=None, random_state=None, **params):
+    """
+    Create a support vector machine classifier.
+    params: hyperparameters of the classifier
+    """
+    from sklearn import svm
+    return svm.SVC(**params)
+
+
+def logistic_regression(n_estimators=None, random_state=42, tfidf=False, **params):
+    """
+    Create a logistic regression classifier.
+    random_state: random state of the solver
+    tfidf: weigh the word counts by their inverse document frequency
+    params: other hyperparameters of the classifier
+    """
+    from sklearn.linear_model import LogisticRegression
+    params.setdefault("max_iter", 1000)
+    return with_tfidf(LogisticRegression(random_state=random_state, **params), tfidf)
+
+
+def stochastic_gradient_descent(n_estimators=None, random_state=42, tfidf=False, **params):
+    """
+    Create a linear classifier (by default a linear support vector machine)
+    trained with stochastic gradient descent.
+    random_state: random state to control the shuffling of the data
+    tfidf: weigh the word counts by their inverse document frequency
+    params: other hyperparameters of the classifier
+    """
+    from sklearn.linear_model import SGDClassifier
+    return with_tfidf(SGDClassifier(random_state=random_state, **params), tfidf)
+
+
+def naive_bayes(n_estimators=None, random_state=None, **params):
+    """
+    Create a multinomial naive Bayes classifier.
+    params: hyperparameters of the classifier
+    """
+    from sklearn.naive_bayes import MultinomialNB
+    return MultinomialNB(**params)
+
+
+def with_tfidf(classifier, tfidf):
+    """
+    Returns the classifier, preceded by a TF-IDF transformation of the word 
+    counts if tfidf is true.
+    classifier: the classifier
+    tfidf: add the TF-IDF transformation or not
+    """
+    if not tfidf:
+        return classifier
+
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.pipeline import Pipeline
+    return Pipeline([("tfidf", TfidfTransformer()), ("classifier", classifier)])
+
+
+# The types of classifiers that can be created, with the function that 
+# creates them. New types can be added with register_classifier.
+CLASSIFIER_TYPES = {
+    "rf": random_forest,
+    "svm": support_vector_machine,
+    "logreg": logistic_regression,
+    "logreg_tfidf": lambda **params: logistic_regression(tfidf=True, **params),
+    "sgd": stochastic_gradient_descent,
+    "sgd_tfidf": lambda **params: stochastic_gradient_descent(tfidf=True, **params),
+    "nb": naive_bayes,
+}
+
+
+def register_classifier(type, factory):
+    """
+    Add a type of classifier that can be created with create_classifier.
+    type: the name of the type of classifier
+    factory: function that returns a new classifier. It gets the arguments
+    of create_classifier (n_estimators, random_state and other parameters).
+    """
+    CLASSIFIER_TYPES[type] = factory
+
+
+def create_classifier(type = "rf" , n_estimators = 100, random_state = 42, **params):
     """
-    Create a Random Forest classifier or support vector machine classifier.
+    Create a classifier of the given type, e.g. a random forest ("rf"), 
+    support vector machine ("svm"), logistic regression ("logreg"), linear 
+    model trained with stochastic gradient descent ("sgd") or naive Bayes 
+    ("nb"). See CLASSIFIER_TYPES for all types.
     type: type of classifier
     n_estimators: amount of trees in random forest algorithm
     random_state: random state to control randomness of the bootstrapping in 
     random forest algorithm
+    params: other hyperparameters of the classifier
     """
-    if type == "rf":
-        classifier = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state)
-    elif type == "svm":
-        classifier = svm.SVC()
-    else:
-        return f"First argument must be either 'rf' or 'svm', but was {type}."
+    if type not in CLASSIFIER_TYPES:
+        return f"First argument must be one of {', '.join(CLASSIFIER_TYPES)}, but was {type}."
 
-    return classifier
+    return CLASSIFIER_TYPES[type](n_estimators=n_estimators, random_state=random_state, **params)
 
 
 def vectorize(sen_train, sen_val, vect_dir):
@@ -69,19 +177,96 @@ def vectorize(sen_train, sen_val, vect_dir):
     Vectorize the data
     sen_train: training set of sentences
     sen_val: validation set of sentences
-    vect_dir: path to the vectorizer
+    vect_dir: path to the vectorizer, or None to not save it.
     """
     sen_train.append("UNKNOWN")  # this will add an element to the vectors which can handle unseen words
 
     # Vectorizing the sentences
-    vectorizer = CountVectorizer()
+    vectorizer = UnknownWordVectorizer()
     x_train = vectorizer.fit_transform(sen_train)
-    sen_val = [vectorizeUnknown(vectorizer, sentence) for sentence in sen_val] # use the "unknown" vector entry for out-of-vocab words
-    x_val = vectorizer.transform(sen_val) 
+    x_val = vectorizer.transform(sen_val) # use the "unknown" vector entry for out-of-vocab words
+
+    if vect_dir is not None:
+        dump(vectorizer, vect_dir)  # Save the vectorizer object and its parameter values
+
+    return x_train, x_val, vectorizer
+
+
+def save_pipeline(vectorizer, classifier, pipeline_dir):
+    """
+    Save the vectorizer and the classifier as one pipeline that classifies 
+    the dialog act of (a list of) raw sentences.
+    vectorizer: the fitted vectorizer
+    classifier: the trained classifier
+    pipeline_dir: the path to the pipeline file.
+    """
+    from sklearn.pipeline import Pipeline
+
+    pipeline = Pipeline([("vectorizer", vectorizer), ("classifier", classifier)])
+    dump(pipeline, pipeline_dir)
 
-    dump(vectorizer, vect_dir)  # Save the vectorizer object and its parameter values
+    return pipeline
 
-    return x_train, x_val
+
+def export_forest(vectorizer, classifier, forest_dir):
+    """
+    Flatten the vocabulary of the vectorizer and the trees of the random 
+    forest into NumPy arrays, so the dialog act can be predicted without 
+    scikit-learn (see forest_predictor.py). The nodes of all trees are stored 
+    in one array. Every leaf refers to a row with the class probabilities of 
+    the leaf; the pure leaves share the rows of a one-hot table.
+    vectorizer: the fitted vectorizer
+    classifier: the trained random forest
+    forest_dir: the path to the exported file (.npz).
+    """
+    if (vectorizer.analyzer != "word" or vectorizer.ngram_range != (1, 1) 
+            or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None
+            or vectorizer.stop_words is not None or vectorizer.strip_accents is not None):
+        raise ValueError("Only the default word counts of the vectorizer can be exported.")
+
+    n_classes = len(classifier.classes_)
+    vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    features, thresholds, children, value_rows, roots = [], [], [], [], []
+    # The class probabilities of the impure leaves, after the one-hot rows.
+    impure_values = []
+    offset = 0
+    for estimator in classifier.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count) + offset
+        leaf = tree.children_left == -1
+        # The probabilities as computed by the predict_proba of the tree.
+        value = tree.value[:, 0, :n_classes]
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0] = 1
+        value = value / normalizer
+        pure = leaf & (np.count_nonzero(value, axis=1) == 1)
+
+        value_row = np.full(tree.node_count, -1)
+        value_row[pure] = value[pure].argmax(axis=1)
+        impure = np.flatnonzero(leaf & ~pure)
+        value_row[impure] = n_classes + sum(len(v) for v in impure_values) + np.arange(len(impure))
+        impure_values.append(value[impure])
+
+        # A leaf is its own child, so evaluating it again does not move.
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        children.append(np.stack([np.where(leaf, nodes, tree.children_left + offset),
+                                  np.where(leaf, nodes, tree.children_right + offset)], axis=1))
+        value_rows.append(value_row)
+        roots.append(offset)
+        offset += tree.node_count
+
+    np.savez(forest_dir,
+             vocabulary=np.array(vocabulary),
+             token_pattern=np.array(vectorizer.token_pattern),
+             lowercase=np.array(vectorizer.lowercase),
+             classes=np.array(classifier.classes_).astype(str),
+             feature=np.concatenate(features).astype(np.int32),
+             threshold=np.concatenate(thresholds),
+             children=np.concatenate(children).astype(np.int32),
+             value_row=np.concatenate(value_rows).astype(np.int32),
+             values=np.concatenate([np.eye(n_classes)] + impure_values),
+             roots=np.array(roots, dtype=np.int32))
 
 
 def get_train_val_data(data_dir, remove_duplicates = False, test_size = .15, random_state = 42):
@@ -92,6 +277,8 @@ def get_train_val_data(data_dir, remove_duplicates = False, test_size = .15, ran
     test_size: fraction of the data being used for the test set.
     random_state: random state for random forest algorithm 
     """
+    from sklearn.model_selection import train_test_split
+
     # Read the contents of the file
     with open(data_dir) as file:
         lines = file.readlines()
@@ -112,38 +299,187 @@ def get_train_val_data(data_dir, remove_duplicates = False, test_size = .15, ran
 
     return sen_train, sen_val, lab_train, lab_val
 
-def vectorizeUnknown(vectorizer, sentence):
-    words = sentence.split(" ")
-    for i, word in enumerate(words):
-        if word not in vectorizer.get_feature_names_out():
-            words[i] = "UNKNOWN"
-    return " ".join(words)
+def get_weighted_train_val_data(data_dir, test_size = .15, random_state = 42):
+    """
+    Get the training and validation set with every labeled sentence only 
+    once, together with the number of times it occurs in the data file. The 
+    counts can be used as sample weights, which gives the same model as 
+    training on all duplicates at a fraction of the cost. The data is split 
+    by unique sentence, so a sentence is never in both sets.
+    Returns the sentences, labels and counts of the training and validation 
+    set.
+    data_dir: data file
+    test_size: fraction of the unique sentences being used for the validation
+    set.
+    random_state: random state for splitting the data
+    """
+    from sklearn.model_selection import train_test_split
+
+    # Count the identical labeled sentences, in the order of the file
+    counts = {}
+    with open(data_dir) as file:
+        for line in file:
+            words = line.split()
+            key = (words[0], " ".join(words[1:]))
+            counts[key] = counts.get(key, 0) + 1
+
+    # Split the unique sentences, so that a sentence with more than one label
+    # ends up in one set with all its labels
+    sentences = list(dict.fromkeys(sentence for _, sentence in counts))
+    _, val_sentences = train_test_split(sentences, test_size=test_size, random_state=random_state)
+    val_sentences = set(val_sentences)
+
+    sen_train, sen_val, lab_train, lab_val, weight_train, weight_val = [], [], [], [], [], []
+    for (label, sentence), count in counts.items():
+        if sentence in val_sentences:
+            sen_val.append(sentence)
+            lab_val.append(label)
+            weight_val.append(count)
+        else:
+            sen_train.append(sentence)
+            lab_train.append(label)
+            weight_train.append(count)
+
+    return (sen_train, sen_val, lab_train, lab_val, 
+            np.array(weight_train, dtype=float), np.array(weight_val, dtype=float))
+
+def stream_data(data_dir, chunk_size=10000):
+    """
+    Read the data file in chunks. Yields a tuple of the list of labels and the
+    list of sentences of every chunk.
+    data_dir: data file
+    chunk_size: the number of lines per chunk
+    """
+    with open(data_dir) as file:
+        while True:
+            lines = list(islice(file, chunk_size))
+            if len(lines) == 0:
+                return
+            labels = [line.split()[0] for line in lines]
+            sentences = [" ".join(line.split()[1:]) for line in lines]
+            yield labels, sentences
+
+
+def in_validation_set(label, sentence, test_size):
+    """
+    Returns whether the labeled sentence belongs to the validation set. The 
+    split depends on a hash of the line, so it is the same in every pass over
+    the data and identical lines end up in the same set.
+    label: the dialog act
+    sentence: the sentence
+    test_size: fraction of the data being used for the validation set.
+    """
+    return crc32(f"{label} {sentence}".encode()) % 10000 < test_size * 10000
+
+
+def train_streaming(data_dir, test_size = .15, chunk_size = 10000, n_features = 2**16, 
+                    epochs = 1, classes = None, random_state = 42):
+    """
+    Train a linear classifier on a data file of any size while keeping memory 
+    constant. The file is read in chunks, the sentences are featurized by 
+    hashing the words (so there is no vocabulary to fit, and unseen words need
+    no special treatment) and the classifier is updated with every chunk. 
+    Returns the pipeline of the vectorizer and classifier and the accuracy on
+    the validation set.
+    data_dir: data file
+    test_size: fraction of the data being used for the validation set.
+    chunk_size: the number of lines read at once
+    n_features: the number of features (hash buckets) of the vectorizer
+    epochs: the number of passes over the training data
+    classes: the possible dialog acts. By default an extra pass over the data
+    collects them.
+    random_state: random state for shuffling the chunks and the classifier
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import Pipeline
+
+    if classes is None:
+        classes = sorted({label for labels, _ in stream_data(data_dir, chunk_size) for label in labels})
+
+    vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False)
+    classifier = SGDClassifier(random_state=random_state)
+    shuffle = random.Random(random_state)
+
+    for _ in range(epochs):
+        for labels, sentences in stream_data(data_dir, chunk_size):
+            train_set = [(label, sentence) for label, sentence in zip(labels, sentences)
+                         if not in_validation_set(label, sentence, test_size)]
+            if len(train_set) == 0:
+                continue
+            # The file may be ordered, so shuffle every chunk.
+            shuffle.shuffle(train_set)
+            lab_train, sen_train = zip(*train_set)
+            classifier.partial_fit(vectorizer.transform(sen_train), lab_train, classes=classes)
+
+    # Validate on the lines of the validation set, chunk by chunk.
+    correct, total = 0, 0
+    for labels, sentences in stream_data(data_dir, chunk_size):
+        val_set = [(label, sentence) for label, sentence in zip(labels, sentences)
+                   if in_validation_set(label, sentence, test_size)]
+        if len(val_set) == 0:
+            continue
+        lab_val, sen_val = zip(*val_set)
+        correct += int((classifier.predict(vectorizer.transform(sen_val)) == np.array(lab_val)).sum())
+        total += len(val_set)
+    accuracy = correct / total if total > 0 else 0.0
+    print(f"Validation Accuracy: {accuracy:.2f} ({total} sentences)")
+
+    pipeline = Pipeline([("vectorizer", vectorizer), ("classifier", classifier)])
+    return pipeline, accuracy
+
 
 if __name__ == "__main__":
     # Setting adjustable parameters
     rm_duplicates = False
+    # Train on every labeled sentence once, weighted by how often it occurs
+    weighted = True
+    # Train out-of-core on the data file (python classifiers.py --streaming)
+    streaming = "--streaming" in sys.argv
     DATA_DIR = "data/dialog_acts.dat"
     CLASSIFIER_DIR = "data/classifier.joblib"
     VECTORIZER_DIR = "data/vectorizer.joblib"
+    PIPELINE_DIR = "data/pipeline.joblib"
+    FOREST_DIR = "data/forest.npz"
     mlAlgorithm = "rf"
 
-    # Collect training and validation data
-    sen_train, sen_val, lab_train, lab_val = get_train_val_data(DATA_DIR,
-                                                                remove_duplicates=rm_duplicates,
-                                                                test_size=.15,
-                                                                random_state=42)
-
-    # Vectorize the sentences
-    x_train, x_val = vectorize(sen_train, sen_val, VECTORIZER_DIR)
+    if streaming:
+        pipeline, accuracy = train_streaming(DATA_DIR, test_size=.15, random_state=42)
+        dump(pipeline, PIPELINE_DIR)
+        # The exported random forest would be used instead of this pipeline.
+        if os.path.exists(FOREST_DIR):
+            os.remove(FOREST_DIR)
+        sys.exit()
+
+    # Collect training and validation data and vectorize the sentences. They
+    # are cached in data/cache until the data file or settings change.
+    from corpus_cache import train_val_features
+    (sen_train, sen_val, lab_train, lab_val, weight_train, weight_val, 
+     x_train, x_val, vectorizer) = train_val_features(DATA_DIR, 
+                                                      weighted=weighted,
+                                                      remove_duplicates=rm_duplicates,
+                                                      test_size=.15,
+                                                      random_state=42)
+    dump(vectorizer, VECTORIZER_DIR)  # Save the vectorizer object and its parameter values
 
     # Create a classifier object
     model = create_classifier(mlAlgorithm, n_estimators=100, random_state=42)
 
     # Train the classifier
-    trained_model = train(model, x_train, lab_train, CLASSIFIER_DIR)
+    trained_model = train(model, x_train, lab_train, CLASSIFIER_DIR, sample_weight=weight_train)
 
     # Validate the classifier and report its accuracy
-    accuracy, report = validate_and_report(trained_model, x_val, lab_val)
+    accuracy, report = validate_and_report(trained_model, x_val, lab_val, sample_weight=weight_val)
+
+    # Save the vectorizer and classifier together for classifying raw sentences
+    save_pipeline(vectorizer, trained_model, PIPELINE_DIR)
+
+    # Export the random forest for predicting without scikit-learn. Remove an
+    # earlier exported forest otherwise, so it is not used instead.
+    if mlAlgorithm == "rf":
+        export_forest(vectorizer, trained_model, FOREST_DIR)
+    elif os.path.exists(FOREST_DIR):
+        os.remove(FOREST_DIR)
 
 
 
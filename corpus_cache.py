@@ -0,0 +1,225 @@
+# This file caches the parsed data file and the bag-of-words matrices of the
+# training and validation set on disk, so that repeated experiments do not
+# have to read, split and vectorize the data again. The cache is stored per
+# hash of the contents of the data file and the settings, so it is rebuilt
+# when one of them changes. The arrays are stored with the smallest integer
+# types that fit and are loaded memory-mapped.
+
+from joblib import load
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+
+DATA_DIR = "data/dialog_acts.dat"
+CACHE_DIR = "data/cache"
+# Change this when the format of the cache changes.
+CACHE_VERSION = 1
+
+
+def file_hash(data_dir):
+    """
+    Returns the SHA-256 hash of the contents of the file.
+    data_dir: data file
+    """
+    digest = hashlib.sha256()
+    with open(data_dir, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(data_dir, **settings):
+    """
+    Returns the name of the cache entry of the data file and the settings.
+    data_dir: data file
+    settings: the settings the cached data depends on.
+    """
+    settings = {"version": CACHE_VERSION, "data": file_hash(data_dir), **settings}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def save_strings(path, strings):
+    """
+    Save a list of strings as one array of UTF-8 bytes and an array of the
+    offsets of the strings in it.
+    """
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    np.save(path + ".offsets.npy", offsets.astype(np.min_scalar_type(offsets[-1])))
+    np.save(path + ".npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+
+def load_strings(path):
+    """
+    Returns the list of strings saved with save_strings.
+    """
+    offsets = np.load(path + ".offsets.npy").tolist()
+    text = np.load(path + ".npy", mmap_mode="r").tobytes()
+    return [text[start:end].decode() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def save_labels(path, labels):
+    """
+    Save a list of dialog acts as codes into the sorted list of dialog acts.
+    """
+    classes, codes = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    np.save(path + ".classes.npy", classes)
+    np.save(path + ".npy", codes.astype(np.min_scalar_type(max(len(classes) - 1, 0))))
+
+
+def load_labels(path):
+    """
+    Returns the array of dialog acts saved with save_labels.
+    """
+    return np.load(path + ".classes.npy")[np.load(path + ".npy", mmap_mode="r")]
+
+
+def save_matrix(path, matrix):
+    """
+    Save a sparse matrix of word counts in CSR format, with the smallest
+    integer types that fit the counts, the column indices and the offsets.
+    """
+    matrix = matrix.tocsr()
+    np.save(path + ".data.npy", matrix.data.astype(np.min_scalar_type(matrix.data.max(initial=0))))
+    np.save(path + ".indices.npy", matrix.indices.astype(np.min_scalar_type(max(matrix.shape[1] - 1, 0))))
+    np.save(path + ".indptr.npy", matrix.indptr.astype(np.min_scalar_type(matrix.indptr[-1])))
+    np.save(path + ".shape.npy", np.array(matrix.shape))
+
+
+def load_matrix(path):
+    """
+    Returns the sparse matrix saved with save_matrix. The counts stay
+    memory-mapped; SciPy converts the (small) index arrays to its own integer
+    type.
+    """
+    from scipy.sparse import csr_matrix
+
+    arrays = [np.load(path + f".{name}.npy", mmap_mode="r") for name in ["data", "indices", "indptr"]]
+    return csr_matrix(tuple(arrays), shape=tuple(np.load(path + ".shape.npy")))
+
+
+def cached(entry_dir, build):
+    """
+    Returns the path to the cache entry, after building it if it does not
+    exist. The entry is built in a temporary directory and then renamed, so
+    an unfinished entry is never used.
+    entry_dir: the path to the cache entry
+    build: function that writes the cache entry into the given directory.
+    """
+    if os.path.isdir(entry_dir):
+        return entry_dir
+
+    os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir))
+    try:
+        build(temp_dir)
+        os.rename(temp_dir, entry_dir)
+    except OSError:
+        # Another process built the same entry at the same time.
+        if not os.path.isdir(entry_dir):
+            raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return entry_dir
+
+
+def corpus(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """
+    Returns the array of dialog acts and the list of sentences in the data
+    file, from the cache if possible.
+    data_dir: data file
+    cache_dir: the directory of the cache
+    """
+    def build(path):
+        with open(data_dir) as file:
+            lines = file.readlines()
+        save_labels(os.path.join(path, "labels"), [line.split()[0] for line in lines])
+        save_strings(os.path.join(path, "sentences"), [" ".join(line.split()[1:]) for line in lines])
+
+    path = cached(os.path.join(cache_dir, "corpus-" + cache_key(data_dir)), build)
+    return load_labels(os.path.join(path, "labels")), load_strings(os.path.join(path, "sentences"))
+
+
+def train_val_features(data_dir=DATA_DIR, weighted=True, remove_duplicates=False, test_size=.15, random_state=42,
+                       cache_dir=CACHE_DIR):
+    """
+    Returns the training and validation set of classifiers.py together with
+    their bag-of-words matrices and the fitted vectorizer, from the cache if
+    possible: sen_train, sen_val, lab_train, lab_val, weight_train,
+    weight_val, x_train, x_val and vectorizer. The weights are None if the
+    data is not weighted. As with classifiers.vectorize, the training
+    sentences and matrix end with the "UNKNOWN" sentence.
+    data_dir: data file
+    weighted: use get_weighted_train_val_data (with counts) or
+    get_train_val_data.
+    remove_duplicates: boolean, remove duplicates or not (if not weighted)
+    test_size: fraction of the data being used for the validation set.
+    random_state: random state for splitting the data
+    cache_dir: the directory of the cache
+    """
+    from classifiers import get_train_val_data, get_weighted_train_val_data, vectorize
+    import sklearn
+
+    def build(path):
+        if weighted:
+            sen_train, sen_val, lab_train, lab_val, weight_train, weight_val = get_weighted_train_val_data(
+                data_dir, test_size=test_size, random_state=random_state)
+            # The weights are counts, stored as integers.
+            for name, weights in [("weight_train", weight_train), ("weight_val", weight_val)]:
+                np.save(os.path.join(path, name + ".npy"),
+                        weights.astype(np.min_scalar_type(int(weights.max(initial=0)))))
+        else:
+            sen_train, sen_val, lab_train, lab_val = get_train_val_data(
+                data_dir, remove_duplicates=remove_duplicates, test_size=test_size, random_state=random_state)
+        x_train, x_val, vectorizer = vectorize(sen_train, sen_val, os.path.join(path, "vectorizer.joblib"))
+        for name, sentences in [("sen_train", sen_train), ("sen_val", sen_val)]:
+            save_strings(os.path.join(path, name), sentences)
+        for name, labels in [("lab_train", lab_train), ("lab_val", lab_val)]:
+            save_labels(os.path.join(path, name), labels)
+        for name, matrix in [("x_train", x_train), ("x_val", x_val)]:
+            save_matrix(os.path.join(path, name), matrix)
+
+    # The saved vectorizer depends on the version of scikit-learn.
+    key = cache_key(data_dir, sklearn=sklearn.__version__, weighted=weighted, remove_duplicates=remove_duplicates and not weighted,
+                    test_size=test_size, random_state=random_state)
+    path = cached(os.path.join(cache_dir, "features-" + key), build)
+
+    weights = [None, None]
+    if weighted:
+        weights = [np.load(os.path.join(path, name + ".npy")).astype(float) for name in ["weight_train", "weight_val"]]
+    return (load_strings(os.path.join(path, "sen_train")),
+            load_strings(os.path.join(path, "sen_val")),
+            load_labels(os.path.join(path, "lab_train")),
+            load_labels(os.path.join(path, "lab_val")),
+            *weights,
+            load_matrix(os.path.join(path, "x_train")),
+            load_matrix(os.path.join(path, "x_val")),
+            load(os.path.join(path, "vectorizer.joblib")))
+
+
+if __name__ == '__main__':
+    import time
+    from classifiers import get_weighted_train_val_data, vectorize
+
+    start = time.perf_counter()
+    sen_train, sen_val, lab_train, lab_val, weight_train, weight_val = get_weighted_train_val_data(DATA_DIR)
+    x_train, x_val, vectorizer = vectorize(sen_train, sen_val, None)
+    print(f"Without the cache: {time.perf_counter() - start:.3f}s")
+
+    for run in ["First run (building the cache)", "Second run (from the cache)"]:
+        start = time.perf_counter()
+        cached_data = train_val_features(DATA_DIR)
+        print(f"{run}: {time.perf_counter() - start:.3f}s")
+
+    # The cached data equals the data without the cache.
+    _, _, _, _, _, _, cached_train, cached_val, _ = cached_data
+    assert cached_data[0] == sen_train and cached_data[1] == sen_val
+    assert list(cached_data[2]) == lab_train and list(cached_data[3]) == lab_val
+    assert (cached_data[4] == weight_train).all() and (cached_data[5] == weight_val).all()
+    assert (cached_train != x_train).nnz == 0 and (cached_val != x_val).nnz == 0
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(CACHE_DIR) for name in names)
+    print(f"The cached data equals the data without the cache ({size / 1024:.0f} KB in {CACHE_DIR})")
@@ -0,0 +1,379 @@
+# This file implements a server that hosts many concurrent dialogs with the
+# restaurant recommendation system. Every dialog (session) has its own DMS,
+# but the classifier and the restaurant database are loaded once and shared.
+# The dialogs are served with asyncio over a line-based TCP protocol: a client
+# sends "session id<TAB>utterance" lines and the server answers every line with
+# a "session id<TAB>system utterance" line. Newlines, tabs and backslashes in
+# the text are escaped as \n, \t and \\. An empty utterance starts the session
+# (or repeats the last system utterance), "quit" ends it. The delay of the
+# system output is awaited, so it does not block the other dialogs.
+# With a session store (session_store.py), the dialogs are saved after every
+# turn, so a session can be continued by another server process. Before a
+# turn, a server checks in the store whether another server continued the
+# dialog, and then resumes it from the store instead of from memory.
+#
+# Usage: python dialog_server.py                 (one dialog on stdin/stdout)
+#        python dialog_server.py --port 8765     (TCP server)
+#        python dialog_server.py --port 8765 --store sqlite:data/sessions.db
+#                                                (TCP server sharing sessions)
+#        python dialog_server.py --load-test 2000 (load test on a local server)
+
+from contextlib import redirect_stdout
+from DMS import DMS
+from session_store import dumps, loads, open_store, saved_turn
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Sessions without a message for this many seconds are removed.
+SESSION_TIMEOUT = 30 * 60
+# The scripted dialogs of the load test.
+CONVERSATIONS = [["i want cheap chinese food in the north", "no", "what is the phone number", "thank you goodbye"],
+                 ["hello", "i want expensive food", "italian", "south", "romantic", "more", "more", "yes", "bye"],
+                 ["asian oriental food in the centre", "touristic", "address", "start over", "moderate spanish east",
+                  "assigned seats", "another", "bye"],
+                 ["any part of town", "any", "any", "no", "how about something else", "thanks"]]
+
+
+def escape(text):
+    """
+    Returns the text with backslashes, newlines and tabs escaped, so it fits
+    on one line of the protocol.
+    """
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace("\t", "\\t")
+
+
+def unescape(text):
+    """
+    Returns the text with the escapes of escape() undone.
+    """
+    result = []
+    chars = iter(text)
+    for char in chars:
+        if char == "\\":
+            char = {"n": "\n", "t": "\t"}.get(next(chars, ""), "\\")
+        result.append(char)
+    return "".join(result)
+
+
+class Session:
+    """
+    A dialog with one user: the DMS, the number of the turn that was last
+    saved in the store and the time of the last message.
+    """
+
+    def __init__(self, dms, turn=0):
+        self.dms = dms
+        self.turn = turn
+        self.last_active = time.monotonic()
+        # The messages of a session are handled one after the other.
+        self.lock = asyncio.Lock()
+
+
+class DialogServer:
+    """
+    Hosts the dialogs of many users, keyed by session id, with one shared
+    classifier and restaurant database.
+    """
+
+    def __init__(self, classifier, db, delay=0, formal=False, upper=False, session_timeout=SESSION_TIMEOUT,
+                 store=None):
+        """
+        classifier: classifier that predicts the dialog acts of raw sentences.
+        db: the shared RestaurantDB.
+        delay: the time (in seconds) to wait before every system utterance.
+        formal: use the formal system utterances or not.
+        upper: return the system utterances in uppercase or not.
+        session_timeout: the time (in seconds) after which a session without
+        messages is removed.
+        store: the SessionStore the dialogs are saved in after every turn, or
+        None to keep them only in memory.
+        """
+        self.classifier = classifier
+        self.db = db
+        self.delay = delay
+        self.formal = formal
+        self.upper = upper
+        self.session_timeout = session_timeout
+        self.store = store
+        self.sessions = {}
+        # The number of sessions started, sessions resumed from the store and
+        # user turns handled.
+        self.started = 0
+        self.resumed = 0
+        self.turns = 0
+
+    def new_session(self):
+        """
+        Returns a new session with its own DMS.
+        """
+        dms = DMS(self.classifier, self.db)
+        if self.formal:
+            dms.formalOn = 1
+            dms.update_utterance()
+        self.started += 1
+        return Session(dms)
+
+    def load_session(self, session_id):
+        """
+        Returns the DMS and the turn of the session saved in the store, or
+        None. A saved dialog that cannot be resumed (corrupt, or of another
+        version or restaurant database) is removed from the store.
+        session_id: the id of the session
+        """
+        dialog = self.store.get(session_id)
+        if dialog is None:
+            return None
+        try:
+            return loads(dialog, self.classifier, self.db), saved_turn(dialog)
+        except ValueError:
+            self.store.delete(session_id)
+            return None
+
+    def resume_session(self, session_id):
+        """
+        Returns the session saved in the store, or None.
+        session_id: the id of the session
+        """
+        if self.store is None:
+            return None
+        saved = self.load_session(session_id)
+        if saved is None:
+            return None
+        self.resumed += 1
+        return Session(*saved)
+
+    def refresh_session(self, session_id, session):
+        """
+        Continue the session from the store if another server handled its
+        last turns, or start it again if another server ended it.
+        session_id: the id of the session
+        session: the Session in memory
+        """
+        dialog = self.store.get(session_id)
+        try:
+            turn = None if dialog is None else saved_turn(dialog)
+        except ValueError:
+            turn = None
+        if turn == session.turn:
+            return
+        saved = None if dialog is None else self.load_session(session_id)
+        if saved is None:
+            session.dms, session.turn = self.new_session().dms, 0
+        else:
+            session.dms, session.turn = saved
+            self.resumed += 1
+
+    async def handle(self, session_id, utterance):
+        """
+        Returns the system utterance in answer to the utterance of the user in
+        the session. The session is started by its first message and ended
+        when the dialog ends or the user says "quit".
+        session_id: the id of the session
+        utterance: the user input
+        """
+        session = self.sessions.get(session_id)
+        stored = session is not None and self.store is not None
+        if session is None:
+            session = self.resume_session(session_id) or self.new_session()
+            self.sessions[session_id] = session
+
+        async with session.lock:
+            if stored:
+                self.refresh_session(session_id, session)
+            session.last_active = time.monotonic()
+            dms = session.dms
+            if utterance == "quit":
+                self.end_session(session_id)
+                return ""
+            if utterance != "":
+                dms.transition(utterance)
+                self.turns += 1
+            if dms.end_dialog:
+                self.end_session(session_id)
+            elif self.store is not None:
+                session.turn += 1
+                self.store.put(session_id, dumps(dms, session.turn))
+
+            # System delay feature, without blocking the other dialogs
+            if self.delay > 0:
+                await asyncio.sleep(self.delay)
+            # Return uppercase output feature
+            return dms.system_utterance.upper() if self.upper else dms.system_utterance
+
+    def end_session(self, session_id):
+        """
+        Remove the session, also from the store.
+        session_id: the id of the session
+        """
+        self.sessions.pop(session_id, None)
+        if self.store is not None:
+            self.store.delete(session_id)
+
+    def remove_idle_sessions(self):
+        """
+        Remove the sessions without messages for session_timeout seconds from
+        memory. Sessions in the store can still be resumed.
+        """
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_active > self.session_timeout and not session.lock.locked():
+                del self.sessions[session_id]
+
+    async def remove_idle_sessions_forever(self):
+        """
+        Remove idle sessions every minute.
+        """
+        while True:
+            await asyncio.sleep(60)
+            self.remove_idle_sessions()
+
+    async def serve_connection(self, reader, writer):
+        """
+        Answer the lines of a TCP connection. The lines are handled
+        concurrently, so a client can run many sessions over one connection;
+        the answers are sent when they are ready.
+        """
+        tasks = set()
+
+        async def answer(line):
+            session_id, _, utterance = line.rstrip("\r\n").partition("\t")
+            reply = await self.handle(session_id, unescape(utterance))
+            writer.write(f"{session_id}\t{escape(reply)}\n".encode())
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(answer(line.decode()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve_tcp(self, host=HOST, port=PORT):
+        """
+        Serve the dialogs over TCP until the server is stopped.
+        host: the address to listen on
+        port: the port to listen on
+        """
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        cleaner = asyncio.create_task(self.remove_idle_sessions_forever())
+        print(f"Serving dialogs on {host}:{server.sockets[0].getsockname()[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            cleaner.cancel()
+
+    async def serve_stdin(self):
+        """
+        Hold one dialog with the user on stdin and stdout, like program.py.
+        """
+        loop = asyncio.get_running_loop()
+        print(await self.handle("stdin", ""))
+        while "stdin" in self.sessions:
+            user_input = await loop.run_in_executor(None, sys.stdin.readline)
+            if user_input == "":
+                break
+            reply = await self.handle("stdin", user_input.rstrip("\n"))
+            if reply != "":
+                print(reply)
+
+
+async def load_test(server, n_sessions, connections=50, conversations=None):
+    """
+    Run n_sessions scripted dialogs against a TCP server on a free local port
+    and return the number of sessions and turns per second.
+    server: the DialogServer
+    n_sessions: the number of dialogs
+    connections: the number of TCP connections the dialogs are spread over
+    conversations: list of lists of user utterances; the dialogs take turns
+    in using them.
+    """
+    if conversations is None:
+        conversations = CONVERSATIONS
+
+    tcp = await asyncio.start_server(server.serve_connection, HOST, 0)
+    port = tcp.sockets[0].getsockname()[1]
+
+    async def client(session_ids):
+        reader, writer = await asyncio.open_connection(HOST, port)
+        waiting = {}
+
+        async def read_replies():
+            while line := await reader.readline():
+                session_id, _, reply = line.decode().rstrip("\n").partition("\t")
+                waiting.pop(session_id).set_result(unescape(reply))
+
+        async def dialog(session_id, conversation):
+            for utterance in [""] + conversation:
+                waiting[session_id] = asyncio.get_running_loop().create_future()
+                writer.write(f"{session_id}\t{escape(utterance)}\n".encode())
+                await waiting[session_id]
+                if session_id not in server.sessions:
+                    break
+
+        replies = asyncio.create_task(read_replies())
+        await asyncio.gather(*(dialog(session_id, conversations[i % len(conversations)])
+                               for i, session_id in enumerate(session_ids)))
+        writer.close()
+        await replies
+
+    start_turns = server.turns
+    start = time.perf_counter()
+    session_ids = [f"session{i}" for i in range(n_sessions)]
+    await asyncio.gather(*(client(session_ids[i::connections]) for i in range(connections)))
+    elapsed = time.perf_counter() - start
+    tcp.close()
+    await tcp.wait_closed()
+    return n_sessions / elapsed, (server.turns - start_turns) / elapsed
+
+
+if __name__ == '__main__':
+    from forest_predictor import load_classifier
+    from prediction_cache import CachedClassifier
+    from restaurant_db import RestaurantDB
+
+    parser = argparse.ArgumentParser(description="Serve dialogs with the restaurant recommendation system.")
+    parser.add_argument("--port", type=int, default=None, help="serve over TCP on this port")
+    parser.add_argument("--host", default=HOST, help="the address to listen on")
+    parser.add_argument("--load-test", type=int, default=None, metavar="SESSIONS",
+                        help="run this many scripted dialogs against a local server")
+    parser.add_argument("--delay", type=float, default=0, help="delay (in seconds) of the system output")
+    parser.add_argument("--formal", action="store_true", help="use formal system utterances")
+    parser.add_argument("--upper", action="store_true", help="return the system utterances in uppercase")
+    parser.add_argument("--store", default=None, metavar="STORE",
+                        help="save the dialogs in this store: memory, sqlite:PATH or file:DIRECTORY")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="write the dialogs to the store in batches (only when one server uses the store)")
+    args = parser.parse_args()
+
+    # One classifier and one database for all dialogs.
+    classifier = CachedClassifier(load_classifier(), loader=load_classifier)
+    db = RestaurantDB.from_csv()
+    store = None if args.store is None else open_store(args.store, args.write_behind)
+    server = DialogServer(classifier, db, delay=args.delay, formal=args.formal, upper=args.upper, store=store)
+
+    try:
+        if args.load_test is not None:
+            # The preference extractor prints when it does not recognize a preference.
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                sessions_per_second, turns_per_second = asyncio.run(load_test(server, args.load_test))
+            print(f"{args.load_test} sessions: {sessions_per_second:.0f} sessions/s, {turns_per_second:.0f} turns/s "
+                  f"(classifier cache hits {classifier.hits}, misses {classifier.misses})")
+        elif args.port is not None:
+            asyncio.run(server.serve_tcp(args.host, args.port))
+        else:
+            asyncio.run(server.serve_stdin())
+    finally:
+        # Write the dialogs that are not saved yet.
+        if store is not None:
+            store.close()
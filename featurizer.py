@@ -0,0 +1,35 @@
+# This file implements the bag-of-words representation of user utterances that
+# is used by the dialog act classifier. Words that were not seen during
+# training are mapped onto the "UNKNOWN" word.
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+def vectorizeUnknown(vectorizer, sentence):
+    """
+    Replace the words that are not in the vocabulary of the vectorizer by
+    "UNKNOWN".
+    vectorizer: the fitted vectorizer
+    sentence: the sentence
+    """
+    vocabulary = vectorizer.vocabulary_
+    words = sentence.split(" ")
+    for i, word in enumerate(words):
+        if word not in vocabulary:
+            words[i] = "UNKNOWN"
+    return " ".join(words)
+
+
+class UnknownWordVectorizer(CountVectorizer):
+    """
+    CountVectorizer that maps the words that were not seen during training on
+    the "UNKNOWN" word before counting the words. The training sentences
+    should contain the word "UNKNOWN" once.
+    """
+
+    def transform(self, raw_documents):
+        """
+        Returns the bag-of-words matrix of the sentences.
+        raw_documents: list of sentences
+        """
+        return super().transform([vectorizeUnknown(self, sentence) for sentence in raw_documents])
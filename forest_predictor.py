@@ -0,0 +1,141 @@
+# This file predicts the dialog act of user utterances with a random forest
+# that was exported by export_forest in classifiers.py. Only NumPy is needed,
+# so the chatbot can classify utterances without importing scikit-learn. All
+# trees are evaluated at once: in every step each unfinished (utterance, tree)
+# pair moves one node down its tree.
+#
+# Running this file checks that the predictions are the same as those of the
+# scikit-learn pipeline on data/dialog_acts.dat and compares the latency.
+
+import numpy as np
+import os
+import re
+import time
+
+FOREST_DIR = "data/forest.npz"
+PIPELINE_DIR = "data/pipeline.joblib"
+
+
+class ForestPredictor:
+    """
+    Predicts the dialog act of raw sentences with an exported random forest.
+    """
+
+    def __init__(self, forest_dir=FOREST_DIR):
+        """
+        forest_dir: the path to the exported forest (.npz).
+        """
+        with np.load(forest_dir) as forest:
+            self.vocabulary = {word: i for i, word in enumerate(forest["vocabulary"].tolist())}
+            self.token_pattern = re.compile(str(forest["token_pattern"]))
+            self.lowercase = bool(forest["lowercase"])
+            self.classes_ = forest["classes"]
+            self.feature = forest["feature"]
+            self.threshold = forest["threshold"]
+            self.children = forest["children"]
+            self.value_row = forest["value_row"]
+            self.values = forest["values"]
+            self.roots = forest["roots"]
+
+    def transform(self, sentences):
+        """
+        Returns the bag-of-words matrix of the sentences. Words that are not 
+        in the vocabulary are counted as "UNKNOWN", like vectorizeUnknown.
+        sentences: list of sentences
+        """
+        x = np.zeros((len(sentences), len(self.vocabulary)), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            words = [word if word in self.vocabulary else "UNKNOWN" for word in sentence.split(" ")]
+            sentence = " ".join(words)
+            if self.lowercase:
+                sentence = sentence.lower()
+            for word in self.token_pattern.findall(sentence):
+                if word in self.vocabulary:
+                    x[i, self.vocabulary[word]] += 1
+        return x
+
+    def apply(self, x):
+        """
+        Returns the index of the leaf reached in every tree for every row of 
+        the bag-of-words matrix, as a (rows, trees) array.
+        x: the bag-of-words matrix
+        """
+        n_trees = len(self.roots)
+        node = np.tile(self.roots, len(x))
+        # Position of the first feature of the row of every (row, tree) pair.
+        row_start = np.repeat(np.arange(len(x)) * x.shape[1], n_trees)
+        x = x.ravel()
+
+        # Only the pairs that have not reached a leaf are evaluated.
+        active = np.arange(len(node))
+        while len(active) > 0:
+            current = node[active]
+            go_right = x[row_start[active] + self.feature[current]] > self.threshold[current]
+            next_node = self.children[current, go_right.view(np.int8)]
+            node[active] = next_node
+            active = active[next_node != current]
+
+        return node.reshape(-1, n_trees)
+
+    def predict_proba(self, sentences):
+        """
+        Returns the class probabilities of the sentences: the average of the
+        probabilities of all trees.
+        sentences: list of sentences
+        """
+        rows = self.value_row[self.apply(self.transform(sentences))]
+        proba = np.zeros((len(sentences), self.values.shape[1]))
+        # Add the trees one by one, in the same order as scikit-learn.
+        for tree in range(rows.shape[1]):
+            proba += self.values[rows[:, tree]]
+        proba /= rows.shape[1]
+        return proba
+
+    def predict(self, sentences):
+        """
+        Returns the dialog acts of the sentences.
+        sentences: list of sentences
+        """
+        return self.classes_[self.predict_proba(sentences).argmax(axis=1)]
+
+
+def load_classifier(forest_dir=FOREST_DIR, pipeline_dir=PIPELINE_DIR):
+    """
+    Returns the classifier that predicts the dialog act of raw sentences: the
+    exported random forest if it exists, otherwise the scikit-learn pipeline.
+    forest_dir: the path to the exported forest (.npz).
+    pipeline_dir: the path to the pipeline of the vectorizer and classifier.
+    """
+    if os.path.exists(forest_dir):
+        return ForestPredictor(forest_dir)
+
+    from joblib import load
+    return load(pipeline_dir)
+
+
+if __name__ == '__main__':
+    from joblib import load
+
+    pipeline = load("data/pipeline.joblib")
+    predictor = ForestPredictor(FOREST_DIR)
+    with open("data/dialog_acts.dat") as file:
+        sentences = [line.split(" ", 1)[1].strip() for line in file]
+
+    # Parity with the scikit-learn pipeline.
+    expected = pipeline.predict(sentences)
+    predicted = predictor.predict(sentences)
+    mismatches = int((expected != predicted).sum())
+    print(f"Predictions that differ from scikit-learn: {mismatches} of {len(sentences)}")
+
+    # Latency of classifying a single utterance, as in a dialog turn.
+    for name, model in [("scikit-learn", pipeline), ("NumPy", predictor)]:
+        latencies = []
+        for sentence in sentences[:500]:
+            start = time.perf_counter()
+            model.predict([sentence])
+            latencies.append(time.perf_counter() - start)
+        print(f"{name}: p50 {np.percentile(latencies, 50) * 1e3:.2f} ms, "
+              f"p99 {np.percentile(latencies, 99) * 1e3:.2f} ms per utterance")
+
+    if mismatches > 0:
+        raise SystemExit(1)
@@ -0,0 +1,208 @@
+# This file implements a cache in front of the dialog act classifier. Most
+# user turns are short phrases that occur again and again ("yes", "thank you
+# goodbye", "any part of town"), so their dialog act does not have to be
+# predicted every time. The cache is seeded with the most common dialog act of
+# every sentence in the data file and remembers the most recent predictions of
+# the classifier. When the model or data file changes on disk, the cache is
+# cleared (and the classifier reloaded).
+
+from collections import OrderedDict
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+DATA_DIR = "data/dialog_acts.dat"
+FOREST_DIR = "data/forest.npz"
+PIPELINE_DIR = "data/pipeline.joblib"
+# The maximal number of recent predictions that are remembered.
+MAX_SIZE = 10000
+# The minimal time (in seconds) between two checks for changed files.
+CHECK_INTERVAL = 1.0
+
+
+def normalize(sentence):
+    """
+    Returns the sentence in lower case with single spaces between the words,
+    the form of the sentences in the data file.
+    sentence: the sentence
+    """
+    return " ".join(sentence.lower().split())
+
+
+def majority_labels(data_dir=DATA_DIR):
+    """
+    Returns a dictionary with the most common dialog act of every normalized
+    sentence in the data file. Ties are broken by the dialog act that occurs
+    first.
+    data_dir: data file
+    """
+    counts = {}
+    with open(data_dir) as file:
+        for line in file:
+            words = line.split()
+            if len(words) == 0:
+                continue
+            label_counts = counts.setdefault(normalize(" ".join(words[1:])), {})
+            label_counts[words[0]] = label_counts.get(words[0], 0) + 1
+    return {sentence: max(label_counts, key=label_counts.get) for sentence, label_counts in counts.items()}
+
+
+class CachedClassifier:
+    """
+    Predicts the dialog act of a sentence from the cache if possible, and with
+    the classifier otherwise. Sentences are normalized before they are looked
+    up and classified.
+    """
+
+    def __init__(self, classifier, data_dir=DATA_DIR, model_dirs=(FOREST_DIR, PIPELINE_DIR), loader=None,
+                 max_size=MAX_SIZE, seed=True):
+        """
+        classifier: classifier that predicts the dialog acts of a list of
+        sentences.
+        data_dir: the data file to seed the cache with.
+        model_dirs: the files of the model. The cache is cleared when one of
+        them changes.
+        loader: function that returns the classifier, used to reload it when
+        the model changes, or None to keep the classifier.
+        max_size: the maximal number of recent predictions that are
+        remembered.
+        seed: seed the cache with the dialog acts in the data file or not.
+        """
+        self.classifier = classifier
+        self.data_dir = data_dir
+        self.model_dirs = model_dirs
+        self.loader = loader
+        self.max_size = max_size
+        self.seed = seed
+        # The number of sentences found in the cache and predicted by the
+        # classifier.
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        # The number of times the cache was cleared, so that a prediction of
+        # a classifier that was replaced in the meantime is not remembered.
+        self.generation = 0
+        self.recent = OrderedDict()
+        self.seeded = majority_labels(data_dir) if seed else {}
+        self.signature = self.file_signature()
+        self.checked = time.monotonic()
+
+    def file_signature(self):
+        """
+        Returns the modification time and size of the model and data files,
+        which change when one of the files is replaced.
+        """
+        signature = []
+        for path in (self.data_dir, *self.model_dirs):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def check_files(self):
+        """
+        Clear the cache (and reload the classifier) if the model or data files
+        have changed since the last check. The files are checked at most once
+        every CHECK_INTERVAL seconds. The classifier and seeded dialog acts are
+        loaded first, and replaced together with clearing the cache, so that
+        no prediction uses a new classifier with the old cache or the reverse.
+        """
+        now = time.monotonic()
+        if now - self.checked < CHECK_INTERVAL:
+            return
+        self.checked = now
+        signature = self.file_signature()
+        if signature == self.signature:
+            return
+
+        classifier = self.loader() if self.loader is not None else None
+        seeded = majority_labels(self.data_dir) if self.seed else {}
+        with self.lock:
+            if classifier is not None:
+                self.classifier = classifier
+            self.recent.clear()
+            self.seeded = seeded
+            self.signature = signature
+            self.generation += 1
+
+    def predict(self, sentences):
+        """
+        Returns the dialog acts of the sentences. The sentences that are not
+        in the cache are classified together.
+        sentences: list of user inputs
+        """
+        self.check_files()
+        sentences = [normalize(sentence) for sentence in sentences]
+        dialog_acts = [None] * len(sentences)
+        missed = {}
+        with self.lock:
+            classifier = self.classifier
+            generation = self.generation
+            for i, sentence in enumerate(sentences):
+                if sentence in self.seeded:
+                    dialog_acts[i] = self.seeded[sentence]
+                elif sentence in self.recent:
+                    self.recent.move_to_end(sentence)
+                    dialog_acts[i] = self.recent[sentence]
+                else:
+                    missed.setdefault(sentence, []).append(i)
+            self.hits += len(sentences) - sum(len(indices) for indices in missed.values())
+            self.misses += sum(len(indices) for indices in missed.values())
+
+        if len(missed) > 0:
+            predictions = classifier.predict(list(missed))
+            with self.lock:
+                remember = generation == self.generation
+                for (sentence, indices), dialog_act in zip(missed.items(), predictions):
+                    for i in indices:
+                        dialog_acts[i] = dialog_act
+                    if remember:
+                        self.recent[sentence] = dialog_act
+                        self.recent.move_to_end(sentence)
+                while len(self.recent) > self.max_size:
+                    self.recent.popitem(last=False)
+
+        return np.array(dialog_acts)
+
+
+if __name__ == '__main__':
+    # Replay the sentences of the data file as user turns, with and without
+    # the cache.
+    from forest_predictor import load_classifier
+
+    classifier = load_classifier()
+    cached = CachedClassifier(classifier, loader=load_classifier)
+    with open(DATA_DIR) as file:
+        sentences = [line.split(" ", 1)[1].strip() for line in file][:5000]
+
+    for name, model in [("Classifier", classifier), ("Cached", cached)]:
+        start = time.perf_counter()
+        for sentence in sentences:
+            model.predict([sentence])
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / len(sentences) * 1e6:.0f} us per turn")
+    print(f"Hits: {cached.hits}, misses: {cached.misses}")
+
+    # Unseen sentences are remembered after their first prediction.
+    cached.hits = cached.misses = 0
+    for sentence in ["i want a cheap restaurant serving klingon food"] * 3:
+        cached.predict([sentence])
+    print(f"Unseen sentence three times: hits {cached.hits}, misses {cached.misses}")
+
+    # Touching the model file clears the cache. A copy of the model is
+    # touched, so the modification time of the real model is kept.
+    if os.path.exists(FOREST_DIR):
+        with tempfile.TemporaryDirectory() as directory:
+            model_copy = shutil.copy2(FOREST_DIR, directory)
+            cached = CachedClassifier(classifier, model_dirs=(model_copy,), loader=load_classifier)
+            cached.predict(["i want a cheap restaurant serving klingon food"])
+            os.utime(model_copy, ns=(time.time_ns(), os.stat(model_copy).st_mtime_ns + 1))
+            cached.checked -= CHECK_INTERVAL
+            cached.predict(["i want a cheap restaurant serving klingon food"])
+            print(f"After touching the model: {len(cached.recent)} recent predictions, misses {cached.misses}")
@@ -4,136 +4,303 @@
 # Makes use of the Levenshtein library from https://maxbachmann.github.io/Levenshtein/levenshtein.html 
 
 
-import pandas as pd 
+import io
+import os
 import random
-from Levenshtein import distance
 import re
+import sys
+import time
+from collections import deque
+from contextlib import redirect_stdout
+from itertools import islice
+from typo_index import TypoIndex
+from slot_matcher import AhoCorasick
+from restaurant_table import column_values, read_table
 
 # Path to database of restaurants
 PATH = "data/restaurant_info_additionalpref.csv"
 # Maximal allowed levenshtein distance
 MAX_DISTANCE = 2
+# The preference categories, in the order used by the Levenshtein functions.
+CATEGORIES = ["area", "food", "pricerange"]
+# Words that are recognized as a preference, but are not in the database.
+SYNONYMS = {"center": ("area", "centre")}
+# The additional preferences a user can mention.
+ADDITIONAL_PREFS = ["touristic", "assigned seats", "children", "romantic"]
 
 
 def initialize_db(filename):
     """
-    Returns a dataframe from the given CSV file.
+    Returns a dataframe from the given CSV file. The dialogs read the file
+    with read_table (restaurant_table.py) instead, without pandas.
     filename: The name of the CSV file.
     """
+    import pandas as pd
+
     return pd.read_csv(filename) 
 
 
+class PreferenceExtractor:
+    """
+    Extracts the food, area and price preferences from user input. The 
+    restaurant database is parsed once and the possible preferences per 
+    category are precomputed, so extracting the preferences of a user turn 
+    does no file I/O and no dataframe scans. One instance can be shared by 
+    all dialogs that use the same database.
+    """
+
+    def __init__(self, db, max_distance=MAX_DISTANCE):
+        """
+        db: the database (Table or dataframe) with restaurants.
+        max_distance: the maximal allowed Levenshtein distance.
+        """
+        self.db = db
+        self.max_distance = max_distance
+
+        # All the possible preferences in the database for a particular topic.
+        columns = {label: column_values(db, label) for label in db.columns}
+        self.possible_prefs = {label: list({value for value in columns[label] if value is not None})
+                               for label in CATEGORIES}
+        # The possible preferences of the restaurants without any missing 
+        # information. Only these are used when no preference was recognized.
+        complete = [None not in row for row in zip(*columns.values())]
+        self.complete_prefs = {label: list({value for value, keep in zip(columns[label], complete) if keep})
+                               for label in CATEGORIES}
+
+        # Indexes to find the preferences within the maximal Levenshtein 
+        # distance of a misspelled word.
+        self.possible_index = {label: TypoIndex(prefs, max_distance)
+                               for label, prefs in self.possible_prefs.items()}
+        self.complete_index = {label: TypoIndex(prefs, max_distance)
+                               for label, prefs in self.complete_prefs.items()}
+
+        # Automaton that finds all the preferences (including the multi-word
+        # preferences) in a sentence. If a phrase is a preference for multiple
+        # categories, the area is preferred over the food over the price.
+        slot_phrases = [(pref, (label, pref)) for label in CATEGORIES for pref in self.possible_prefs[label]]
+        slot_phrases += list(SYNONYMS.items())
+        slot_phrases.sort(key=lambda phrase: CATEGORIES.index(phrase[1][0]))
+        self.slot_matcher = AhoCorasick(slot_phrases)
+        self.additional_matcher = AhoCorasick([(pref, pref) for pref in ADDITIONAL_PREFS])
+
+    @classmethod
+    def from_csv(cls, filename=PATH, **kwargs):
+        """
+        Returns an extractor for the database in the given CSV file.
+        filename: The name of the CSV file.
+        kwargs: the remaining arguments of the extractor.
+        """
+        return cls(initialize_db(filename), **kwargs)
+
+    def extract_prefs(self, input, category=None):
+        """
+        Extracts the user preferences if present in the input.
+        input: the user input
+        category: the category of interest, i.e. food, area or price.
+        """
+        user_input = " ".join(re.findall("[a-z0-9 ]+", input.lower()))
+        return self.find_pattern(user_input, category)
+
+    def find_pattern(self, input_str, category=None):
+        """
+        Pattern matching based on the input string. Returns the area, food and price
+        preference from the user.
+        input_str: the user input
+        category: the category of interest, i.e. food, area or price.
+        """
+        input = input_str.split()
+        # The food preference
+        food = ""
+        # The area preference
+        area = ""
+        # The price preference
+        price = ""
+
+        # If the input only consists of the word "any"
+        if input_str == "any":
+            if category == "food":
+                food = "any"
+            elif category == "pricerange":
+                price = "any"
+            elif category == "area":
+                area = "any"
+            return area, food, price
+
+        # The preferences from the database mentioned in the input, by the 
+        # index of their first word.
+        mentions = {idx: (length, pref) for (idx, length, pref) in self.slot_matcher.find_words(input)}
+        # Index of the first word after the last found preference.
+        covered = 0
+
+        for idx, word in enumerate(input):
+            # Check if the words are in database and assign the preference to 
+            # the right class.
+            if idx < covered:
+                continue
+            if idx in mentions:
+                length, (label, pref) = mentions[idx]
+                covered = idx + length
+                if label == "area":
+                    area = pref
+                elif label == "food":
+                    food = pref
+                else:
+                    price = pref
+                continue
+
+            # If food preference has not been found yet.
+            if food == "":
+                # in case of a typo or for example food=any in "i want any food"        
+                if word == "food" and idx > 0:
+                    food = input[idx-1]
+
+            # If area preference has not been found yet.
+            if area == "":
+                # in case of a typo or for example area=any in "in any part of town"
+                if (word == "part" or word == "area") and idx > 0:
+                    area = input[idx-1]
+
+            # If price preference has not been found yet.
+            if price == "":
+                # in case of a typo or for example price=any in "any price"
+                if (word == "price" or word == "priced") and idx > 0:
+                    price = input[idx-1]
+
+        if food == "" and area == "" and price == "":
+            area, food, price = self.levenshtein_no_pref(input)
+        else:
+            area, food, price = self.levenshtein_with_pref(food, area, price)
+
+        return area, food, price
+
+    def find_additional_prefs(self, input):
+        """
+        Returns the additional preferences mentioned in the input and the input
+        without these mentions.
+        input: the user input
+        """
+        found = set()
+        remaining = []
+        end = 0
+        for (start, stop, pref) in sorted(self.additional_matcher.find_all(input)):
+            found.add(pref)
+            remaining.append(input[end:start])
+            end = max(end, stop)
+        remaining.append(input[end:])
+        return found, "".join(remaining)
+
+    def levenshtein_no_pref(self, split_sent):
+        """
+        Apply levenshtein distance measure to correct spelling mistakes in the
+        user preferences. Captures any preferences in the sentence by comparing all
+        words in the sentence to the preferences in the database and taking the
+        best scoring preference per class. Returns the preferences. 
+        split_sent: list of words forming the sentence
+        """
+        area, food, price, = "", "", ""
+        distances = {"area": [],
+                     "food": [],
+                     "pricerange": []}
+
+        for word in split_sent:    
+            # If a word is smaller than the maximum allowed Levenshtein distance,
+            # it will always be used as potential preference. So ignore these 
+            # irrelevant words.
+            if len(word) > self.max_distance:
+                # A word can have an allowed levenshtein distance for multiple 
+                # preference classes, so store them in all that apply.
+                for label in CATEGORIES:
+                    distances[label].extend(self.complete_index[label].lookup(word))
+
+        # Get the preference with the smallest levenshtein distance
+        if len(distances["area"]) > 0:
+            area = min(distances["area"], key=lambda x:x[1])[0]
+        if len(distances["food"]) > 0:
+            food = min(distances["food"], key=lambda x:x[1])[0]
+        if len(distances["pricerange"]) > 0:
+            price = min(distances["pricerange"], key=lambda x:x[1])[0]
+
+        return area, food, price
+
+    def levenshtein_with_pref(self, food, area, price):
+        """
+        Apply the levenshtein distance measure to correct spelling mistakes in the
+        captured user preferences. Return the corrected preferences.
+        food: the food preference string
+        area: the area preference string
+        price: the price preference string
+        """
+        correct_prefs = [] 
+        for (db_label, var) in zip(CATEGORIES, [area, food, price]):
+            correct_prefs.append(self.correct_pref(db_label, var))
+
+        return tuple(correct_prefs)
+
+    def correct_pref(self, db_label, var):
+        """
+        Return the preference from the database closest to the given 
+        preference string.
+        db_label: the category of the preference, i.e. food, area or pricerange.
+        var: the preference string
+        """
+        if var == "any" or var == "":
+            return var
+
+        # List of tuples (db label, Levenshtein distance) of the nearby words.
+        distances = self.possible_index[db_label].lookup(var)
+
+        # No nearby word is found in the database. This means it is a 
+        # real unknown word or a word that makes no sense, but keep the 
+        # preference anyway.
+        if len(distances) == 0:
+            print(f"LEVENSHTEIN DISTANCE > {self.max_distance}, ASK USER NEW PREFERENCE")
+            return var
+
+        min_dist = min(distances, key=lambda x:x[1])[1]
+        all_min = [correct_pref for (correct_pref, d) in distances if d == min_dist]
+        # Only one preference in database found with Levenshtein 
+        # distance one.
+        if len(all_min) == 1:
+            return all_min[0]
+        # If multiple preference with the same minimal Levenshtein 
+        # distance is found, pick from these preferences one randomly.
+        return random.choice(all_min)
+
+
+# Extractor shared by the module level functions, created on first use.
+_extractor = None
+
+
+def get_extractor():
+    """
+    Returns the extractor for the default database. The database is only read
+    the first time this function is called.
+    """
+    global _extractor
+    if _extractor is None:
+        _extractor = PreferenceExtractor(read_table(PATH))
+    return _extractor
+
+
 def find_pattern(db, input_str, category=None):
     """
-    Pattern matching based on the input string. Returns the food, area and price
+    Pattern matching based on the input string. Returns the area, food and price
     preference from the user.
+    db: the database with restaurants.
     input_str: the user input
     category: the category of interest, i.e. food, area or price.
     """
-    input = input_str.split()
-    # The food preference
-    food = ""
-    # The area preference
-    area = ""
-    # The price preference
-    price = ""
-
-    
-    # If the input only consists of the word "any"
-    if input_str == "any":
-        if category == "food":
-            food = "any"
-        elif category == "pricerange":
-            price = "any"
-        elif category == "area":
-            area = "any"
-        return food, area, price
-
-    db_no_nan = db[~db[:].isna()]
-    # All the possible preferences in the database for a particular topic.
-    possible_areas = list(set(db_no_nan.loc[:, "area"]))
-    possible_foods = list(set(db_no_nan.loc[:, "food"]))
-    possible_prices = list(set(db_no_nan.loc[:, "pricerange"]))
-
-    for idx, word in enumerate(input):
-        # Check if word is in database and assign the preference to the right 
-        # class.
-        if word in possible_areas or word == "center":
-            area = word
-            continue
-        elif word in possible_foods:
-            food = word
-            continue
-        elif word in possible_prices:
-            price = word
-            continue
-
-        # If food preference has not been found yet.
-        if food == "":
-            # in case of a typo or for example food=any in "i want any food"        
-            if word == "food" and idx > 0:
-                food = input[idx-1]
-       
-        
-        # If area preference has not been found yet.
-        if area == "":
-            # in case of a typo or for example area=any in "in any part of town"
-            if (word == "part" or word == "area") and idx > 0:
-                area = input[idx-1]
-
-        
-        # If price preference has not been found yet.
-        if price == "":
-            # in case of a typo or for example price=any in "any price"
-            if (word == "price" or word == "priced") and idx > 0:
-                price = input[idx-1]
-
-
-    if food == "" and area == "" and price == "":
-        food, area, price = levenshtein_no_pref(db, input)
-    else:
-        food, area, price = levenshtein_with_pref(db, food, area, price)
+    return PreferenceExtractor(db).find_pattern(input_str, category)
 
-    return food, area, price
 
 def levenshtein_no_pref(db, split_sent):
     """
     Apply levenshtein distance measure to correct spelling mistakes in the
-    user preferences. Captures any preferences in the sentence by comparing all
-    words in the sentence to the preferences in the database and taking the
-    best scoring preference per class. Returns the preferences. 
+    user preferences. Returns the preferences. 
     db: the database with restaurants
     split_sent: list of words forming the sentence
     """
-    area, food, price, = "", "", ""
-    distances = {"area": [],
-                 "food": [],
-                 "pricerange": []}
-    db_no_nan = db[~db.isnull().any(axis=1)]    
-    possible_areas = list(set(db_no_nan.loc[:, "area"]))
-    possible_foods = list(set(db_no_nan.loc[:, "food"]))
-    possible_prices = list(set(db_no_nan.loc[:, "pricerange"]))
-
-    for word in split_sent:    
-        # If a word is smaller than the maximum allowed Levenshtein distance,
-        # it will always be used as potential preference. So ignore these 
-        # irrelevant words.
-        if len(word) > MAX_DISTANCE:
-            # A word can have an allowed levenshtein distance for multiple 
-            # preference classes, so store them in all that apply.
-            distances["area"].extend([(db_word, distance(word, db_word)) for db_word in possible_areas if distance(word, db_word) <= MAX_DISTANCE])
-            distances["food"].extend([(db_word, distance(word, db_word)) for db_word in possible_foods if distance(word, db_word) <= MAX_DISTANCE])
-            distances["pricerange"].extend([(db_word, distance(word, db_word)) for db_word in possible_prices if distance(word, db_word) <= MAX_DISTANCE])
-
-    # Get the preference with the smallest levenshtein distance
-    if len(distances["area"]) > 0:
-        area = min(distances["area"], key=lambda x:x[1])[0]
-    if len(distances["food"]) > 0:
-        food = min(distances["food"], key=lambda x:x[1])[0]
-    if len(distances["pricerange"]) > 0:
-        price = min(distances["pricerange"], key=lambda x:x[1])[0]
-
-    return area, food, price
+    return PreferenceExtractor(db).levenshtein_no_pref(split_sent)
 
 
 def levenshtein_with_pref(db, food, area, price):
@@ -145,43 +312,8 @@ def levenshtein_with_pref(db, food, area, price):
     area: the area preference string
     price: the price preference string
     """
-    correct_prefs = [] 
-    for (db_label, var) in zip(["area", "food", "pricerange"], [area, food, price]):
-        if var == "any" or var == "":
-            correct_prefs.append(var)
-        else:
-            db_no_nan = db[~db[db_label].isna()]
-            # List of tuples (Levenshtein distance, db label)
-            distances = []
-            # All the possible preferences in the database for a particular topic.
-            possible_prefs = list(set(db_no_nan.loc[:, db_label]))
-     
-            for pref in possible_prefs:
-                dist = distance(pref, var)
-                # i.e. a nearby word
-                if dist <= MAX_DISTANCE:
-                    distances.append((pref, dist))
-            
-            
-            # No nearby word is found in the database. This means it is a 
-            # real unknown word or a word that makes no sense, but keep the 
-            # preference anyway.
-            if len(distances) == 0:
-                correct_prefs.append(var)
-                print(f"LEVENSHTEIN DISTANCE > {MAX_DISTANCE}, ASK USER NEW PREFERENCE")
-            else:
-                min_dist = min(distances, key=lambda x:x[1])[1]
-                all_min = [correct_pref for (correct_pref, d) in distances if d == min_dist]
-                # Only one preference in database found with Levenshtein 
-                # distance one.
-                if len(all_min) == 1:
-                    correct_prefs.append(all_min[0])
-                # If multiple preference with the same minimal Levenshtein 
-                # distance is found, pick from these preferences one randomly.
-                else:
-                    correct_prefs.append(random.choice(all_min))
+    return PreferenceExtractor(db).levenshtein_with_pref(food, area, price)
 
-    return tuple(correct_prefs)
 
 def extract_prefs(input, category=None):
     """
@@ -189,13 +321,80 @@ def extract_prefs(input, category=None):
     input: the user input
     category: the category of interest, i.e. food, area or price.
     """
-    db = initialize_db(PATH)
-    user_input = " ".join(re.findall("[a-z0-9 ]+", input.lower()))
-    return find_pattern(db, user_input, category)
+    return get_extractor().extract_prefs(input, category)
+
+
+def _extract_chunk(chunk, category):
+    """
+    Returns the preferences of every utterance in the chunk. Runs in a worker 
+    process of extract_prefs_batch. The messages printed by the Levenshtein 
+    correction are suppressed.
+    chunk: list of utterances
+    category: the category of interest, i.e. food, area or price.
+    """
+    extractor = get_extractor()
+    with redirect_stdout(io.StringIO()):
+        return [extractor.extract_prefs(utterance, category) for utterance in chunk]
+
+
+def extract_prefs_batch(utterances, category=None, workers=None, chunk_size=256, report=False):
+    """
+    Extracts the user preferences of many utterances. The utterances are 
+    split in chunks that are processed by a pool of worker processes, and the
+    preferences are returned in the order of the utterances as soon as they 
+    are available. The results are the same as calling extract_prefs on every
+    utterance.
+    utterances: list or iterator of user inputs
+    category: the category of interest, i.e. food, area or price.
+    workers: the number of worker processes, by default the number of CPUs.
+    With one worker the utterances are processed in this process.
+    chunk_size: the number of utterances sent to a worker at once.
+    report: print the number of utterances processed per second at the end.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    utterances = iter(utterances)
+    chunks = iter(lambda: list(islice(utterances, chunk_size)), [])
+    start = time.perf_counter()
+    count = 0
+
+    if workers <= 1:
+        for chunk in chunks:
+            for prefs in _extract_chunk(chunk, category):
+                count += 1
+                yield prefs
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=get_extractor) as executor:
+            # Only keep a limited number of chunks in progress, so the
+            # utterances do not have to fit in memory at once.
+            pending = deque()
+            for chunk in islice(chunks, 2 * workers):
+                pending.append(executor.submit(_extract_chunk, chunk, category))
+            while pending:
+                results = pending.popleft().result()
+                for chunk in islice(chunks, 1):
+                    pending.append(executor.submit(_extract_chunk, chunk, category))
+                for prefs in results:
+                    count += 1
+                    yield prefs
+
+    if report:
+        elapsed = time.perf_counter() - start
+        print(f"Extracted the preferences of {count} utterances in {elapsed:.2f}s "
+              f"({count / max(elapsed, 1e-9):.0f} utterances/s)", file=sys.stderr)
 
 
 if __name__ == '__main__':
-    db = initialize_db(PATH)
+    # Extract the preferences of every line in the given file.
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as file:
+            for food, area, price in extract_prefs_batch(file, report=True):
+                print(f"{food}\t{area}\t{price}")
+        sys.exit()
+
+    extractor = get_extractor()
     user_input = ""
     print("Enter sentence:")
     try:
@@ -206,9 +405,8 @@ if __name__ == '__main__':
             else:                     
                 # Allow spaces, lowercase letters and numbers   
                 user_input = " ".join(re.findall("[a-z0-9 ]+", user_input.lower()))
-                food, area, price = find_pattern(db, user_input)
+                food, area, price = extractor.find_pattern(user_input)
                 print(type(food), type(area), type(price))
                 print(f'PREFERENCES: food={food}, area={area}, price={price}')
     except KeyboardInterrupt:
         print("\nKeyboardInterrupt. Quitting")
-   
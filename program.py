@@ -4,11 +4,10 @@
 # configurability feature is implemented in DMS.py
 
 from DMS import DMS
-from joblib import load
+from forest_predictor import load_classifier
+from prediction_cache import CachedClassifier
 import os
 from time import sleep
-from gtts import gTTS
-from playsound import playsound
 
 # Configurabiltiy features: text-to-speech, return upper case output, and 
 # delay system's output.
@@ -20,15 +19,16 @@ delay = 2
 language = 'en'
 
 if __name__ == "__main__":
-    if not os.path.exists("data/classifier.joblib"):
+    if not os.path.exists("data/pipeline.joblib"):
         os.system("python classifiers.py")
 
-    # Load the pretrained classifier and vectorizer
-    classifier = load("data/classifier.joblib")
-    vectorizer = load("data/vectorizer.joblib")
+    # Load the pretrained classifier, without scikit-learn if the random 
+    # forest was exported, behind a cache of the dialog acts of common 
+    # sentences.
+    classifier = CachedClassifier(load_classifier(), loader=load_classifier)
     # Create the dialog management system, a state machine to control the
     # conversation.
-    dms = DMS(classifier, vectorizer, "data/restaurant_info_additionalpref.csv")
+    dms = DMS(classifier, "data/restaurant_info_additionalpref.csv")
     while True and not dms.end_dialog:
         text = dms.system_utterance
         # system delay feature
@@ -36,6 +36,9 @@ if __name__ == "__main__":
             sleep(delay)
         # Text to speech feature
         if (speechOn == 1):
+            # Only import the text-to-speech libraries when they are used.
+            from gtts import gTTS
+            from playsound import playsound
             speech = gTTS(text=text, lang=language)
             speech.save("texttospeech.mp3")
             playsound("texttospeech.mp3")
@@ -0,0 +1,195 @@
+# This file implements the restaurant database that is shared by all dialogs.
+# The CSV file is read once, and the preference extractor is built once from
+# it, instead of once per dialog. The columns that can be searched are also
+# stored as small integer codes, so a dialog only has to keep the codes of
+# its preferences and the row numbers of the restaurants it found, instead of
+# its own dataframes.
+
+from collections import namedtuple
+from preferences import ADDITIONAL_PREFS, PreferenceExtractor
+from restaurant_index import BitsetIndex
+from restaurant_table import column_values, is_missing, read_table
+from result_cube import ResultCube
+import numpy as np
+import zlib
+
+# Path to database of restaurants
+PATH = "data/restaurant_info_additionalpref.csv"
+# The preferences of the user, in the order of the preference codes.
+SLOTS = ["pricerange", "area", "food"]
+# The columns that are searched for the (additional) preferences.
+FILTER_COLUMNS = SLOTS + ["quality", "stay", "crowdedness"]
+# The codes of no preference ("") and of "any" in every column. The values
+# in the database have the codes after these.
+NO_PREFERENCE = 0
+ANY = 1
+# The code of a missing value in the database.
+MISSING = -1
+# The food that makes a restaurant touristic.
+TOURISTIC_FOOD = ["chinese", "italian", "european", "indian", "british", "asian oriental"]
+# The restaurant information that is offered after a suggestion.
+CONTACT_INFO = ["phone", "addr", "postcode"]
+
+
+def read_only(array):
+    """
+    Returns the array after making it read-only, so a shared array cannot be
+    changed by one of the dialogs.
+    """
+    array.flags.writeable = False
+    return array
+
+
+# The results of a dialog before the first lookup.
+NO_RESULTS = read_only(np.empty(0, dtype=np.int32))
+
+
+class RestaurantDB:
+    """
+    The restaurant database (Table or dataframe) together with the preference
+    extractor for it. One instance can be given to any number of DMS objects.
+    The database must not be changed by the dialogs.
+    """
+
+    def __init__(self, data, extractor=None, cube=True):
+        """
+        data: the database (Table or dataframe) with restaurants.
+        extractor: the preference extractor for the database, or None to
+        build it.
+        cube: build the cube of the results of every combination of
+        preferences (if it is not too large) or not.
+        """
+        self.data = data
+        if extractor is None:
+            extractor = PreferenceExtractor(data)
+        self.extractor = extractor
+
+        # The values per column ("", "any" and the values in the database),
+        # the code of every value, and the code of every restaurant. They are
+        # shared by all dialogs and never changed.
+        self.values = {}
+        self.value_codes = {}
+        self.codes = {}
+        columns = {column: column_values(data, column) for column in data.columns}
+        for column in FILTER_COLUMNS:
+            self.values[column] = ("", "any", *sorted({value for value in columns[column] if value is not None}))
+            self.value_codes[column] = {value: code for code, value in enumerate(self.values[column])}
+            codes = [self.value_codes[column].get(value, MISSING) for value in columns[column]]
+            self.codes[column] = read_only(np.array(codes, dtype=np.int16))
+        # The number of codes per column. This is also the code of every value
+        # that is not in the database, which selects no restaurant.
+        self.n_values = {column: len(values) for column, values in self.values.items()}
+        # Checksum of the values and the codes of the restaurants, to check
+        # that saved row numbers and codes belong to the same database.
+        self.fingerprint = zlib.crc32(b"".join(["\0".join(self.values[column]).encode() + self.codes[column].tobytes()
+                                                for column in FILTER_COLUMNS]))
+
+        # The columns as lists (None for a missing value), to get the
+        # information of a restaurant without indexing the database.
+        self.Restaurant = namedtuple("Restaurant", list(data.columns), rename=True)
+        self.columns = list(columns.values())
+
+        # The restaurants that satisfy every additional preference, in the
+        # order of ADDITIONAL_PREFS.
+        is_code = lambda column, value: self.codes[column] == self.value_codes[column].get(value, MISSING - 1)
+        touristic = (is_code("pricerange", "cheap") & is_code("quality", "good")) | np.isin(
+            self.codes["food"], [self.value_codes["food"].get(food, MISSING - 1) for food in TOURISTIC_FOOD])
+        additional_masks = [touristic,
+                            is_code("crowdedness", "busy"),
+                            is_code("stay", "short"),
+                            is_code("stay", "long") | is_code("crowdedness", "not busy")]
+        self.index = BitsetIndex(self.codes, self.n_values, additional_masks)
+        self.cube = ResultCube.build(self.index) if cube else None
+
+    @classmethod
+    def from_csv(cls, filename=PATH):
+        """
+        Returns the database read from the given CSV file, without pandas.
+        filename: The name of the CSV file.
+        """
+        return cls(read_table(filename))
+
+    def encode(self, column, value):
+        """
+        Returns the code of a preference. Every value that is not in the
+        database (such as a misspelled word that could not be corrected) has
+        the unknown code n_values[column], which matches no restaurant; the
+        dialog has to keep the value itself.
+        column: the column of the preference, e.g. "food".
+        value: the preference, e.g. "italian", "any" or "".
+        """
+        return self.value_codes[column].get(value, self.n_values[column])
+
+    def is_unknown(self, column, code):
+        """
+        Returns whether the code is the code of the values that are not in the
+        database.
+        column: the column of the preference, e.g. "food".
+        code: the code of the preference.
+        """
+        return code == self.n_values[column]
+
+    def decode(self, column, code):
+        """
+        Returns the preference of a code of a value in the database.
+        column: the column of the preference, e.g. "food".
+        code: the code of the preference.
+        """
+        return self.values[column][code]
+
+    def lookup(self, preferences, additional=0):
+        """
+        Returns the row numbers (in the order of the database) of the
+        restaurants that satisfy the preferences. When every preference is
+        "any", all restaurants are returned and the additional preferences
+        are not used.
+        preferences: the codes of the pricerange, area and food preference.
+        additional: bit mask of the additional preferences, in the order of
+        ADDITIONAL_PREFS. Only the first additional preference is used.
+        """
+        if self.cube is not None:
+            return self.cube.lookup(preferences, additional)
+        return self.index.lookup(preferences, additional)
+
+    def lookup_batch(self, preferences, additional=None):
+        """
+        Returns a list with the row numbers of the restaurants that satisfy
+        the preferences of every query, as lookup does for one query.
+        preferences: list with the codes of the pricerange, area and food
+        preference of every query.
+        additional: list with the bit mask of the additional preferences of
+        every query, or None for no additional preferences.
+        """
+        if self.cube is not None:
+            if additional is None:
+                additional = [0] * len(preferences)
+            return [self.cube.lookup(query, mask) for query, mask in zip(preferences, additional)]
+        return self.index.lookup_batch(preferences, additional)
+
+    def restaurant(self, row):
+        """
+        Returns the information (named tuple of the columns) of the
+        restaurant in the given row.
+        row: the row number of the restaurant.
+        """
+        return self.Restaurant(*[column[row] for column in self.columns])
+
+    def contact_info(self, row):
+        """
+        Returns the phone number, address and postcode of the restaurant in
+        the given row, as a list of (category, value) tuples. Missing values
+        are "unknown".
+        row: the row number of the restaurant.
+        """
+        restaurant = self.restaurant(row)
+        return [(category, "unknown" if is_missing(getattr(restaurant, category)) else getattr(restaurant, category))
+                for category in CONTACT_INFO]
+
+
+def additional_code(additional_preferences):
+    """
+    Returns the bit mask of the additional preferences.
+    additional_preferences: dictionary of the additional preferences (in
+    ADDITIONAL_PREFS) to True or False.
+    """
+    return sum(1 << bit for bit, pref in enumerate(ADDITIONAL_PREFS) if additional_preferences[pref])
@@ -0,0 +1,238 @@
+# This file implements an inverted index of the restaurant database. For every
+# value of every searched column, the restaurants with that value are stored
+# as a bitset: one bit per restaurant, packed in 64-bit words. A lookup of the
+# preferences of the user is then a few bitwise ANDs of bitsets, followed by
+# turning the bits that are set into row numbers. Many lookups can be done at
+# once with lookup_batch.
+#
+# Usage: python restaurant_index.py [number of restaurants ...]
+#        (benchmark on the database and on synthetic databases, 10k to 1M
+#        restaurants by default)
+
+import numpy as np
+
+# The order of the preferences in a query.
+SLOTS = ["pricerange", "area", "food"]
+# The codes of no preference ("") and "any", as in restaurant_db.py.
+NO_PREFERENCE = 0
+ANY = 1
+# The number of words of bitsets that lookup_batch combines at once (so they
+# fit in the cache of the processor).
+BATCH_WORDS = 1 << 16
+# The filter (index into the filters plus one, 0 for no filter) of every bit
+# mask of four additional preferences: only the first preference is used.
+FIRST_FILTER = np.array([0] + [(mask & -mask).bit_length() for mask in range(1, 16)])
+
+
+def pack(mask):
+    """
+    Returns the bitset of a boolean array as an array of 64-bit words. Bit i
+    of the bitset (bit i % 64 of word i // 64) is mask[i].
+    mask: boolean array with one element per restaurant.
+    """
+    packed = np.packbits(mask, bitorder="little")
+    words = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    words[:len(packed)] = packed
+    return words.view(np.uint64)
+
+
+def rows(bitset):
+    """
+    Returns the positions (in increasing order) of the bits that are set in
+    the bitset. Only the words that are not zero are unpacked.
+    bitset: array of 64-bit words.
+    """
+    nonzero = np.flatnonzero(bitset)
+    bits = np.unpackbits(bitset[nonzero].view(np.uint8), bitorder="little").reshape(-1, 64)
+    words, positions = np.nonzero(bits)
+    return (nonzero[words] * 64 + positions).astype(np.int32)
+
+
+class BitsetIndex:
+    """
+    Index of the restaurants per value of every searched column, with bitsets
+    of the restaurants that satisfy every additional preference.
+    """
+
+    def __init__(self, codes, n_values, filters=()):
+        """
+        codes: dictionary of column to the array of the code of the value of
+        every restaurant (a negative code for a missing value).
+        n_values: dictionary of column to the number of codes of the column,
+        including the codes of no preference and "any".
+        filters: boolean arrays of the restaurants that satisfy every
+        additional preference.
+        """
+        self.n_rows = len(next(iter(codes.values())))
+        n_words = -(-self.n_rows // 64)
+        # The bitsets per column, by code. No preference selects nothing and
+        # "any" selects everything.
+        self.bitsets = {}
+        for column, column_codes in codes.items():
+            bitsets = np.zeros((n_values[column], n_words), dtype=np.uint64)
+            bitsets[ANY] = pack(np.ones(self.n_rows, dtype=bool))
+            for code in range(ANY + 1, n_values[column]):
+                bitsets[code] = pack(column_codes == code)
+            bitsets.flags.writeable = False
+            self.bitsets[column] = bitsets
+        # The bitsets of the additional preferences, after the bitset of no
+        # additional preference.
+        self.filters = np.stack([pack(np.ones(self.n_rows, dtype=bool))] + [pack(mask) for mask in filters])
+        self.filters.flags.writeable = False
+        self.all_rows = np.arange(self.n_rows, dtype=np.int32)
+        self.all_rows.flags.writeable = False
+
+    def bitset(self, column, code):
+        """
+        Returns the bitset of the restaurants with the value of the code. A
+        code that was added after the index was built selects nothing.
+        column: the column
+        code: the code of the value
+        """
+        bitsets = self.bitsets[column]
+        return bitsets[code if code < len(bitsets) else NO_PREFERENCE]
+
+    def lookup(self, preferences, additional=0):
+        """
+        Returns the row numbers (in increasing order) of the restaurants that
+        satisfy the preferences. When every preference is "any", all
+        restaurants are returned and the additional preferences are not used.
+        preferences: the codes of the pricerange, area and food preference.
+        additional: bit mask of the additional preferences; only the first
+        additional preference is used.
+        """
+        selected = None
+        for column, code in zip(SLOTS, preferences):
+            if code != ANY:
+                bitset = self.bitset(column, code)
+                selected = bitset.copy() if selected is None else np.bitwise_and(selected, bitset, out=selected)
+        if selected is None:
+            return self.all_rows
+        if additional:
+            selected &= self.filters[FIRST_FILTER[additional]]
+        return rows(selected)
+
+    def lookup_batch(self, preferences, additional=None):
+        """
+        Returns a list with the row numbers of the restaurants that satisfy
+        every query, as lookup does for one query. The bitsets of many
+        queries are combined at once.
+        preferences: array (or list) with the codes of the pricerange, area
+        and food preference of every query.
+        additional: array with the bit mask of the additional preferences of
+        every query, or None for no additional preferences.
+        """
+        preferences = np.asarray(preferences, dtype=np.int64).reshape(-1, len(SLOTS))
+        if additional is None:
+            additional = np.zeros(len(preferences), dtype=np.int64)
+        # When every preference is "any", the additional preferences are not
+        # used.
+        filters = np.where((preferences == ANY).all(axis=1), 0, FIRST_FILTER[np.asarray(additional)])
+        codes = [np.where(preferences[:, i] < len(self.bitsets[column]), preferences[:, i], NO_PREFERENCE)
+                 for i, column in enumerate(SLOTS)]
+
+        results = []
+        step = max(1, BATCH_WORDS // self.filters.shape[1])
+        for start in range(0, len(preferences), step):
+            selected = self.filters[filters[start:start + step]]
+            for column, column_codes in zip(SLOTS, codes):
+                selected &= self.bitsets[column][column_codes[start:start + step]]
+            results.extend(rows(bitset) for bitset in selected)
+        return results
+
+
+def synthetic_data(db, n_rows, seed=0):
+    """
+    Returns a synthetic database (dataframe) of restaurants, with the values
+    of every searched column drawn from the values in the real database.
+    db: the real RestaurantDB
+    n_rows: the number of restaurants
+    seed: the seed of the random values
+    """
+    import pandas as pd
+
+    from restaurant_table import column_values
+
+    generator = np.random.default_rng(seed)
+    data = {"restaurantname": [f"restaurant {i}" for i in range(n_rows)]}
+    for column in db.codes:
+        data[column] = generator.choice(np.array(column_values(db.data, column), dtype=object), n_rows)
+    return pd.DataFrame(data)
+
+
+def dataframe_lookup(data, preferences, additional_preferences):
+    """
+    Returns the restaurants that satisfy the preferences the way the DMS
+    looked them up before the index: with a mask per preference on a copy of
+    the dataframe.
+    data: the database (dataframe)
+    preferences: dictionary of column to preference
+    additional_preferences: dictionary of additional preference to True or
+    False
+    """
+    import pandas as pd
+
+    results = data.copy()
+    masks = [results[column] == value for column, value in preferences.items() if value != "any"]
+    if len(masks) == 0:
+        return results
+    df = results[pd.concat(masks, axis=1).all(axis=1)]
+    if additional_preferences["touristic"]:
+        return df[((df["pricerange"] == "cheap") & (df["quality"] == "good")) | (df["food"].isin(
+            ["chinese", "italian", "european", "indian", "british", "asian oriental"]))]
+    elif additional_preferences["assigned seats"]:
+        return df[df["crowdedness"] == "busy"]
+    elif additional_preferences["children"]:
+        return df[df["stay"] == "short"]
+    elif additional_preferences["romantic"]:
+        return df[(df["stay"] == "long") | (df["crowdedness"] == "not busy")]
+    return df
+
+
+if __name__ == '__main__':
+    from preferences import ADDITIONAL_PREFS, initialize_db
+    from restaurant_db import PATH, RestaurantDB
+    import itertools
+    import sys
+    import time
+
+    sizes = [int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    # The old lookup needs the database as a dataframe.
+    db = RestaurantDB(initialize_db(PATH))
+    generator = np.random.default_rng(1)
+    # Queries with every combination of a value or "any" per preference.
+    n_queries = 200
+    queries = [[generator.choice(db.values[column][ANY:]) for column in SLOTS] for _ in range(n_queries)]
+    additional = generator.integers(0, 16, n_queries)
+
+    print(f"{'restaurants':>12}{'build (s)':>11}{'index (MB)':>12}{'dataframe (ms)':>16}{'index (ms)':>12}"
+          f"{'batch (ms/query)':>18}")
+    for data in itertools.chain([db.data], (synthetic_data(db, n_rows) for n_rows in sizes)):
+        n_rows = len(data)
+        start = time.perf_counter()
+        synthetic = RestaurantDB(data, db.extractor)
+        build_time = time.perf_counter() - start
+        size = sum(bitsets.nbytes for bitsets in synthetic.index.bitsets.values()) + synthetic.index.filters.nbytes
+
+        codes = [[synthetic.encode(column, value) for column, value in zip(SLOTS, query)] for query in queries]
+        # The old lookup is slow on large databases, so it is timed on fewer
+        # queries.
+        n_old = min(n_queries, max(5, n_queries * 10_000 // n_rows))
+        start = time.perf_counter()
+        expected = [dataframe_lookup(data, dict(zip(SLOTS, query)),
+                                     {pref: bool(mask >> bit & 1) for bit, pref in enumerate(ADDITIONAL_PREFS)})
+                    for query, mask in zip(queries[:n_old], additional)]
+        dataframe_time = (time.perf_counter() - start) / n_old
+
+        start = time.perf_counter()
+        found = [synthetic.index.lookup(query, mask) for query, mask in zip(codes, additional)]
+        index_time = (time.perf_counter() - start) / n_queries
+
+        start = time.perf_counter()
+        batch = synthetic.index.lookup_batch(codes, additional)
+        batch_time = (time.perf_counter() - start) / n_queries
+
+        assert all(list(old.index) == list(new) for old, new in zip(expected, found))
+        assert all(np.array_equal(single, many) for single, many in zip(found, batch))
+        print(f"{n_rows:>12}{build_time:>11.2f}{size / 2**20:>12.2f}{dataframe_time * 1e3:>16.3f}"
+              f"{index_time * 1e3:>12.3f}{batch_time * 1e3:>18.3f}")
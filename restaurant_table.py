@@ -0,0 +1,61 @@
+# This file reads the CSV file of restaurants without pandas. Importing pandas
+# takes most of the start-up time of the chatbot, while the dialogs only need
+# the values of every column of a small file. The table offers the part of the
+# dataframe interface that the dialog path uses, and a dataframe can still be
+# given wherever a table is expected.
+
+import csv
+
+
+class Table:
+    """
+    A table of restaurants: the names of the columns (in columns), the values
+    of a column by name as a list (None for a missing value) and the number
+    of rows (len).
+    """
+
+    def __init__(self, columns):
+        """
+        columns: dictionary of the name of every column to its list of values.
+        """
+        self.values = columns
+        self.columns = list(columns)
+
+    def __getitem__(self, column):
+        return self.values[column]
+
+    def __len__(self):
+        return len(self.values[self.columns[0]]) if len(self.columns) > 0 else 0
+
+
+def read_table(filename):
+    """
+    Returns the table in the given CSV file. Empty fields are missing values,
+    as for pandas.read_csv.
+    filename: The name of the CSV file.
+    """
+    with open(filename, newline="") as file:
+        reader = csv.reader(file)
+        names = next(reader)
+        rows = [[value if value != "" else None for value in row] for row in reader]
+    return Table({name: [row[i] for row in rows] for i, name in enumerate(names)})
+
+
+def is_missing(value):
+    """
+    Returns whether a value of the database is missing: None in a table, NaN
+    in a dataframe.
+    value: the value
+    """
+    return value is None or value != value
+
+
+def column_values(data, column):
+    """
+    Returns the values of a column as a list, with None for a missing value.
+    data: the database (Table or dataframe) with restaurants.
+    column: the name of the column.
+    """
+    if isinstance(data, Table):
+        return data[column]
+    return [None if is_missing(value) else value for value in data[column].tolist()]
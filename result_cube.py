@@ -0,0 +1,137 @@
+# This file implements a materialized cube of lookup results. There are few
+# possible preferences (a few prices, areas and dozens of foods, each also
+# "any") and few filters of additional preferences, so the row numbers of the
+# restaurants of every combination can be computed when the database is
+# loaded. A lookup is then a single dictionary lookup. When the cube would be
+# too large (for large databases), it is not built and the bitset index of
+# restaurant_index.py is used.
+#
+# Usage: python result_cube.py [number of restaurants ...]
+#        (build time, memory and lookup time on the database and on synthetic
+#        databases)
+
+from restaurant_index import ANY, FIRST_FILTER, SLOTS
+import itertools
+import numpy as np
+import sys
+import time
+
+# The maximal number of combinations of preferences and the maximal memory
+# (in bytes) of the row numbers in the cube.
+MAX_ENTRIES = 200_000
+MAX_BYTES = 32 * 2**20
+# The filter of every bit mask of additional preferences.
+FIRST = FIRST_FILTER.tolist()
+
+
+class ResultCube:
+    """
+    The row numbers of the restaurants that satisfy every combination of
+    preferences, by the codes of the preferences and the filter of the
+    additional preferences.
+    """
+
+    def __init__(self, index):
+        """
+        index: the BitsetIndex of the database.
+        """
+        start = time.perf_counter()
+        codes = [[ANY] + list(range(ANY + 1, len(index.bitsets[column]))) for column in SLOTS]
+        keys = [(*preferences, mode) for preferences in itertools.product(*codes)
+                for mode in range(len(index.filters))]
+        # The bit mask of the first additional preference of every filter.
+        masks = [0 if mode == 0 else 1 << (mode - 1) for *_, mode in keys]
+        results = index.lookup_batch([key[:-1] for key in keys], np.array(masks))
+
+        # The row numbers of all combinations are stored in one read-only
+        # array, and the combinations refer to parts of it.
+        self.rows = np.concatenate([np.empty(0, dtype=np.int32)] + results)
+        self.rows.flags.writeable = False
+        no_results = self.rows[:0]
+        self.results = {}
+        offset = 0
+        for key, result in zip(keys, results):
+            self.results[key] = self.rows[offset:offset + len(result)] if len(result) > 0 else no_results
+            offset += len(result)
+        self.no_results = no_results
+        self.build_time = time.perf_counter() - start
+
+    @staticmethod
+    def estimate(index):
+        """
+        Returns the number of combinations and an upper bound of the memory
+        (in bytes) of the row numbers of the cube of the index: every
+        restaurant is in at most 2 (its value or "any") combinations per
+        preference, for every filter.
+        index: the BitsetIndex of the database.
+        """
+        entries = np.prod([len(index.bitsets[column]) - 1 for column in SLOTS]) * len(index.filters)
+        return int(entries), index.n_rows * 2 ** len(SLOTS) * len(index.filters) * 4
+
+    @classmethod
+    def build(cls, index, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        """
+        Returns the cube of the index, or None if it would be too large.
+        index: the BitsetIndex of the database.
+        max_entries: the maximal number of combinations.
+        max_bytes: the maximal memory (in bytes) of the row numbers.
+        """
+        entries, size = cls.estimate(index)
+        if entries > max_entries or size > max_bytes:
+            return None
+        return cls(index)
+
+    def memory(self):
+        """
+        Returns the memory (in bytes) of the cube: the row numbers, the
+        dictionary, its keys and the arrays that refer to the row numbers.
+        """
+        return (self.rows.nbytes + sys.getsizeof(self.results)
+                + sum(sys.getsizeof(key) + sys.getsizeof(result) for key, result in self.results.items()))
+
+    def lookup(self, preferences, additional=0):
+        """
+        Returns the row numbers of the restaurants that satisfy the
+        preferences, as BitsetIndex.lookup does. Codes that are not in the
+        database (no preference and unknown values) select nothing.
+        preferences: the codes of the pricerange, area and food preference.
+        additional: bit mask of the additional preferences.
+        """
+        pricerange, area, food = preferences
+        return self.results.get((pricerange, area, food, FIRST[additional]), self.no_results)
+
+
+if __name__ == '__main__':
+    from restaurant_db import RestaurantDB
+    from restaurant_index import synthetic_data
+
+    sizes = [int(size) for size in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+    db = RestaurantDB.from_csv()
+    generator = np.random.default_rng(1)
+
+    print(f"{'restaurants':>12}{'entries':>10}{'build (s)':>11}{'memory (MB)':>13}{'index (us)':>12}"
+          f"{'cube (us)':>11}")
+    for data in itertools.chain([db.data], (synthetic_data(db, n_rows) for n_rows in sizes)):
+        synthetic = RestaurantDB(data, db.extractor, cube=False)
+        index = synthetic.index
+        entries, size = ResultCube.estimate(index)
+        cube = ResultCube.build(index)
+        if cube is None:
+            print(f"{len(data):>12}{entries:>10}   not built: more than {MAX_BYTES / 2**20:.0f} MB "
+                  f"(at most {size / 2**20:.0f} MB), the index is used")
+            continue
+
+        # Every combination, and codes that are not in the database.
+        queries = list(cube.results) + [(0, ANY, ANY, 0), (ANY, ANY, len(index.bitsets["food"]) + 5, 1)]
+        for *preferences, mode in queries:
+            additional = 0 if mode == 0 else 1 << (mode - 1)
+            assert np.array_equal(cube.lookup(preferences, additional), index.lookup(preferences, additional))
+        sample = [queries[i] for i in generator.integers(0, len(queries), 2000)]
+        timings = []
+        for structure in [index, cube]:
+            start = time.perf_counter()
+            for *preferences, mode in sample:
+                structure.lookup(preferences, mode and 1 << (mode - 1))
+            timings.append((time.perf_counter() - start) / len(sample))
+        print(f"{len(data):>12}{entries:>10}{cube.build_time:>11.3f}{cube.memory() / 2**20:>13.2f}"
+              f"{timings[0] * 1e6:>12.1f}{timings[1] * 1e6:>11.2f}")
@@ -0,0 +1,147 @@
+# This file measures the memory that the state of one dialog (session) takes,
+# for the DMS and for the state dictionary of utils.py. It compares the
+# compact state (slots, preference codes and row numbers into the shared
+# restaurant database) with the state as it was kept before: a dataframe of
+# the results, a series of the restaurant information and dictionaries of
+# the preferences per session.
+#
+# Usage: python session_memory.py [number of sessions]
+
+from DMS import DMS
+from preferences import initialize_db
+from restaurant_db import CONTACT_INFO, PATH, RestaurantDB
+import pandas as pd
+import sys
+import tracemalloc
+import utils
+
+SESSIONS = 1000
+# The preferences of the sessions with results.
+QUERY = [("pricerange", "any"), ("area", "centre"), ("food", "any")]
+
+
+class DataFrameSession:
+    """
+    The state of a dialog as the DMS kept it before: attributes in a
+    dictionary, the results as a dataframe and the information about the
+    suggested restaurant as a series.
+    """
+
+    def __init__(self, db, results=None):
+        """
+        db: the shared RestaurantDB.
+        results: the row numbers of the results of a lookup, or None for an
+        idle session.
+        """
+        self.classifier = None
+        self.data = db.data
+        self.extractor = db.extractor
+        self.formalOn = 0
+        self.state = "Welcome"
+        self.end_dialog = False
+        self.system_utterance = ""
+        self.current_suggestion = 0
+        self.preferences = {"pricerange": "", "area": "", "food": "", "touristic": False, "assigned seats": False,
+                            "children": False, "romantic": False}
+        if results is None:
+            self.results = pd.DataFrame()
+            self.current_info = pd.Series()
+        else:
+            # The lookup copied the database and selected the results.
+            self.results = db.data.copy()[db.data.index.isin(results)]
+            self.current_info = self.results.iloc[0][CONTACT_INFO]
+
+
+def dataframe_state_info(db, results=None):
+    """
+    Returns the state dictionary of utils.py as set_initial_state_info built
+    it before, with a dataframe of the results and a series of the restaurant
+    information.
+    db: the shared RestaurantDB.
+    results: the row numbers of the results of a lookup, or None for an
+    idle session.
+    """
+    info = {"current_state": "Welcome",
+            "preferences": {"pricerange": "", "area": "", "food": ""},
+            "additional_preferences": {"touristic": False, "assigned seats": False, "children": False,
+                                       "romantic": False},
+            "utterance": "",
+            "formalOn": 0,
+            "results": pd.DataFrame(),
+            "current_info": pd.Series(),
+            "current_suggestion": 0,
+            "end_conversation": False}
+    if results is not None:
+        info["results"] = db.data.copy()[db.data.index.isin(results)]
+        info["current_info"] = info["results"].iloc[0][CONTACT_INFO]
+    return info
+
+
+def compact_session(db, results=None):
+    """
+    Returns a DMS with the compact state.
+    db: the shared RestaurantDB.
+    results: the row numbers of the results of a lookup, or None for an
+    idle session.
+    """
+    dms = DMS(None, db)
+    if results is not None:
+        # A lookup returns a new array of row numbers.
+        dms.results = results.copy()
+    return dms
+
+
+def compact_state_info(db, results=None):
+    """
+    Returns the state dictionary of utils.py with the compact results.
+    db: the shared RestaurantDB.
+    results: the row numbers of the results of a lookup, or None for an
+    idle session.
+    """
+    info = utils.set_initial_state_info(0)
+    if results is not None:
+        info["results"] = results.copy()
+    return info
+
+
+def bytes_per_session(create, db, results, n_sessions=SESSIONS):
+    """
+    Returns the memory (in bytes) allocated per session when n_sessions
+    sessions are created and kept.
+    create: function that creates a session from the database and results
+    db: the shared RestaurantDB
+    results: the row numbers of the results, or None for idle sessions
+    n_sessions: the number of sessions
+    """
+    # The first session may allocate objects that are shared by all
+    # sessions, which do not count.
+    create(db, results)
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        sessions = [create(db, results) for _ in range(n_sessions)]
+        size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    del sessions
+    return size / n_sessions
+
+
+if __name__ == '__main__':
+    n_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else SESSIONS
+    # The sessions as they were kept before need the database as a dataframe.
+    db = RestaurantDB(initialize_db(PATH))
+    results = db.lookup([db.encode(column, value) for column, value in QUERY])
+
+    print(f"Memory per session ({n_sessions} sessions, {len(results)} results after a lookup):")
+    print(f"{'':<28}{'before (bytes)':>16}{'after (bytes)':>16}")
+    for name, before, after, session_results in [
+            ("DMS, idle", DataFrameSession, compact_session, None),
+            ("DMS, with results", DataFrameSession, compact_session, results),
+            ("utils state, idle", dataframe_state_info, compact_state_info, None),
+            ("utils state, with results", dataframe_state_info, compact_state_info, results)]:
+        print(f"{name:<28}{bytes_per_session(before, db, session_results, n_sessions):>16.0f}"
+              f"{bytes_per_session(after, db, session_results, n_sessions):>16.0f}")
+    # A DMS created from the path of the CSV file also read its own copy of
+    # the database, and built its own preference extractor.
+    print(f"A copy of the database (dataframe) takes {db.data.memory_usage(deep=True).sum():.0f} bytes")
@@ -0,0 +1,571 @@
+# This file saves the state of a dialog (DMS) as compact bytes, and keeps the
+# saved dialogs in a store by session id, so a dialog can be continued by
+# another process (worker) or after a restart. A saved dialog holds the
+# state, the preferences and the additional preferences as codes, the
+# current suggestion and the row numbers of the results; the system
+# utterance is only saved when it cannot be made again from the rest. The
+# saved dialogs start with the version of the format, a checksum of the
+# restaurant database they belong to and the number of the turn, so a server
+# can see that another server continued the dialog.
+#
+# The stores keep the saved dialogs in memory (a dictionary), in an SQLite
+# database or in files. WriteBehindStore collects the saved dialogs in memory
+# and writes them to another store in batches. It is only meant for a store
+# that is used by one server process, because other processes only see the
+# dialogs after they are written.
+#
+# Usage: python session_store.py (size of the saved dialogs, time to save and
+#        resume them, and the throughput of the stores)
+
+from abc import ABC, abstractmethod
+from DMS import DMS, WELCOME_UTTERANCES
+from preferences import ADDITIONAL_PREFS
+from restaurant_db import NO_RESULTS, SLOTS
+from transition_table import DMS_TABLE
+from urllib.parse import quote
+import copy
+import numpy as np
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+
+# Change this when the format of the saved dialogs changes.
+VERSION = 2
+# The start of a saved dialog: the version, the checksum of the database, the
+# number of the turn, the code of the state, the flags, the additional preferences, the codes of the
+# pricerange, area and food, the current suggestion and the number of
+# results. The results and the strings follow.
+HEADER = struct.Struct("<BIIBBBHHHII")
+# The length of a string.
+LENGTH = struct.Struct("<I")
+# The code of a state or preference that is saved as a string, because it
+# has no code in every process: a state without rules, or a preference that
+# is not in the database.
+STATE_STRING = 0xFF
+PREFERENCE_STRING = 0xFFFF
+# The flags.
+FORMAL = 1
+END_DIALOG = 2
+RESULTS_BITSET = 4
+# How the system utterance is saved (in the bits of the flags after these):
+# as a string, made again by update_utterance, or the welcome utterance.
+UTTERANCE_SHIFT = 3
+UTTERANCE_STRING = 0
+UTTERANCE_UPDATED = 1
+UTTERANCE_WELCOME = 2
+
+
+def utterance_kind(dms):
+    """
+    Returns how the system utterance of the DMS can be saved.
+    dms: the DMS
+    """
+    if dms.system_utterance == WELCOME_UTTERANCES[dms.formalOn]:
+        return UTTERANCE_WELCOME
+    updated = copy.copy(dms)
+    updated.system_utterance = None
+    try:
+        updated.update_utterance()
+    except Exception:
+        return UTTERANCE_STRING
+    return UTTERANCE_UPDATED if updated.system_utterance == dms.system_utterance else UTTERANCE_STRING
+
+
+def row_type(n_rows):
+    """
+    Returns the integer type of the saved row numbers of a database.
+    n_rows: the number of restaurants in the database.
+    """
+    return np.dtype("<u2") if n_rows <= 1 << 16 else np.dtype("<u4")
+
+
+def dumps(dms, turn=0):
+    """
+    Returns the state of the DMS as bytes.
+    dms: the DMS
+    turn: the number of the turn (the number of times the dialog was saved).
+    """
+    db = dms.db
+    strings = []
+    state = DMS_TABLE.state_codes.get(dms.state, STATE_STRING)
+    if state == STATE_STRING:
+        strings.append(dms.state)
+    preferences = []
+    for column in SLOTS:
+        code = getattr(dms, column)
+        if db.is_unknown(column, code):
+            strings.append(dms.preference(column))
+            code = PREFERENCE_STRING
+        preferences.append(code)
+    utterance = utterance_kind(dms)
+    if utterance == UTTERANCE_STRING:
+        strings.append(dms.system_utterance)
+
+    # The results as row numbers, or as a bitset of the database if that is
+    # smaller (the results are in the order of the database).
+    n_rows = len(db.data)
+    results = dms.results
+    bitset = len(results) > 1 and (n_rows + 7) // 8 < len(results) * row_type(n_rows).itemsize \
+        and bool(np.all(results[1:] > results[:-1]))
+    if bitset:
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[results] = True
+        results = np.packbits(mask).tobytes()
+    else:
+        results = results.astype(row_type(n_rows)).tobytes()
+
+    flags = (FORMAL * bool(dms.formalOn) | END_DIALOG * bool(dms.end_dialog) | RESULTS_BITSET * bitset
+             | utterance << UTTERANCE_SHIFT)
+    header = HEADER.pack(VERSION, db.fingerprint, turn, state, flags, dms.additional, *preferences,
+                         dms.current_suggestion, len(dms.results))
+    return b"".join([header, results] + [LENGTH.pack(len(string)) + string
+                                         for string in (string.encode() for string in strings)])
+
+
+def corrupt(reason):
+    """
+    Returns the error of a corrupt saved dialog.
+    reason: what is wrong with it
+    """
+    return ValueError(f"Corrupt saved dialog: {reason}")
+
+
+def read_header(data):
+    """
+    Returns the fields of the header of a saved dialog. Raises ValueError if
+    it is not a saved dialog of this version.
+    data: the bytes of dumps
+    """
+    if len(data) == 0 or data[0] != VERSION:
+        raise ValueError(f"Unknown version {bytes(data[:1])!r} of the saved dialog")
+    if len(data) < HEADER.size:
+        raise corrupt(f"{len(data)} bytes is shorter than the header")
+    return HEADER.unpack_from(data)
+
+
+def loads(data, classifier, db, extractor=None):
+    """
+    Returns the DMS of the saved state. Raises ValueError if the saved dialog
+    is corrupt, of another version or of another restaurant database.
+    data: the bytes of dumps
+    classifier: the classifier of the DMS
+    db: the RestaurantDB the DMS was saved with
+    extractor: the preference extractor, or None for the one of the database
+    """
+    _, fingerprint, _, state, flags, additional, *preferences, suggestion, n_results = read_header(data)
+    if fingerprint != db.fingerprint:
+        raise ValueError("The saved dialog belongs to another restaurant database")
+
+    utterance = flags >> UTTERANCE_SHIFT
+    if state >= len(DMS_TABLE.states) and state != STATE_STRING:
+        raise corrupt(f"unknown state {state}")
+    if utterance > UTTERANCE_WELCOME:
+        raise corrupt(f"unknown kind of utterance {utterance}")
+    if additional >= 1 << len(ADDITIONAL_PREFS):
+        raise corrupt(f"unknown additional preferences {additional}")
+    for column, code in zip(SLOTS, preferences):
+        if code >= db.n_values[column] and code != PREFERENCE_STRING:
+            raise corrupt(f"unknown {column} {code}")
+    if suggestion >= max(n_results, 1):
+        raise corrupt(f"suggestion {suggestion} of {n_results} results")
+
+    offset = HEADER.size
+    n_rows = len(db.data)
+    if n_results == 0:
+        results = NO_RESULTS
+    else:
+        size = (n_rows + 7) // 8 if flags & RESULTS_BITSET else n_results * row_type(n_rows).itemsize
+        if offset + size > len(data):
+            raise corrupt("the results are cut off")
+        if flags & RESULTS_BITSET:
+            results = np.flatnonzero(np.unpackbits(np.frombuffer(data, np.uint8, size, offset))).astype(np.int32)
+            if len(results) != n_results:
+                raise corrupt(f"{len(results)} results instead of {n_results}")
+        else:
+            results = np.frombuffer(data, row_type(n_rows), n_results, offset).astype(np.int32)
+        if results[-1] >= n_rows if flags & RESULTS_BITSET else results.max() >= n_rows:
+            raise corrupt("a result is not in the database")
+        offset += size
+    strings = []
+    while offset < len(data):
+        if offset + LENGTH.size > len(data):
+            raise corrupt("a string is cut off")
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        if offset + length > len(data):
+            raise corrupt("a string is cut off")
+        try:
+            strings.append(bytes(data[offset:offset + length]).decode())
+        except UnicodeDecodeError as error:
+            raise corrupt(error) from error
+        offset += length
+    n_strings = (state == STATE_STRING) + preferences.count(PREFERENCE_STRING) + (utterance == UTTERANCE_STRING)
+    if len(strings) != n_strings:
+        raise corrupt(f"{len(strings)} strings instead of {n_strings}")
+    strings.reverse()
+
+    dms = DMS.__new__(DMS)
+    dms.classifier = classifier
+    dms.db = db
+    dms.extractor = db.extractor if extractor is None else extractor
+    dms.formalOn = int(bool(flags & FORMAL))
+    dms.state = strings.pop() if state == STATE_STRING else DMS_TABLE.states[state]
+    dms.unknown = None
+    for column, code in zip(SLOTS, preferences):
+        if code == PREFERENCE_STRING:
+            dms.set_preference(column, strings.pop())
+        else:
+            setattr(dms, column, code)
+    dms.additional = additional
+    dms.results = results
+    dms.current_suggestion = suggestion
+
+    if utterance == UTTERANCE_STRING:
+        dms.system_utterance = strings.pop()
+    elif utterance == UTTERANCE_WELCOME:
+        dms.system_utterance = WELCOME_UTTERANCES[dms.formalOn]
+    else:
+        # dumps only saves this kind if the utterance can be made again.
+        try:
+            dms.update_utterance()
+        except Exception as error:
+            raise corrupt(f"the utterance cannot be made again ({error})") from error
+    dms.end_dialog = bool(flags & END_DIALOG)
+    return dms
+
+
+def saved_turn(data):
+    """
+    Returns the number of the turn of a saved dialog, without resuming it.
+    Raises ValueError if it is not a saved dialog of this version.
+    data: the bytes of dumps
+    """
+    return read_header(data)[2]
+
+
+class SessionStore(ABC):
+    """
+    A store of saved dialogs (bytes) by session id. A store implements get,
+    put_many and delete_many.
+    """
+
+    @abstractmethod
+    def get(self, session_id):
+        """
+        Returns the saved dialog of the session, or None.
+        """
+
+    @abstractmethod
+    def put_many(self, dialogs):
+        """
+        Save the dialogs.
+        dialogs: dictionary of session id to saved dialog.
+        """
+
+    @abstractmethod
+    def delete_many(self, session_ids):
+        """
+        Remove the saved dialogs of the sessions.
+        """
+
+    def put(self, session_id, dialog):
+        """
+        Save the dialog of the session.
+        """
+        self.put_many({session_id: dialog})
+
+    def delete(self, session_id):
+        """
+        Remove the saved dialog of the session.
+        """
+        self.delete_many([session_id])
+
+    def flush(self):
+        """
+        Write the dialogs that are not written yet.
+        """
+
+    def close(self):
+        """
+        Write the dialogs that are not written yet and close the store.
+        """
+        self.flush()
+
+
+class MemoryStore(SessionStore):
+    """
+    Keeps the saved dialogs in a dictionary, in the memory of this process.
+    """
+
+    def __init__(self):
+        self.dialogs = {}
+
+    def get(self, session_id):
+        return self.dialogs.get(session_id)
+
+    def put_many(self, dialogs):
+        self.dialogs.update(dialogs)
+
+    def delete_many(self, session_ids):
+        for session_id in session_ids:
+            self.dialogs.pop(session_id, None)
+
+
+class SQLiteStore(SessionStore):
+    """
+    Keeps the saved dialogs in a table of an SQLite database, which can be
+    shared by the processes on one machine.
+    """
+
+    def __init__(self, path):
+        """
+        path: the path to the database file.
+        """
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, dialog BLOB NOT NULL)")
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            row = self.connection.execute("SELECT dialog FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def put_many(self, dialogs):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?)", dialogs.items())
+            self.connection.execute("COMMIT")
+
+    def delete_many(self, session_ids):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.executemany("DELETE FROM sessions WHERE id = ?", [(id,) for id in session_ids])
+            self.connection.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class FileStore(SessionStore):
+    """
+    Keeps every saved dialog in a file in a directory, which can be shared by
+    processes (for example on a network drive).
+    """
+
+    def __init__(self, directory):
+        """
+        directory: the directory of the files.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, session_id):
+        """
+        Returns the path to the file of the session.
+        """
+        return os.path.join(self.directory, quote(session_id, safe="") + ".dialog")
+
+    def get(self, session_id):
+        try:
+            with open(self.path(session_id), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def put_many(self, dialogs):
+        for session_id, dialog in dialogs.items():
+            # The file is replaced at once, so it is never read half written.
+            file, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(file, "wb") as file:
+                file.write(dialog)
+            os.replace(temp_path, self.path(session_id))
+
+    def delete_many(self, session_ids):
+        for session_id in session_ids:
+            try:
+                os.remove(self.path(session_id))
+            except FileNotFoundError:
+                pass
+
+
+class WriteBehindStore(SessionStore):
+    """
+    Collects the saved dialogs in memory and writes them to another store in
+    batches: when batch_size dialogs are waiting, and every flush_interval
+    seconds. The dialogs that are waiting are read from memory.
+    """
+
+    def __init__(self, store, batch_size=256, flush_interval=0.1):
+        """
+        store: the store to write the dialogs to.
+        batch_size: the number of waiting dialogs that are written at once.
+        flush_interval: the time (in seconds) after which waiting dialogs are
+        written, or None to only write them when there are batch_size.
+        """
+        self.store = store
+        self.batch_size = batch_size
+        # Session id to saved dialog, or None for a removed dialog.
+        self.pending = {}
+        self.flushing = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = None
+        if flush_interval is not None:
+            self.thread = threading.Thread(target=self.flush_forever, args=(flush_interval,), daemon=True)
+            self.thread.start()
+
+    def flush_forever(self, flush_interval):
+        """
+        Write the waiting dialogs every flush_interval seconds, or as soon as
+        there are batch_size, until the store is closed.
+        """
+        while not self.closed:
+            self.wakeup.wait(flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def get(self, session_id):
+        with self.lock:
+            for dialogs in (self.pending, self.flushing):
+                if session_id in dialogs:
+                    return dialogs[session_id]
+        return self.store.get(session_id)
+
+    def put_many(self, dialogs):
+        with self.lock:
+            self.pending.update(dialogs)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            if self.thread is None:
+                self.flush()
+            else:
+                self.wakeup.set()
+
+    def delete_many(self, session_ids):
+        self.put_many(dict.fromkeys(session_ids))
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                self.flushing, self.pending = self.pending, {}
+            dialogs = {session_id: dialog for session_id, dialog in self.flushing.items() if dialog is not None}
+            removed = [session_id for session_id, dialog in self.flushing.items() if dialog is None]
+            if dialogs:
+                self.store.put_many(dialogs)
+            if removed:
+                self.store.delete_many(removed)
+            with self.lock:
+                self.flushing = {}
+
+    def close(self):
+        self.closed = True
+        if self.thread is not None:
+            self.wakeup.set()
+            self.thread.join()
+        self.flush()
+        self.store.close()
+
+
+def open_store(spec, write_behind=False):
+    """
+    Returns the store of the specification: "memory", "sqlite:PATH" or
+    "file:DIRECTORY". By default every dialog is written at once, so other
+    server processes see it.
+    spec: the specification of the store
+    write_behind: write the dialogs in batches (for a store that is only
+    used by one server process) or not
+    """
+    kind, _, path = spec.partition(":")
+    if kind == "memory":
+        return MemoryStore()
+    elif kind == "sqlite":
+        store = SQLiteStore(path)
+    elif kind == "file":
+        store = FileStore(path)
+    else:
+        raise ValueError(f"Unknown store {spec!r}, use memory, sqlite:PATH or file:DIRECTORY")
+    return WriteBehindStore(store) if write_behind else store
+
+
+if __name__ == '__main__':
+    from contextlib import redirect_stdout
+    from dialog_server import CONVERSATIONS
+    from forest_predictor import load_classifier
+    from prediction_cache import CachedClassifier
+    from restaurant_db import RestaurantDB
+    import io
+    import pickle
+    import time
+
+    classifier = CachedClassifier(load_classifier(), loader=load_classifier)
+    db = RestaurantDB.from_csv()
+
+    def state(dms):
+        return (dms.state, dms.formalOn, dms.end_dialog, dms.system_utterance, dms.pricerange, dms.area, dms.food,
+                dms.additional, list(dms.results), dms.current_suggestion)
+
+    # Save the dialog after every turn, and continue it from the saved dialog
+    # as another worker would; the dialogs must not change.
+    dialogs = []
+    states = []
+    with redirect_stdout(io.StringIO()):
+        for formal in [0, 1]:
+            for conversation in CONVERSATIONS:
+                dms = DMS(classifier, db)
+                dms.formalOn = formal
+                dms.update_utterance()
+                resumed = loads(dumps(dms), classifier, db)
+                for utterance in conversation:
+                    dms.transition(utterance)
+                    resumed.transition(utterance)
+                    assert state(resumed) == state(dms)
+                    dialogs.append(dumps(dms))
+                    states.append(state(dms))
+                    resumed = loads(dialogs[-1], classifier, db)
+                    assert state(resumed) == state(dms)
+    sizes = [len(dialog) for dialog in dialogs]
+    print(f"Saved dialogs: {len(dialogs)}, mean {np.mean(sizes):.0f} bytes, max {max(sizes)} bytes "
+          f"(pickle of the same state: mean {np.mean([len(pickle.dumps(state)) for state in states]):.0f} bytes)")
+
+    n = 20_000
+    start = time.perf_counter()
+    for i in range(n):
+        dumps(dms)
+    dumps_time = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for i in range(n):
+        loads(dialogs[i % len(dialogs)], classifier, db)
+    loads_time = (time.perf_counter() - start) / n
+    print(f"Save {dumps_time * 1e6:.1f} us, resume {loads_time * 1e6:.1f} us per dialog")
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'store':<24}{'write (dialogs/s)':>19}{'resume p50 (us)':>17}{'resume p99 (us)':>17}")
+        for spec, write_behind in [("memory", False), (f"sqlite:{directory}/sessions.db", False),
+                                   (f"sqlite:{directory}/batched.db", True), (f"file:{directory}/sessions", False),
+                                   (f"file:{directory}/batched", True)]:
+            store = open_store(spec, write_behind)
+            n_sessions = 20_000 if spec == "memory" or write_behind and spec.startswith("sqlite") else 2_000
+            start = time.perf_counter()
+            for i in range(n_sessions):
+                store.put(f"session{i}", dialogs[i % len(dialogs)])
+            store.flush()
+            write_rate = n_sessions / (time.perf_counter() - start)
+
+            # Resume from the underlying store, as another worker would.
+            reader = store.store if isinstance(store, WriteBehindStore) else store
+            latencies = []
+            for i in range(0, n_sessions, 7):
+                start = time.perf_counter()
+                resumed = loads(reader.get(f"session{i}"), classifier, db)
+                latencies.append(time.perf_counter() - start)
+            p50, p99 = np.percentile(latencies, [50, 99])
+            name = spec.partition(":")[0] + (" (write-behind)" if write_behind else "")
+            print(f"{name:<24}{write_rate:>19.0f}{p50 * 1e6:>17.1f}{p99 * 1e6:>17.1f}")
+            store.close()
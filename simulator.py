@@ -0,0 +1,476 @@
+# This file implements a simulated user, to measure the dialog system without
+# a human at input(). Every simulated user has a goal sampled from the
+# restaurant database (a food type, area, price range and sometimes an
+# additional preference) and phrases its turns with templates mined from
+# dialog_acts.dat, optionally with typos. Many simulated dialogs are run
+# concurrently through the DMS (DMS.py), or through utils.act and
+# utils.transition (the state machine of system.py) with the simulated user in
+# place of input(). The simulator reports the turns per second, the latency
+# percentiles of every stage of a turn, the success rate and the average
+# number of turns to success.
+#
+# Usage: python simulator.py [--system dms|utils] [--dialogs 1000] [--concurrency 8]
+#                            [--typos 0.05] [--batched] [--formal] [--seed 0]
+
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from corpus_cache import DATA_DIR, corpus
+from DMS import DMS
+from preferences import ADDITIONAL_PREFS
+from restaurant_db import ANY, SLOTS
+import numpy as np
+import random
+import re
+import string
+import time
+import traceback
+import utils
+
+# The maximal number of user turns of a dialog; after these the user gives up.
+MAX_TURNS = 25
+# The probability that a goal has an additional preference.
+ADDITIONAL_RATE = 0.5
+# Templates of the additional preferences, which are not in dialog_acts.dat.
+ADDITIONAL_TEMPLATES = {"touristic": ["touristic", "a touristic place please", "it should be touristic"],
+                        "assigned seats": ["assigned seats", "i want assigned seats", "with assigned seats please"],
+                        "children": ["children", "i am bringing children", "it should be good for children"],
+                        "romantic": ["romantic", "a romantic place please", "it should be romantic"]}
+# Templates of the dialog acts that are not mined, or of which too few are.
+DEFAULT_TEMPLATES = {"reqmore": ["more"], "negate": ["no"], "affirm": ["yes"], "bye": ["bye"],
+                     "request": ["what is the address"]}
+# The words of a request for the information of the suggested restaurant.
+CONTACT_WORDS = ["address", "phone", "post code", "postcode"]
+# The states in which the system has a suggestion.
+SUGGESTION_STATES = ["TellLookupResults", "OfferFurtherInformation", "AskForAcceptance"]
+
+# The goal of a simulated user: the preferences, the additional preference
+# (or None) and the row numbers of the restaurants that satisfy them.
+Goal = namedtuple("Goal", ["pricerange", "area", "food", "additional", "rows"])
+
+
+class Templates:
+    """
+    Utterance templates by dialog act, and inform templates by the
+    preferences they mention (a tuple in the order of SLOTS, with
+    placeholders like "{food}"). Templates are sampled by the number of times
+    they occur in the data.
+    """
+
+    def __init__(self, db, data_dir=DATA_DIR, min_count=2):
+        """
+        db: the RestaurantDB, whose values are replaced by placeholders.
+        data_dir: data file with labeled utterances.
+        min_count: the minimal number of occurrences of an utterance of
+        another dialog act than inform.
+        """
+        labels, sentences = corpus(data_dir)
+        patterns = {column: re.compile(r"\b(" + "|".join(re.escape(value) for value in sorted(
+            db.values[column][ANY + 1:], key=len, reverse=True)) + r")\b") for column in SLOTS}
+        # Words that start with a value ("moderately"), which the preference
+        # extractor may recognize.
+        prefixes = re.compile(r"\b(" + "|".join(pattern.pattern[3:-3] for pattern in patterns.values()) + ")")
+        # A value of every preference, to check that the extractor finds
+        # exactly the preferences of an inform template.
+        examples = {column: db.values[column][ANY + 1] for column in SLOTS}
+        counts = defaultdict(Counter)
+        for (label, sentence), count in Counter(zip(labels, sentences)).items():
+            label = str(label)
+            if label == "inform":
+                template, slots = sentence, []
+                for column in SLOTS:
+                    found = patterns[column].findall(template)
+                    # Templates that mention a preference twice are skipped.
+                    if len(found) > 1:
+                        break
+                    if found:
+                        template = patterns[column].sub("{" + column + "}", template)
+                        slots.append(column)
+                else:
+                    if slots and not prefixes.search(template) and self.extracts(db, template, slots, examples):
+                        counts[tuple(slots)][template] += count
+            elif count >= min_count and not any(pattern.search(sentence) for pattern in patterns.values()):
+                if label != "request" or any(word in sentence for word in CONTACT_WORDS):
+                    counts[label][sentence] += count
+        for label, templates in DEFAULT_TEMPLATES.items():
+            if label not in counts:
+                counts[label].update(templates)
+
+        # The templates and their cumulative weights, by key.
+        self.templates = {}
+        for key, templates in counts.items():
+            self.templates[key] = (list(templates), list(np.cumsum(list(templates.values()))))
+
+    @staticmethod
+    def extracts(db, template, slots, examples):
+        """
+        Returns whether the preference extractor finds exactly the
+        preferences of the template, filled with the example values.
+        db: the RestaurantDB with the preference extractor.
+        template: the inform template
+        slots: the preferences in the template.
+        examples: dictionary of preference to the value to fill in.
+        """
+        for column in slots:
+            template = template.replace("{" + column + "}", examples[column])
+        area, food, pricerange = db.extractor.extract_prefs(template)
+        found = {"area": area, "food": food, "pricerange": pricerange}
+        return all(found[column] == (examples[column] if column in slots else "") for column in SLOTS)
+
+    def sample(self, generator, key):
+        """
+        Returns a random template of the key.
+        generator: random.Random
+        key: a dialog act, or a tuple of preferences.
+        """
+        templates, weights = self.templates[key]
+        return generator.choices(templates, cum_weights=weights)[0]
+
+    def inform(self, generator, goal, slots):
+        """
+        Returns an utterance that informs the preferences of the goal.
+        generator: random.Random
+        goal: the Goal
+        slots: the preferences to mention, in the order of SLOTS.
+        """
+        if slots in self.templates:
+            template = self.sample(generator, slots)
+        else:
+            template = " ".join("{" + column + "}" for column in slots)
+        for column in slots:
+            template = template.replace("{" + column + "}", getattr(goal, column))
+        return template
+
+
+def add_typos(text, rate, generator):
+    """
+    Returns the text with typos: every word of more than three letters gets
+    a typo (a deleted, swapped, replaced or inserted letter) with the given
+    probability.
+    text: the utterance
+    rate: the probability of a typo per word
+    generator: random.Random
+    """
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        if len(word) > 3 and generator.random() < rate:
+            position = generator.randrange(len(word) - 1)
+            match generator.randrange(4):
+                case 0:
+                    word = word[:position] + word[position + 1:]
+                case 1:
+                    word = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+                case 2:
+                    word = word[:position] + generator.choice(string.ascii_lowercase) + word[position + 1:]
+                case 3:
+                    word = word[:position] + generator.choice(string.ascii_lowercase) + word[position:]
+            words[i] = word
+    return " ".join(words)
+
+
+def sample_goal(db, generator, additional_rate=ADDITIONAL_RATE):
+    """
+    Returns the goal of a simulated user: the preferences of a random
+    restaurant, and with the given probability an additional preference that
+    the restaurant satisfies.
+    db: the RestaurantDB
+    generator: random.Random
+    additional_rate: the probability of an additional preference.
+    """
+    while True:
+        row = generator.randrange(len(db.data))
+        codes = [int(db.codes[column][row]) for column in SLOTS]
+        # Restaurants with a missing preference cannot be asked for.
+        if min(codes) > ANY:
+            break
+    additional = None
+    if generator.random() < additional_rate:
+        satisfied = [pref for bit, pref in enumerate(ADDITIONAL_PREFS) if row in db.lookup(codes, 1 << bit)]
+        if satisfied:
+            additional = generator.choice(satisfied)
+    mask = 0 if additional is None else 1 << ADDITIONAL_PREFS.index(additional)
+    return Goal(*[db.decode(column, code) for column, code in zip(SLOTS, codes)], additional,
+                frozenset(db.lookup(codes, mask).tolist()))
+
+
+class SimulatedUser:
+    """
+    A user with a goal, who answers the system depending on its state and
+    the suggested restaurant.
+    """
+
+    def __init__(self, goal, templates, generator, typo_rate=0.0):
+        """
+        goal: the Goal of the user.
+        templates: the Templates of the utterances.
+        generator: random.Random of the user.
+        typo_rate: the probability of a typo per word.
+        """
+        self.goal = goal
+        self.templates = templates
+        self.random = generator
+        self.typo_rate = typo_rate
+        # The number of user turns, and the number of user turns before a
+        # restaurant of the goal was suggested (None if not yet).
+        self.turns = 0
+        self.success_turns = None
+        # Whether the user mentioned its preferences and its additional
+        # preference.
+        self.informed = False
+        self.informed_additional = False
+
+    def respond(self, state, suggestion):
+        """
+        Returns the next user utterance.
+        state: the state of the system.
+        suggestion: the row number of the suggested restaurant, or None.
+        """
+        satisfied = suggestion is not None and suggestion in self.goal.rows
+        if satisfied and self.success_turns is None:
+            self.success_turns = self.turns
+        self.turns += 1
+
+        match state:
+            case "Welcome" | "RequestPreferences" if not self.informed:
+                # First mention some of the preferences.
+                slots = tuple(column for column in SLOTS if self.random.random() < 0.6) or (self.random.choice(SLOTS),)
+                utterance = self.templates.inform(self.random, self.goal, slots)
+                self.informed = True
+            case "AskFoodType":
+                utterance = self.templates.inform(self.random, self.goal, ("food",))
+            case "AskArea":
+                utterance = self.templates.inform(self.random, self.goal, ("area",))
+            case "AskPriceRange":
+                utterance = self.templates.inform(self.random, self.goal, ("pricerange",))
+            case "AskForFurtherRequirements" | "AskForFurtherPreferences":
+                if self.goal.additional is None or self.informed_additional:
+                    utterance = self.templates.sample(self.random, "negate")
+                else:
+                    utterance = self.random.choice(ADDITIONAL_TEMPLATES[self.goal.additional])
+                    self.informed_additional = True
+            case "TellLookupResults" if suggestion is not None:
+                utterance = self.templates.sample(self.random, "request" if satisfied else "reqmore")
+            case "OfferFurtherInformation":
+                utterance = self.templates.sample(self.random, "bye" if satisfied else "reqmore")
+            case "AskForAcceptance":
+                utterance = self.templates.sample(self.random, "affirm" if satisfied else "negate")
+            case _:
+                # No results, or the system asks again: mention every
+                # preference.
+                utterance = self.templates.inform(self.random, self.goal, tuple(SLOTS))
+        return add_typos(utterance, self.typo_rate, self.random) if self.typo_rate > 0 else utterance
+
+
+class TimedClassifier:
+    """
+    Classifier that keeps the time of every prediction.
+    """
+
+    def __init__(self, classifier, latencies):
+        """
+        classifier: the classifier of the dialog acts.
+        latencies: list the times (in seconds) are appended to.
+        """
+        self.classifier = classifier
+        self.latencies = latencies
+
+    def predict(self, sentences):
+        start = time.perf_counter()
+        dialog_acts = self.classifier.predict(sentences)
+        self.latencies.append(time.perf_counter() - start)
+        return dialog_acts
+
+
+def run_dms(user, classifier, db, timings, formal=False, max_turns=MAX_TURNS):
+    """
+    Hold a dialog between the simulated user and the DMS. Returns whether the
+    system ended the dialog.
+    user: the SimulatedUser
+    classifier: the classifier of the dialog acts.
+    db: the RestaurantDB
+    timings: dictionary of stage to the list of latencies (in seconds).
+    formal: use the formal system utterances or not.
+    max_turns: the number of user turns after which the user gives up.
+    """
+    dms = DMS(TimedClassifier(classifier, timings["classify"]), db)
+    if formal:
+        dms.formalOn = 1
+        dms.update_utterance()
+    for _ in range(max_turns):
+        start = time.perf_counter()
+        has_suggestion = dms.state in SUGGESTION_STATES and len(dms.results) > 0
+        utterance = user.respond(dms.state, int(dms.results[dms.current_suggestion]) if has_suggestion else None)
+        user_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dms.transition(utterance)
+        system_time = time.perf_counter() - start
+        timings["user"].append(user_time)
+        timings["dms"].append(system_time - timings["classify"][-1])
+        timings["turn"].append(user_time + system_time)
+        if dms.end_dialog:
+            return True
+    return False
+
+
+def run_utils(user, classifier, db, timings, formal=False, max_turns=MAX_TURNS):
+    """
+    Hold a dialog between the simulated user and the state machine of
+    utils.py, as system.py does with a human. Returns whether the system
+    ended the dialog.
+    user: the SimulatedUser
+    classifier: the classifier of the dialog acts.
+    db: the RestaurantDB
+    timings: dictionary of stage to the list of latencies (in seconds).
+    formal: use the formal system utterances or not.
+    max_turns: the number of user turns after which the user gives up.
+    """
+    state_info = {"current_state": "Welcome", "end_conversation": False, "formalOn": int(formal)}
+    user_times = []
+
+    def ask(system_utterance):
+        # After the welcome, act keeps the state dictionary it was given.
+        start = time.perf_counter()
+        has_suggestion = state_info["current_state"] in SUGGESTION_STATES and len(state_info["results"]) > 0
+        suggestion = int(state_info["results"][state_info["current_suggestion"]]) if has_suggestion else None
+        utterance = user.respond(state_info["current_state"], suggestion)
+        user_times.append(time.perf_counter() - start)
+        return utterance
+
+    for _ in range(max_turns + 1):
+        start = time.perf_counter()
+        state_info, user_input = utils.act(db, state_info, db.extractor, ask=ask, say=lambda text: None)
+        act_time = time.perf_counter() - start
+        if state_info["end_conversation"]:
+            return True
+
+        start = time.perf_counter()
+        dialog_act = classifier.predict([user_input])[0]
+        classify_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        state_info = utils.transition(state_info, dialog_act)
+        transition_time = time.perf_counter() - start
+        timings["user"].append(user_times[-1])
+        timings["act"].append(act_time - user_times[-1])
+        timings["classify"].append(classify_time)
+        timings["transition"].append(transition_time)
+        timings["turn"].append(act_time + classify_time + transition_time)
+        if user.turns >= max_turns:
+            break
+    return False
+
+
+def simulate(system, classifier, db, n_dialogs, concurrency=8, typo_rate=0.0, formal=False, seed=0,
+             max_turns=MAX_TURNS, templates=None):
+    """
+    Run simulated dialogs concurrently and returns a dictionary with the
+    number of dialogs, turns, successes, dialogs the user gave up on, errors
+    (and the traceback of the first one), the elapsed time, the turns of the successful dialogs until success and
+    the latencies (in seconds) of every stage of a turn. A dialog succeeds
+    when a restaurant of the goal was suggested and the system ended the
+    dialog.
+    system: "dms" or "utils"
+    classifier: the classifier of the dialog acts, shared by the dialogs.
+    db: the RestaurantDB
+    n_dialogs: the number of dialogs.
+    concurrency: the number of dialogs that are held at the same time.
+    typo_rate: the probability of a typo per word of the user.
+    formal: use the formal system utterances or not.
+    seed: the seed of the goals and utterances; dialog i uses seed + i.
+    max_turns: the number of user turns after which the user gives up.
+    templates: the Templates, or None to mine them.
+    """
+    run = {"dms": run_dms, "utils": run_utils}[system]
+    if templates is None:
+        templates = Templates(db)
+
+    def dialog(i):
+        generator = random.Random(seed + i)
+        user = SimulatedUser(sample_goal(db, generator), templates, generator, typo_rate)
+        timings = defaultdict(list)
+        # The traceback of the exception that ended the dialog, if any.
+        error = None
+        try:
+            ended = run(user, classifier, db, timings, formal, max_turns)
+        except Exception:
+            ended, error = False, traceback.format_exc()
+        return user, ended, error, timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        dialogs = list(executor.map(dialog, range(n_dialogs)))
+    elapsed = time.perf_counter() - start
+
+    latencies = defaultdict(list)
+    for *_, timings in dialogs:
+        for stage, times in timings.items():
+            latencies[stage].extend(times)
+    return {"dialogs": n_dialogs,
+            "turns": sum(user.turns for user, *_ in dialogs),
+            "successes": sum(ended and user.success_turns is not None for user, ended, *_ in dialogs),
+            "success_turns": [user.success_turns for user, ended, *_ in dialogs
+                              if ended and user.success_turns is not None],
+            "gave_up": sum(not ended and error is None for _, ended, error, _ in dialogs),
+            "errors": sum(error is not None for _, _, error, _ in dialogs),
+            "first_error": next((error for _, _, error, _ in dialogs if error is not None), None),
+            "elapsed": elapsed,
+            "latencies": dict(latencies)}
+
+
+def report(results):
+    """
+    Print the throughput, the success rate, the latency percentiles and the
+    traceback of the first error of the results of simulate.
+    """
+    print(f"{results['dialogs']} dialogs, {results['turns']} turns in {results['elapsed']:.2f} s: "
+          f"{results['turns'] / results['elapsed']:.0f} turns/s")
+    average = np.mean(results["success_turns"]) if results["success_turns"] else float("nan")
+    print(f"Success rate {results['successes'] / results['dialogs']:.1%}, average turns to success {average:.1f} "
+          f"(gave up {results['gave_up']}, errors {results['errors']})")
+    print(f"{'stage':<12}{'p50 (us)':>10}{'p90 (us)':>10}{'p99 (us)':>10}")
+    for stage, times in results["latencies"].items():
+        # A stage has no latencies when every dialog failed before it.
+        if len(times) == 0:
+            continue
+        p50, p90, p99 = np.percentile(times, [50, 90, 99]) * 1e6
+        print(f"{stage:<12}{p50:>10.0f}{p90:>10.0f}{p99:>10.0f}")
+    if results["first_error"] is not None:
+        print(f"First of {results['errors']} errors:")
+        print(results["first_error"], end="")
+
+
+if __name__ == '__main__':
+    from classification_service import BatchingClassifier
+    from contextlib import redirect_stdout
+    from forest_predictor import load_classifier
+    from prediction_cache import CachedClassifier
+    from restaurant_db import RestaurantDB
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Run simulated users against the dialog system.")
+    parser.add_argument("--system", choices=["dms", "utils"], default="dms",
+                        help="the DMS, or the state machine of utils.py")
+    parser.add_argument("--dialogs", type=int, default=1000, help="the number of dialogs")
+    parser.add_argument("--concurrency", type=int, default=8, help="the number of dialogs held at the same time")
+    parser.add_argument("--typos", type=float, default=0.0, help="the probability of a typo per word")
+    parser.add_argument("--batched", action="store_true",
+                        help="classify the utterances of concurrent dialogs in batches")
+    parser.add_argument("--formal", action="store_true", help="use formal system utterances")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the goals and utterances")
+    args = parser.parse_args()
+
+    classifier = CachedClassifier(load_classifier(), loader=load_classifier)
+    if args.batched:
+        classifier = BatchingClassifier(classifier)
+    db = RestaurantDB.from_csv()
+
+    # The preference extractor prints when it does not recognize a preference.
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        templates = Templates(db)
+        results = simulate(args.system, classifier, db, args.dialogs, args.concurrency, args.typos, args.formal,
+                           args.seed, templates=templates)
+    print(f"System: {args.system}, concurrency {args.concurrency}, typo rate {args.typos}")
+    report(results)
+    if args.batched:
+        classifier.close()
@@ -0,0 +1,99 @@
+# This file implements an Aho-Corasick automaton to find all mentions of a set
+# of phrases in a text in a single pass over the text. It is used to recognize
+# the preferences (also multi-word preferences such as "modern european") and
+# the additional preferences in the user input.
+
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Automaton that finds all occurrences of a set of phrases in a text. Every
+    phrase has a value that is returned when the phrase is found.
+    """
+
+    def __init__(self, phrases):
+        """
+        phrases: list of (phrase, value) tuples. If a phrase occurs more than
+        once, the first value is kept.
+        """
+        # The trie: goto[state][char] is the next state.
+        self.goto = [{}]
+        # The state to continue from when a character does not match.
+        self.fail = [0]
+        # The (phrase length, value) tuples of the phrases ending in a state.
+        self.output = [[]]
+
+        for phrase, value in phrases:
+            if phrase == "":
+                continue
+            state = 0
+            for char in phrase:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            if len(self.output[state]) == 0:
+                self.output[state].append((len(phrase), value))
+
+        # Compute the failure links breadth-first, so that the link of the
+        # parent is known. A state also outputs the phrases of its failure
+        # state, which are suffixes of its own phrase.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+        """
+        Returns a list of (start, end, value) tuples of all occurrences of the
+        phrases in the text, ordered by their end position.
+        text: the text to search in.
+        """
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                matches.append((i + 1 - length, i + 1, value))
+        return matches
+
+    def find_words(self, words):
+        """
+        Returns a list of (index, number of words, value) tuples of the
+        phrases that consist of whole words. Overlapping mentions are resolved
+        by taking the leftmost and then the longest one.
+        words: list of words forming the sentence.
+        """
+        # Map the character positions where words start and end to the
+        # index of the word.
+        starts, ends = {}, {}
+        position = 0
+        for idx, word in enumerate(words):
+            starts[position] = idx
+            position += len(word)
+            ends[position] = idx + 1
+            position += 1
+
+        matches = sorted(((starts[start], ends[end] - starts[start], value)
+                          for start, end, value in self.find_all(" ".join(words))
+                          if start in starts and end in ends),
+                         key=lambda match: (match[0], -match[1]))
+
+        mentions = []
+        covered = 0
+        for idx, length, value in matches:
+            if idx >= covered:
+                mentions.append((idx, length, value))
+                covered = idx + length
+        return mentions
@@ -0,0 +1,121 @@
+# This file measures how long it takes before the chatbot (program.py) greets
+# the user. It reports the import time of the modules of the chatbot and the
+# time from starting the program to the welcome utterance, and fails when the
+# start-up time regresses: when it exceeds the baseline measured earlier on the
+# same machine by more than the tolerance, or a budget given in seconds.
+#
+# Usage: python startup_benchmark.py [--budget seconds] [--runs 5] [--save-baseline]
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+# The median time to the welcome utterance measured earlier on this machine.
+BASELINE_DIR = "data/cache/startup_baseline.json"
+# The allowed increase of the median time over the baseline.
+TOLERANCE = 0.25
+RUNS = 5
+# The number of slowest third party packages that are reported.
+TOP_PACKAGES = 5
+
+
+def import_times(module):
+    """
+    Returns a dictionary of the cumulative import time (in seconds) of every
+    module imported when importing the given module, measured in a new
+    interpreter with -X importtime.
+    module: the name of the module to import.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            times[match.group(3)] = int(match.group(1)) / 1e6
+    return times
+
+
+def time_to_welcome():
+    """
+    Returns the time (in seconds) from starting program.py until it has 
+    printed the welcome utterance and waits for user input.
+    """
+    start = time.perf_counter()
+    program = subprocess.Popen([sys.executable, "program.py"], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # The welcome utterance is flushed when the program asks for input.
+    welcome = program.stdout.readline()
+    elapsed = time.perf_counter() - start
+    program.communicate("quit\n")
+    if "Welcome" not in welcome:
+        raise RuntimeError(f"program.py did not print the welcome utterance but: {welcome!r}")
+    return elapsed
+
+
+def read_baseline(baseline_dir=BASELINE_DIR):
+    """
+    Returns the stored baseline time (in seconds) to the welcome utterance,
+    or None if there is none.
+    baseline_dir: the file with the baseline
+    """
+    if not os.path.exists(baseline_dir):
+        return None
+    with open(baseline_dir) as file:
+        return json.load(file)["median"]
+
+
+def save_baseline(median, baseline_dir=BASELINE_DIR):
+    """
+    Store the median time (in seconds) to the welcome utterance as the
+    baseline.
+    median: the median time
+    baseline_dir: the file with the baseline
+    """
+    os.makedirs(os.path.dirname(baseline_dir), exist_ok=True)
+    with open(baseline_dir, "w") as file:
+        json.dump({"median": median}, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the start-up time of the chatbot.")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="maximal median time in seconds, instead of the stored baseline")
+    parser.add_argument("--runs", type=int, default=RUNS, help="number of runs")
+    parser.add_argument("--save-baseline", action="store_true", help="store the median as the new baseline")
+    args = parser.parse_args()
+
+    # The modules of the chatbot and the slowest third party packages.
+    times = import_times("program")
+    own = [name for name in times if os.path.exists(f"{name}.py")]
+    packages = sorted((name for name in times if "." not in name and name not in own),
+                      key=times.get, reverse=True)[:TOP_PACKAGES]
+    print("Cumulative import time per module:")
+    for name in own + packages:
+        print(f"  {name:<20} {times[name] * 1e3:8.1f} ms")
+
+    results = sorted(time_to_welcome() for _ in range(args.runs))
+    median = results[len(results) // 2]
+    print(f"Time to the welcome utterance: median {median:.3f}s, "
+          f"min {results[0]:.3f}s, max {results[-1]:.3f}s ({args.runs} runs)")
+
+    budget = args.budget
+    baseline = read_baseline()
+    if args.save_baseline or (budget is None and baseline is None):
+        # The first run on a machine is the baseline of the later runs.
+        save_baseline(median)
+        print(f"Saved {median:.3f}s as the baseline in {BASELINE_DIR}")
+    elif budget is None:
+        budget = baseline * (1 + TOLERANCE)
+        print(f"Baseline {baseline:.3f}s, allowed {TOLERANCE:.0%} slower")
+    if budget is None:
+        sys.exit(0)
+
+    if median > budget:
+        print(f"FAILED: the start-up time exceeds the budget of {budget:.3f}s")
+        sys.exit(1)
+    print(f"OK: within the budget of {budget:.3f}s")
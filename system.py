@@ -1,8 +1,9 @@
 import time
 from utils import *
 import pandas as pd
-from joblib import load
-from classifiers import vectorizeUnknown
+from forest_predictor import load_classifier
+from prediction_cache import CachedClassifier
+from preferences import PreferenceExtractor
 
 intro_text = "PLEASE READ THE INFORMATION BELOW\n\nThank you in advance for using this chatbot. Below are a couple of instructions that will help you understand what the chatbot is capable of:\n" \
              "  a. The chatbot will start by asking for your restaurant preferences. You can mention three types of preferences, namely food type, price range and area.\n" \
@@ -31,21 +32,21 @@ intro_text = "PLEASE READ THE INFORMATION BELOW\n\nThank you in advance for usin
 print(intro_text)
 time.sleep(3)
 print("VERSION A\n")
-def classify(vectorizer, classifier, user_input):
-    user_input = vectorizeUnknown(vectorizer, user_input)
-
-    vectorized_sentence =vectorizer.transform([user_input])
-    return classifier.predict(vectorized_sentence)
+def classify(classifier, user_input):
+    return classifier.predict([user_input])[0]
 
 DIR = "data/restaurant_info_additionalpref.csv"
 data = pd.read_csv(DIR)
-classifier = load("data/classifier.joblib")
-vectorizer = load("data/vectorizer.joblib")
+# One extractor is shared by both versions of the chatbot.
+extractor = PreferenceExtractor(data)
+# The exported random forest, or the pipeline of the vectorizer and classifier,
+# behind a cache of the dialog acts of common sentences
+classifier = CachedClassifier(load_classifier(), loader=load_classifier)
 
 state_info = {"current_state": "Welcome", "end_conversation": False, "formalOn": 0}
 while True and not state_info["end_conversation"]:
-    state_info, user_input = act(data, state_info)
-    dialog_act = classify(vectorizer, classifier, user_input)
+    state_info, user_input = act(data, state_info, extractor)
+    dialog_act = classify(classifier, user_input)
     state_info = transition(state_info, dialog_act)
 
 time.sleep(1)
@@ -54,8 +55,8 @@ time.sleep(2)
 
 state_info = {"current_state": "Welcome", "end_conversation": False, "formalOn": 1}
 while True and not state_info["end_conversation"]:
-    state_info, user_input = act(data, state_info)
-    dialog_act = classify(vectorizer, classifier, user_input)
+    state_info, user_input = act(data, state_info, extractor)
+    dialog_act = classify(classifier, user_input)
     state_info = transition(state_info, dialog_act)
 
 print("Thank you again for taking part in this research. You are now asked to fill out a questionnaire. Have a nice day!")
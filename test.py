@@ -1,9 +1,10 @@
-from joblib import load
+from forest_predictor import load_classifier
+from prediction_cache import CachedClassifier
 import pandas as pd
-from classifiers import vectorizeUnknown
 
-classifier = load("data/classifier.joblib")
-vectorizer = load("data/vectorizer.joblib")
+# The exported random forest, or the pipeline of the vectorizer and classifier,
+# behind a cache of the dialog acts of common sentences
+classifier = CachedClassifier(load_classifier(), loader=load_classifier)
 
 data = {"text": [], "dialog_act": []}
 
@@ -15,8 +16,7 @@ while True:
         #df.to_excel("output.xlsx")
         quit()
 
-    vect = vectorizer.transform([vectorizeUnknown(vectorizer, user_input)])
-    dialog_act = classifier.predict(vect)
+    dialog_act = classifier.predict([user_input])
 
     data["text"].append(user_input)
     data["dialog_act"].append(dialog_act)
@@ -0,0 +1,406 @@
+# This file checks that the state machines driven by the dialog policy tables
+# (transition_table.py) behave exactly like the state machines they replace:
+# the nested match on the state and the dialog act of the DMS, and the
+# transition functions of transition_handles.py for utils.py. Every state
+# (also states without rules), every dialog act (also an unknown one) and a
+# set of preferences, additional preferences, results and user inputs are
+# replayed through both, and the states after the transition are compared.
+# It also reports the time per transition.
+#
+# Usage: python transition_check.py
+
+from DMS import DMS
+from restaurant_db import RestaurantDB
+from transition_handles import *
+from transition_table import DIALOG_ACTS, DMS_TABLE, UTILS_TABLE
+import contextlib
+import copy
+import io
+import itertools
+import numpy as np
+import random
+import sys
+import time
+import utils
+
+# The user inputs of the replayed transitions: preferences, an additional
+# preference, an unknown preference and nothing.
+USER_INPUTS = ["cheap chinese food in the north", "romantic", "xyzzy food", ""]
+# The preferences (food, area, pricerange) and additional preferences the
+# replayed transitions start with.
+PREFERENCES = [("", "", ""), ("italian", "", ""), ("italian", "south", ""), ("italian", "south", "expensive"),
+               ("any", "any", "any"), ("korean", "west", "cheap")]
+ADDITIONAL = [0, 0b1000, 0b1111]
+# The results (row numbers) and the current suggestion the replayed
+# transitions start with.
+RESULTS = [([], 0), ([3], 0), ([3, 5, 8], 0), ([3, 5, 8], 2)]
+
+
+def reference_dms_transition(dms, dialog_act, user_input):
+    """
+    The transition of the DMS as it was before the policy table: a nested
+    match on the state and the dialog act.
+    dms: the DMS
+    dialog_act: the dialog act of the user input
+    user_input: the user input
+    """
+    match dms.state:
+        case "Welcome":
+            match dialog_act:
+                case "thankyou" | "bye":
+                    dms.state = "Exit"
+                case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "reqmore" | "request":
+                    dms.state = "RequestPreferences"
+                case "inform" | "reqalts":
+                    # Update the user preferences if present in the input
+                    dms.update_preferences(user_input)
+                    # Change the state
+                    dms.choose_and_set_state()
+                case "restart" | "repeat":
+                    pass
+
+        case "RequestPreferences":
+            match dialog_act:
+                case "thankyou" | "bye":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "Welcome"
+                    # Initialize the preferences, so no preference for now.
+                    dms.set_initial_values()
+                case "inform" | "reqalts":
+                    dms.update_preferences(user_input)
+                    dms.choose_and_set_state()
+                case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
+                    pass
+
+        case "AskFoodType":
+            match dialog_act:
+                case "thankyou" | "bye":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "Welcome"
+                    dms.set_initial_values()
+                case "inform" | "reqalts":
+                    dms.update_preferences(user_input)
+                    dms.choose_and_set_state()
+                case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
+                    pass
+
+        case "AskArea":
+            match dialog_act:
+                case "thankyou" | "bye":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "Welcome"
+                    dms.set_initial_values()
+                case "inform" | "reqalts":
+                    dms.update_preferences(user_input)
+                    dms.choose_and_set_state()
+                case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
+                    pass
+
+        case "AskPriceRange":
+            match dialog_act:
+                case "thankyou" | "bye":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "Welcome"
+                    dms.set_initial_values()
+                case "inform" | "reqalts":
+                    dms.update_preferences(user_input)
+                    dms.choose_and_set_state()
+                case "ack" | "affirm" | "confirm" | "deny" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
+                    pass
+
+        case "AskForFurtherRequirements":
+            match dialog_act:
+                case "thankyou" | "bye":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "welcome"
+                    dms.set_initial_values()
+                case "inform" | "reqalts":
+                    # Collect any additional preferences
+                    dms.retrieve_extra_preferences(user_input)
+                    # Lookup results that satisfy the (additional) 
+                    # preferences given by the user.
+                    dms.results = dms.lookup()
+                    dms.state = "TellLookupResults"
+                case "deny":
+                    dms.state = "RequestPreferences"
+                case "affirm":
+                    dms.state = "RequestPreferences"
+                case "negate":
+                    dms.choose_and_set_state()
+                case "ack"| "confirm" | "hello"| "null" | "repeat" | "reqmore" | "request":
+                    pass
+
+        case "TellLookupResults":
+            if len(dms.results) > 0:
+                match dialog_act:
+                    case "thankyou" | "bye":
+                        dms.state = "Exit"
+                    case "restart":
+                        dms.state = "Welcome"
+                        dms.set_initial_values()
+                    case "ack" | "affirm" | "request":
+                        # Offer the information about the restaurant,
+                        # which is collected from the database by
+                        # update_utterance.
+                        dms.state = "OfferFurtherInformation"
+                    case "deny":
+                        dms.state = "RequestPreferences"
+                    case "inform" | "reqalts":
+                        dms.update_preferences(user_input)
+                        dms.results = dms.lookup()
+                        dms.state = "TellLookupResults"
+                    case "reqmore":
+                        dms.choose_and_set_state(reqmore=True)
+                    case "confirm" | "hello" | "negate" | "null" | "repeat":
+                        return
+            else:
+                match dialog_act:
+                    case "thankyou" | "bye":
+                        dms.state = "Exit"
+                    case "restart":
+                        dms.state = "Welcome"
+                        dms.set_initial_values()
+                    case "ack" | "affirm" | "deny":
+                        dms.state = "RequestPreferences"
+                        dms.set_initial_values()
+                    case "inform" | "reqalts":
+                        dms.set_initial_values()
+                        dms.update_preferences(user_input)
+                        dms.choose_and_set_state()
+                    case "confirm" | "hello" | "negate" | "null" | "repeat" | "reqmore" | "request":
+                        return
+
+        case "OfferFurtherInformation":
+            match dialog_act:
+                case "thankyou" | "bye" | "negate":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "Welcome"
+                    dms.set_initial_values()
+                case "inform" | "reqalts":
+                    dms.update_preferences(user_input)
+                    dms.results = dms.lookup()
+                    dms.state = "TellLookupResults"
+                case "deny":
+                    dms.state = "RequestPreferences"
+                case "confirm":
+                    dms.state = "TellLookupResults"
+                case "reqmore":
+                    dms.choose_and_set_state(reqmore=True)
+                case "ack" | "affirm" | "hello" | "null" | "repeat" | "request":
+                    pass
+
+        case "AskForAcceptance":
+            match dialog_act:
+                case "thankyou" | "bye" | "ack" | "affirm":
+                    dms.state = "Exit"
+                case "restart":
+                    dms.state = "Welcome"
+                    dms.set_initial_values()
+                case "confirm":
+                    dms.state = "TellLookupResults"
+                case "deny" | "negate":
+                    dms.set_initial_values()
+                    dms.state = "RequestPreferences"
+                case "inform" | "reqalts":
+                    dms.update_preferences(user_input)
+                    dms.results = dms.lookup()
+                    dms.state = "TellLookupResults"
+                case "hello" | "null" | "repeat" | "reqmore" | "request":
+                    pass
+
+    # Update the utterance that the dialog system will return to the user.
+    dms.update_utterance()
+
+
+def reference_utils_transition(state_info, dialog_act):
+    """
+    The transition of utils.py as it was before the policy table: the
+    transition function of transition_handles.py for the state.
+    state_info: the state dictionary
+    dialog_act: the dialog act
+    """
+    match state_info["current_state"]:
+        case "Welcome":
+            state_info = handle_welcome(dialog_act, state_info)
+        case "RequestPreferences":
+            state_info = handle_request_preferences(dialog_act, state_info)
+        case "AskFoodType":
+            state_info = handle_ask_food_type(dialog_act, state_info)
+        case "AskPriceRange":
+            state_info = handle_ask_price_range(dialog_act, state_info)
+        case "AskArea":
+            state_info = handle_ask_area(dialog_act, state_info)
+        case "AskForFurtherPreferences":
+            state_info = handle_ask_for_further_preferences(dialog_act, state_info)
+        case "TellLookupResults":
+            state_info = handle_tell_lookup_results(dialog_act, state_info)
+        case "OfferFurtherInformation":
+            state_info = handle_offer_further_information(dialog_act, state_info)
+        case "AskForAcceptance":
+            state_info = handle_ask_for_acceptance(dialog_act, state_info)
+
+    return state_info
+
+
+class FixedClassifier:
+    """
+    Classifier that predicts a given dialog act.
+    """
+
+    def __init__(self, dialog_act):
+        self.dialog_act = dialog_act
+
+    def predict(self, sentences):
+        return [self.dialog_act] * len(sentences)
+
+
+def dms_state(dms):
+    """
+    Returns the state of the DMS that a transition may change.
+    """
+    return (dms.state, dms.pricerange, dms.area, dms.food, dms.additional, list(dms.results),
+            dms.current_suggestion, dms.system_utterance, dms.end_dialog)
+
+
+def run(transition, seed):
+    """
+    Returns the result of the transition, or the type of the exception it
+    raised. The random choices of the preference extractor are seeded, and
+    its output is hidden.
+    """
+    random.seed(seed)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return transition()
+    except Exception as error:
+        return type(error)
+
+
+def check_dms(db):
+    """
+    Replay the transitions of the DMS and return the number of transitions
+    and the list of the transitions that differ.
+    db: the RestaurantDB
+    """
+    differences = []
+    cases = itertools.product(DMS_TABLE.states + ["Unknown"], DIALOG_ACTS + ["unknown"], USER_INPUTS, PREFERENCES,
+                              ADDITIONAL, RESULTS, [0, 1])
+    n_cases = 0
+    for seed, (state, dialog_act, user_input, (food, area, price), additional, (results, suggestion),
+               formal) in enumerate(cases):
+        start = DMS(FixedClassifier(dialog_act), db)
+        start.state, start.formalOn, start.additional = state, formal, additional
+        for column, value in [("food", food), ("area", area), ("pricerange", price)]:
+            start.set_preference(column, value)
+        start.results, start.current_suggestion = np.array(results, dtype=np.int32), suggestion
+        table, reference = copy.copy(start), copy.copy(start)
+
+        table_error = run(lambda: table.transition(user_input), seed)
+        reference_error = run(lambda: reference_dms_transition(reference, dialog_act, user_input), seed)
+        if (table_error, dms_state(table)) != (reference_error, dms_state(reference)):
+            differences.append((state, dialog_act, user_input, food, area, price, additional, results, suggestion))
+        n_cases += 1
+    return n_cases, differences
+
+
+def check_utils():
+    """
+    Replay the transitions of utils.py and return the number of transitions
+    and the list of the transitions that differ.
+    """
+    differences = []
+    cases = itertools.product(UTILS_TABLE.states + ["Unknown"], DIALOG_ACTS + ["unknown"], PREFERENCES,
+                              ADDITIONAL, RESULTS)
+    n_cases = 0
+    for state, dialog_act, (food, area, price), additional, (results, suggestion) in cases:
+        start = utils.set_initial_state_info(0)
+        start["current_state"] = state
+        start["preferences"] = {"pricerange": price, "area": area, "food": food}
+        start["additional_preferences"] = {pref: bool(additional >> bit & 1)
+                                           for bit, pref in enumerate(start["additional_preferences"])}
+        start["results"], start["current_suggestion"] = np.array(results, dtype=np.int32), suggestion
+
+        table = utils.transition(copy.deepcopy(start), dialog_act)
+        reference = reference_utils_transition(copy.deepcopy(start), dialog_act)
+        table["results"], reference["results"] = list(table["results"]), list(reference["results"])
+        if table != reference:
+            differences.append((state, dialog_act, food, area, price, additional, results, suggestion))
+        n_cases += 1
+    return n_cases, differences
+
+
+def time_transitions(transition, n_turns=100_000, repeat=5):
+    """
+    Returns the time (in seconds) per transition of the dialog acts of a
+    random dialog, the best of several runs.
+    transition: function that does the transition of a dialog act
+    n_turns: the number of transitions
+    repeat: the number of runs
+    """
+    dialog_acts = random.Random(0).choices(DIALOG_ACTS, k=n_turns)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for dialog_act in dialog_acts:
+            transition(dialog_act)
+        timings.append((time.perf_counter() - start) / n_turns)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    db = RestaurantDB.from_csv()
+    failed = False
+    for name, (n_cases, differences) in [("DMS", check_dms(db)), ("utils", check_utils())]:
+        print(f"{name}: {n_cases} transitions replayed, {len(differences)} differ")
+        for difference in differences[:10]:
+            print("  ", difference)
+        failed = failed or len(differences) > 0
+
+    # The time per transition of a state dictionary with results, without the
+    # classification.
+    states = itertools.cycle(UTILS_TABLE.states)
+    state_info = utils.set_initial_state_info(0)
+    state_info["preferences"] = {"pricerange": "cheap", "area": "north", "food": "chinese"}
+    state_info["results"] = np.array([3, 5, 8], dtype=np.int32)
+    timings = []
+    for transition in [utils.transition, reference_utils_transition, lambda state_info, dialog_act: state_info]:
+        def replay(dialog_act):
+            state_info["current_state"] = next(states)
+            state_info["current_suggestion"] = 0
+            transition(state_info, dialog_act)
+        timings.append(time_transitions(replay))
+    # The time of the replay around the transitions is left out.
+    table_time, handles_time = timings[0] - timings[2], timings[1] - timings[2]
+    print(f"Time per transition of utils.py: table {table_time * 1e6:.2f} us, handles {handles_time * 1e6:.2f} us")
+
+    # The time per transition of a DMS with results, including the
+    # classification and the update of the system utterance.
+    states = itertools.cycle(DMS_TABLE.states)
+    classifier = FixedClassifier(None)
+    dms = DMS(classifier, db)
+    for column, value in [("food", "chinese"), ("area", "north"), ("pricerange", "cheap")]:
+        dms.set_preference(column, value)
+    preferences = (dms.pricerange, dms.area, dms.food)
+    results = np.array([3, 5, 8], dtype=np.int32)
+    timings = []
+    for transition in [lambda dms: dms.transition(""),
+                       lambda dms: reference_dms_transition(dms, dms.classify(""), ""),
+                       lambda dms: dms.classify("")]:
+        def replay(dialog_act):
+            classifier.dialog_act = dialog_act
+            dms.state, dms.results, dms.current_suggestion = next(states), results, 0
+            dms.pricerange, dms.area, dms.food = preferences
+            transition(dms)
+        timings.append(time_transitions(replay, n_turns=20_000))
+    table_time, handles_time = timings[0] - timings[2], timings[1] - timings[2]
+    print(f"Time per transition of the DMS: table {table_time * 1e6:.2f} us, handles {handles_time * 1e6:.2f} us")
+
+    if failed:
+        sys.exit(1)
+    print("OK: the tables behave like the reference state machines")
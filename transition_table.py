@@ -0,0 +1,279 @@
+# This file implements the dialog policy of the state machines as tables. A
+# policy is a list of rules (state, dialog acts, guard, next state, actions):
+# in the given state, after one of the given dialog acts and when the guard
+# holds, the actions are done and then the next state is set. The first rule
+# that matches is used. The rules are compiled into arrays indexed by the
+# codes of the state, the guard and the dialog act, and from those into one
+# function per state and dialog act, so a transition is two dictionary
+# lookups and a call instead of a chain of matches.
+#
+# DMS_POLICY is the policy of the DMS (DMS.py), UTILS_POLICY the policy of the
+# state machine of utils.py (transition_handles.py).
+#
+# The replay of every state, dialog act and guard against the state machines
+# the tables replaced is in transition_check.py.
+
+import numpy as np
+
+# The dialog acts of dialog_acts.dat. Other dialog acts are unknown.
+DIALOG_ACTS = ["ack", "affirm", "bye", "confirm", "deny", "hello", "inform", "negate", "null", "repeat", "reqalts",
+               "reqmore", "request", "restart", "thankyou"]
+# Next state of a rule that keeps the state (or leaves it to the actions).
+KEEP = None
+# Next state of a rule that keeps the state and does not update the system
+# utterance.
+SILENT = "silent"
+
+# The rules of the DMS. The guard is whether there are results of the
+# lookup: None matches both. The actions are the methods of the DMS that are
+# called with the user input ("update_preferences" and
+# "retrieve_extra_preferences"), or without it.
+DMS_POLICY = [
+    # state, dialog acts, has results, next state, actions
+    ("Welcome", "thankyou bye", None, "Exit", ()),
+    ("Welcome", "ack affirm confirm deny hello negate null reqmore request", None, "RequestPreferences", ()),
+    ("Welcome", "inform reqalts", None, KEEP, ("update_preferences", "choose_and_set_state")),
+
+    ("RequestPreferences", "thankyou bye", None, "Exit", ()),
+    ("RequestPreferences", "restart", None, "Welcome", ("set_initial_values",)),
+    ("RequestPreferences", "inform reqalts", None, KEEP, ("update_preferences", "choose_and_set_state")),
+
+    ("AskFoodType", "thankyou bye", None, "Exit", ()),
+    ("AskFoodType", "restart", None, "Welcome", ("set_initial_values",)),
+    ("AskFoodType", "inform reqalts", None, KEEP, ("update_preferences", "choose_and_set_state")),
+
+    ("AskArea", "thankyou bye", None, "Exit", ()),
+    ("AskArea", "restart", None, "Welcome", ("set_initial_values",)),
+    ("AskArea", "inform reqalts", None, KEEP, ("update_preferences", "choose_and_set_state")),
+
+    ("AskPriceRange", "thankyou bye", None, "Exit", ()),
+    ("AskPriceRange", "restart", None, "Welcome", ("set_initial_values",)),
+    ("AskPriceRange", "inform reqalts", None, KEEP, ("update_preferences", "choose_and_set_state")),
+
+    ("AskForFurtherRequirements", "thankyou bye", None, "Exit", ()),
+    # The state after a restart is "welcome", which has no rules.
+    ("AskForFurtherRequirements", "restart", None, "welcome", ("set_initial_values",)),
+    ("AskForFurtherRequirements", "inform reqalts", None, "TellLookupResults",
+     ("retrieve_extra_preferences", "lookup")),
+    ("AskForFurtherRequirements", "deny affirm", None, "RequestPreferences", ()),
+    ("AskForFurtherRequirements", "negate", None, KEEP, ("choose_and_set_state",)),
+
+    ("TellLookupResults", "thankyou bye", None, "Exit", ()),
+    ("TellLookupResults", "restart", None, "Welcome", ("set_initial_values",)),
+    ("TellLookupResults", "ack affirm request", True, "OfferFurtherInformation", ()),
+    ("TellLookupResults", "deny", True, "RequestPreferences", ()),
+    ("TellLookupResults", "inform reqalts", True, "TellLookupResults", ("update_preferences", "lookup")),
+    ("TellLookupResults", "reqmore", True, KEEP, ("choose_more",)),
+    ("TellLookupResults", "confirm hello negate null repeat", True, SILENT, ()),
+    ("TellLookupResults", "ack affirm deny", False, "RequestPreferences", ("set_initial_values",)),
+    ("TellLookupResults", "inform reqalts", False, KEEP,
+     ("set_initial_values", "update_preferences", "choose_and_set_state")),
+    ("TellLookupResults", "confirm hello negate null repeat reqmore request", False, SILENT, ()),
+
+    ("OfferFurtherInformation", "thankyou bye negate", None, "Exit", ()),
+    ("OfferFurtherInformation", "restart", None, "Welcome", ("set_initial_values",)),
+    ("OfferFurtherInformation", "inform reqalts", None, "TellLookupResults", ("update_preferences", "lookup")),
+    ("OfferFurtherInformation", "deny", None, "RequestPreferences", ()),
+    ("OfferFurtherInformation", "confirm", None, "TellLookupResults", ()),
+    ("OfferFurtherInformation", "reqmore", None, KEEP, ("choose_more",)),
+
+    ("AskForAcceptance", "thankyou bye ack affirm", None, "Exit", ()),
+    ("AskForAcceptance", "restart", None, "Welcome", ("set_initial_values",)),
+    ("AskForAcceptance", "confirm", None, "TellLookupResults", ()),
+    ("AskForAcceptance", "deny negate", None, "RequestPreferences", ("set_initial_values",)),
+    ("AskForAcceptance", "inform reqalts", None, "TellLookupResults", ("update_preferences", "lookup")),
+]
+
+# The rules of the state machine of utils.py. "*" matches every dialog act,
+# also unknown ones. The actions are the functions in utils.py that update
+# the state dictionary: "choose" sets the state with choose_transition.
+UTILS_POLICY = [
+    # state, dialog acts, has results, next state, actions
+    ("Welcome", "thankyou bye", None, "Exit", ()),
+    ("Welcome", "restart repeat", None, "Welcome", ()),
+    ("Welcome", "*", None, KEEP, ("choose",)),
+
+    ("RequestPreferences", "restart", None, "Welcome", ()),
+    ("RequestPreferences", "thankyou bye", None, "Exit", ()),
+    ("RequestPreferences", "*", None, KEEP, ("choose",)),
+
+    ("AskFoodType", "restart", None, "Welcome", ()),
+    ("AskFoodType", "thankyou bye", None, "Exit", ()),
+    ("AskFoodType", "*", None, KEEP, ("choose",)),
+
+    ("AskArea", "restart", None, "Welcome", ()),
+    ("AskArea", "thankyou bye", None, "Exit", ()),
+    ("AskArea", "*", None, KEEP, ("choose",)),
+
+    ("AskPriceRange", "restart", None, "Welcome", ()),
+    ("AskPriceRange", "thankyou bye", None, "Exit", ()),
+    ("AskPriceRange", "*", None, KEEP, ("choose",)),
+
+    ("AskForFurtherPreferences", "restart", None, "Welcome", ()),
+    ("AskForFurtherPreferences", "negate", None, "TellLookupResults", ()),
+    ("AskForFurtherPreferences", "ack affirm", None, "RequestPreferences", ()),
+    ("AskForFurtherPreferences", "thankyou bye", None, "Exit", ()),
+    ("AskForFurtherPreferences", "*", None, KEEP, ("choose",)),
+
+    ("TellLookupResults", "thankyou bye", None, "Exit", ()),
+    ("TellLookupResults", "restart", None, "Welcome", ()),
+    ("TellLookupResults", "inform reqalts", None, KEEP, ("choose",)),
+    ("TellLookupResults", "ack affirm request", True, "OfferFurtherInformation", ()),
+    ("TellLookupResults", "deny", True, "RequestPreferences", ()),
+    ("TellLookupResults", "reqmore", True, KEEP, ("suggest_next",)),
+    ("TellLookupResults", "ack affirm deny", False, "RequestPreferences", ()),
+
+    ("OfferFurtherInformation", "restart", None, "Welcome", ()),
+    ("OfferFurtherInformation", "deny", None, "RequestPreferences", ()),
+    ("OfferFurtherInformation", "reqmore", None, KEEP, ("suggest_next",)),
+    ("OfferFurtherInformation", "thankyou bye negate", None, "Exit", ()),
+    ("OfferFurtherInformation", "*", None, "TellLookupResults", ()),
+
+    ("AskForAcceptance", "restart", None, "Welcome", ()),
+    ("AskForAcceptance", "confirm", None, "TellLookupResults", ()),
+    ("AskForAcceptance", "deny negate", None, "RequestPreferences", ("reset_suggestion",)),
+    ("AskForAcceptance", "thankyou bye ack affirm", None, "Exit", ()),
+    ("AskForAcceptance", "reqmore", None, KEEP, ()),
+    ("AskForAcceptance", "*", None, "TellLookupResults", ()),
+]
+
+
+class Rules(dict):
+    """
+    The functions of the rules of a state by dialog act. Other (unknown)
+    dialog acts get the rule of unknown dialog acts.
+    """
+
+    def __init__(self, rules, unknown):
+        """
+        rules: dictionary of dialog act to the function of its rule.
+        unknown: the function of the rule of unknown dialog acts.
+        """
+        super().__init__(rules)
+        self.unknown = unknown
+
+    def __missing__(self, dialog_act):
+        return self.unknown
+
+
+class TransitionTable:
+    """
+    A policy compiled into arrays of the next state and the actions, by the
+    code of the state, the guard and the code of the dialog act.
+    """
+
+    def __init__(self, policy, dialog_acts=DIALOG_ACTS):
+        """
+        policy: list of rules (state, dialog acts, guard, next state,
+        actions), where the dialog acts are separated by spaces (or "*" for
+        every dialog act), the guard is True, False or None (both) and the
+        actions is a tuple of the names of the actions.
+        dialog_acts: the known dialog acts.
+        """
+        # The states in the order of the rules. The last code is used for
+        # states without rules.
+        self.states = list(dict.fromkeys([rule[0] for rule in policy] +
+                                         [rule[3] for rule in policy if rule[3] not in (KEEP, SILENT)]))
+        self.state_codes = {state: code for code, state in enumerate(self.states)}
+        self.dialog_acts = list(dialog_acts)
+        # The last code is used for unknown dialog acts.
+        self.act_codes = {act: code for code, act in enumerate(self.dialog_acts)}
+        self.unknown_act = len(self.dialog_acts)
+        # The different lists of actions; the first is no actions.
+        self.action_lists = [()]
+        self.actions = sorted({action for rule in policy for action in rule[4]})
+
+        shape = (len(self.states) + 1, 2, len(self.dialog_acts) + 1)
+        # The code of the next state (-1 keeps the state), the index into
+        # action_lists and whether the system utterance is updated.
+        self.next_states = np.full(shape, -1, dtype=np.int8)
+        self.action_codes = np.zeros(shape, dtype=np.int16)
+        self.update = np.ones(shape, dtype=bool)
+        done = np.zeros(shape, dtype=bool)
+        for state, acts, guard, next_state, actions in policy:
+            act_codes = (list(range(self.unknown_act + 1)) if acts == "*"
+                         else [self.act_codes[act] for act in acts.split()])
+            guards = [False, True] if guard is None else [guard]
+            if actions not in self.action_lists:
+                self.action_lists.append(actions)
+            for has_results in guards:
+                for act in act_codes:
+                    cell = (self.state_codes[state], int(has_results), act)
+                    # The first rule that matches is used.
+                    if done[cell]:
+                        continue
+                    done[cell] = True
+                    self.next_states[cell] = -1 if next_state in (KEEP, SILENT) else self.state_codes[next_state]
+                    self.action_codes[cell] = self.action_lists.index(actions)
+                    self.update[cell] = next_state != SILENT
+
+        # The cells as a flat list of (next state, actions, update) tuples,
+        # and the offset of the cells of every state, for fast transitions
+        # from Python.
+        next_states = [None if code < 0 else self.states[code] for code in self.next_states.ravel().tolist()]
+        self.cells = list(zip(next_states, self.action_codes.ravel().tolist(), self.update.ravel().tolist()))
+        self.guard_stride = len(self.dialog_acts) + 1
+        self.offsets = {state: code * 2 * self.guard_stride for code, state in enumerate(self.states)}
+        self.no_rules = len(self.states) * 2 * self.guard_stride
+
+    def bind(self, functions):
+        """
+        Returns the list of action lists with the actions replaced by their
+        functions, by the index of the action list.
+        functions: dictionary of the name of every action to its function.
+        """
+        return [tuple(functions[action] for action in actions) for actions in self.action_lists]
+
+    def bind_rules(self, functions, make_rule, make_guard):
+        """
+        Returns the rules compiled into functions, for the fastest transitions
+        from Python: a dictionary of every state to its Rules, and the Rules of
+        the states without rules. A transition is then one lookup of the state,
+        one of the dialog act and one call, and only the rules that depend on
+        whether there are results check them.
+        functions: dictionary of the name of every action to its function.
+        make_rule: function that returns the function of a rule, given the
+        next state (None to keep it), the tuple of the functions of the
+        actions and whether the system utterance is updated.
+        make_guard: function that returns the function of a rule that
+        depends on the results, given the functions of the rule without and
+        with results.
+        """
+        actions = self.bind(functions)
+        # Equal rules share their function.
+        made = {}
+
+        def bound(cell):
+            next_state, code, update = cell
+            if (next_state, code, update) not in made:
+                made[next_state, code, update] = make_rule(next_state, actions[code], update)
+            return made[next_state, code, update]
+
+        def rules(offset):
+            row = []
+            for act in range(self.unknown_act + 1):
+                without, with_results = (self.cells[offset + has_results * self.guard_stride + act]
+                                         for has_results in [0, 1])
+                rule = bound(without)
+                if with_results != without:
+                    rule = make_guard(rule, bound(with_results))
+                row.append(rule)
+            return Rules(zip(self.dialog_acts, row), row[self.unknown_act])
+
+        return {state: rules(offset) for state, offset in self.offsets.items()}, rules(self.no_rules)
+
+    def step(self, state, dialog_act, has_results):
+        """
+        Returns the next state (None to keep the state), the index of the
+        list of actions to do first, and whether the system utterance is
+        updated.
+        state: the current state
+        dialog_act: the dialog act of the user input
+        has_results: whether the lookup found restaurants
+        """
+        return self.cells[self.offsets.get(state, self.no_rules) + has_results * self.guard_stride +
+                          self.act_codes.get(dialog_act, self.unknown_act)]
+
+
+DMS_TABLE = TransitionTable(DMS_POLICY)
+UTILS_TABLE = TransitionTable(UTILS_POLICY)
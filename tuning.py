@@ -0,0 +1,238 @@
+# This file searches for the best type of dialog act classifier and its
+# hyperparameters with k-fold cross-validation. The folds are vectorized once
+# and shared by all candidates, and the (candidate, fold) pairs are trained in
+# parallel on all cores. Every finished candidate is written to a checkpoint
+# file, so an interrupted search continues where it stopped. The candidates
+# are ranked in a results table and the best one is trained on all data and
+# saved as the classifier of the chatbot.
+#
+# Usage: python tuning.py [--types rf sgd ...] [--folds 5] [--random 20] [--jobs -1]
+
+from benchmark import latency_percentiles
+from classifiers import create_classifier, export_forest, save_pipeline, train, vectorize
+from corpus_cache import corpus
+from itertools import product
+from joblib import Parallel, delayed
+import argparse
+import csv
+import json
+import numpy as np
+import os
+import random
+import time
+
+DATA_DIR = "data/dialog_acts.dat"
+CLASSIFIER_DIR = "data/classifier.joblib"
+VECTORIZER_DIR = "data/vectorizer.joblib"
+PIPELINE_DIR = "data/pipeline.joblib"
+FOREST_DIR = "data/forest.npz"
+CHECKPOINT_DIR = "data/tuning_trials.jsonl"
+RESULTS_DIR = "data/tuning_results.csv"
+# The number of utterances per fold used to measure the latency of a single
+# utterance. Note that the latency is measured while the other jobs are running.
+LATENCY_SAMPLES = 100
+
+# The hyperparameters to try per type of classifier.
+SEARCH_SPACE = {
+    "rf": {"n_estimators": [50, 100, 200], "max_depth": [None, 50]},
+    "svm": {"C": [1, 10], "kernel": ["linear", "rbf"]},
+    "logreg": {"C": [0.1, 1, 10]},
+    "logreg_tfidf": {"C": [1, 10, 100]},
+    "sgd": {"alpha": [1e-5, 1e-4, 1e-3], "loss": ["hinge", "log_loss"]},
+    "sgd_tfidf": {"alpha": [1e-5, 1e-4]},
+    "nb": {"alpha": [0.01, 0.1, 1.0]},
+}
+
+
+def read_data(data_dir):
+    """
+    Returns the list of labels and the list of sentences in the data file,
+    parsed once and cached in data/cache.
+    data_dir: data file
+    """
+    labels, sentences = corpus(data_dir)
+    return labels.tolist(), sentences
+
+
+def candidates(types, n_random=None, random_state=42):
+    """
+    Returns the list of (type, hyperparameters) candidates: all combinations
+    of the search space, or a random sample of n_random of them.
+    types: the types of classifiers to search
+    n_random: the number of random candidates, or None for the full grid.
+    random_state: random state for sampling the candidates
+    """
+    grid = []
+    for type in types:
+        names = list(SEARCH_SPACE.get(type, {}))
+        for values in product(*(SEARCH_SPACE[type][name] for name in names)):
+            grid.append((type, dict(zip(names, values))))
+    if n_random is not None and n_random < len(grid):
+        grid = random.Random(random_state).sample(grid, n_random)
+    return grid
+
+
+def trial_id(type, params, folds):
+    """
+    Returns the key of a candidate in the checkpoint file.
+    """
+    return json.dumps([type, params, folds], sort_keys=True)
+
+
+def vectorize_folds(labels, sentences, folds, random_state=42):
+    """
+    Returns a list of (vectorizer, x_train, y_train, x_val, y_val, sen_val)
+    tuples of the stratified folds of the data. The folds are split by
+    sentence, so a sentence that occurs more than once (with any of its
+    labels) is never in both the training and the validation sentences of a
+    fold. Each fold gets its own vectorizer, fitted on its training sentences.
+    labels: the dialog acts
+    sentences: the sentences
+    folds: the number of folds
+    random_state: random state for shuffling the data before splitting
+    """
+    from sklearn.model_selection import StratifiedGroupKFold
+
+    labels = np.array(labels)
+    # The group of every sentence: the index of its first occurrence.
+    first = {}
+    groups = [first.setdefault(sentence, i) for i, sentence in enumerate(sentences)]
+    splitter = StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=random_state)
+    vectorized = []
+    for train_idx, val_idx in splitter.split(sentences, labels, groups):
+        sen_train = [sentences[i] for i in train_idx]
+        sen_val = [sentences[i] for i in val_idx]
+        x_train, x_val, vectorizer = vectorize(sen_train, sen_val, None)
+        vectorized.append((vectorizer, x_train, labels[train_idx], x_val, labels[val_idx], sen_val))
+    return vectorized
+
+
+def evaluate(candidate, type, params, fold, vectorizer, x_train, y_train, x_val, y_val, sen_val):
+    """
+    Train a candidate on one fold and return the candidate, the fold, the
+    accuracy, the training time and the median and 99th percentile of the time
+    (in seconds) it takes to classify one utterance. Runs in a worker process.
+    """
+    from sklearn.pipeline import Pipeline
+
+    start = time.perf_counter()
+    model = train(create_classifier(type, **params), x_train, y_train, None)
+    train_time = time.perf_counter() - start
+    accuracy = float(np.mean(model.predict(x_val) == y_val))
+    pipeline = Pipeline([("vectorizer", vectorizer), ("classifier", model)])
+    p50, p99 = latency_percentiles(pipeline.predict, sen_val[:LATENCY_SAMPLES])
+    return candidate, fold, accuracy, train_time, float(p50), float(p99)
+
+
+def search(types, folds=5, n_random=None, jobs=-1, data_dir=DATA_DIR, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Cross-validate the candidates and return the list of results of all
+    candidates, including the ones in the checkpoint file.
+    types: the types of classifiers to search
+    folds: the number of folds
+    n_random: the number of random candidates, or None for the full grid.
+    jobs: the number of parallel jobs, -1 for all cores.
+    data_dir: data file
+    checkpoint_dir: the file with the results of the finished candidates
+    """
+    # The results of an earlier (interrupted) search.
+    done = {}
+    if os.path.exists(checkpoint_dir):
+        with open(checkpoint_dir) as file:
+            for line in file:
+                result = json.loads(line)
+                done[trial_id(result["type"], result["params"], result["folds"])] = result
+
+    todo = [(type, params) for type, params in candidates(types, n_random)
+            if trial_id(type, params, folds) not in done]
+    print(f"{len(done)} candidates in the checkpoint, {len(todo)} candidates to evaluate")
+    if len(todo) > 0:
+        labels, sentences = read_data(data_dir)
+        vectorized = vectorize_folds(labels, sentences, folds)
+
+        tasks = [(c, fold) for c in range(len(todo)) for fold in range(folds)]
+        fold_results = {c: [] for c in range(len(todo))}
+        jobs_results = Parallel(n_jobs=jobs, return_as="generator_unordered")(
+            delayed(evaluate)(c, *todo[c], fold, *vectorized[fold]) for c, fold in tasks)
+
+        with open(checkpoint_dir, "a") as checkpoint:
+            for c, *fold_result in jobs_results:
+                fold_results[c].append(fold_result)
+                if len(fold_results[c]) < folds:
+                    continue
+                # All folds of the candidate are finished.
+                type, params = todo[c]
+                _, accuracies, train_times, p50s, p99s = zip(*fold_results[c])
+                result = {"type": type,
+                          "params": params,
+                          "folds": folds,
+                          "accuracy": float(np.mean(accuracies)),
+                          "accuracy_std": float(np.std(accuracies)),
+                          "train_time": float(np.mean(train_times)),
+                          "latency": float(np.median(p50s)),
+                          "latency_p99": float(np.median(p99s))}
+                checkpoint.write(json.dumps(result) + "\n")
+                checkpoint.flush()
+                done[trial_id(type, params, folds)] = result
+                print(f"{type} {params}: accuracy {result['accuracy']:.4f}")
+
+    wanted = {trial_id(type, params, folds) for type, params in candidates(types, n_random)}
+    return [result for key, result in done.items() if key in wanted]
+
+
+def rank(results, results_dir=RESULTS_DIR):
+    """
+    Sort the results on accuracy (and then latency), write them to a CSV file
+    and return them.
+    results: the list of results of the candidates
+    results_dir: the path to the results table
+    """
+    results = sorted(results, key=lambda result: (-result["accuracy"], result["latency"]))
+    with open(results_dir, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["rank", "type", "params", "accuracy", "accuracy_std", "train_time",
+                         "latency_p50_ms", "latency_p99_ms"])
+        for i, result in enumerate(results):
+            writer.writerow([i + 1, result["type"], json.dumps(result["params"]), f"{result['accuracy']:.4f}",
+                             f"{result['accuracy_std']:.4f}", f"{result['train_time']:.3f}",
+                             f"{result['latency'] * 1e3:.3f}", f"{result['latency_p99'] * 1e3:.3f}"])
+    return results
+
+
+def save_best(result, data_dir=DATA_DIR):
+    """
+    Train the best candidate on all data and save it as the classifier of the
+    chatbot.
+    result: the result of the best candidate
+    data_dir: data file
+    """
+    labels, sentences = read_data(data_dir)
+    x_train, _, vectorizer = vectorize(sentences, [], VECTORIZER_DIR)
+    model = train(create_classifier(result["type"], **result["params"]), x_train, labels, CLASSIFIER_DIR)
+    save_pipeline(vectorizer, model, PIPELINE_DIR)
+    # Export the random forest for predicting without scikit-learn, or remove
+    # an earlier exported forest so it is not used instead.
+    if result["type"] == "rf":
+        export_forest(vectorizer, model, FOREST_DIR)
+    elif os.path.exists(FOREST_DIR):
+        os.remove(FOREST_DIR)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search the best dialog act classifier.")
+    parser.add_argument("--types", nargs="+", default=list(SEARCH_SPACE), help="types of classifiers")
+    parser.add_argument("--folds", type=int, default=5, help="number of folds")
+    parser.add_argument("--random", type=int, default=None, help="number of random candidates")
+    parser.add_argument("--jobs", type=int, default=-1, help="number of parallel jobs")
+    args = parser.parse_args()
+
+    results = rank(search(args.types, args.folds, args.random, args.jobs))
+    print(f"\n{'rank':<6}{'type':<14}{'accuracy':>10}{'latency (ms)':>14}  params")
+    for i, result in enumerate(results[:10]):
+        print(f"{i + 1:<6}{result['type']:<14}{result['accuracy']:>10.4f}{result['latency'] * 1e3:>14.3f}  "
+              f"{result['params']}")
+    print(f"Full results in {RESULTS_DIR}")
+
+    if len(results) > 0:
+        print(f"Training the best candidate on all data and saving it to {CLASSIFIER_DIR}")
+        save_best(results[0])
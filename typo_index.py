@@ -0,0 +1,96 @@
+# This file implements an index for finding the words of a vocabulary that are
+# within a maximal Levenshtein distance of a (misspelled) word. It uses the
+# symmetric delete algorithm: every vocabulary word is stored under all strings
+# that can be made from it by deleting at most max_distance characters. Two
+# words within the maximal distance always share such a string, so a lookup
+# only computes the distance to these candidates instead of the whole
+# vocabulary.
+
+from collections import defaultdict
+from Levenshtein import distance
+import random
+import string
+import time
+
+
+def deletes(word, max_distance):
+    """
+    Returns the set of strings obtained by deleting at most max_distance
+    characters from the word, including the word itself.
+    word: the word
+    max_distance: the maximal number of deleted characters
+    """
+    variants = {word}
+    current = {word}
+    for _ in range(max_distance):
+        current = {w[:i] + w[i+1:] for w in current for i in range(len(w))}
+        variants |= current
+    return variants
+
+
+class TypoIndex:
+    """
+    Index over a vocabulary that returns all words within the maximal
+    Levenshtein distance of a given word.
+    """
+
+    def __init__(self, words, max_distance):
+        """
+        words: the vocabulary. The order of the words is kept in the results.
+        max_distance: the maximal allowed Levenshtein distance.
+        """
+        self.words = list(words)
+        self.max_distance = max_distance
+        # Deleted variant -> ids of the vocabulary words it was made from.
+        self.variants = defaultdict(list)
+        for word_id, word in enumerate(self.words):
+            for variant in deletes(word, max_distance):
+                self.variants[variant].append(word_id)
+
+    def lookup(self, word):
+        """
+        Returns a list of (vocabulary word, distance) tuples for all words
+        within the maximal distance of the given word, in vocabulary order.
+        word: the (misspelled) word
+        """
+        candidates = set()
+        for variant in deletes(word, self.max_distance):
+            candidates.update(self.variants.get(variant, ()))
+
+        matches = []
+        for word_id in sorted(candidates):
+            dist = distance(word, self.words[word_id])
+            if dist <= self.max_distance:
+                matches.append((self.words[word_id], dist))
+        return matches
+
+
+if __name__ == '__main__':
+    # Compare the index to a scan over the whole vocabulary on a large,
+    # synthetic vocabulary.
+    MAX_DISTANCE = 2
+    random.seed(42)
+    vocabulary = list({"".join(random.choices(string.ascii_lowercase, k=random.randint(4, 12)))
+                       for _ in range(5000)})
+    queries = ["".join(random.choices(string.ascii_lowercase, k=random.randint(3, 12)))
+               for _ in range(500)]
+    # Misspelled vocabulary words.
+    queries += [w[:2] + w[3:] for w in random.sample(vocabulary, 500)]
+
+    start = time.perf_counter()
+    index = TypoIndex(vocabulary, MAX_DISTANCE)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scan_results = [[(w, distance(q, w)) for w in vocabulary if distance(q, w) <= MAX_DISTANCE]
+                    for q in queries]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_results = [index.lookup(q) for q in queries]
+    index_time = time.perf_counter() - start
+
+    print(f"Vocabulary size: {len(vocabulary)}, build time: {build_time:.2f}s")
+    print(f"Scan:  {scan_time / len(queries) * 1e6:.1f} us per lookup")
+    print(f"Index: {index_time / len(queries) * 1e6:.1f} us per lookup")
+    print(f"Same results: {scan_results == index_results}")
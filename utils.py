@@ -1,52 +1,151 @@
 from transition_handles import *
-from preferences import extract_prefs
-import pandas as pd
+from preferences import get_extractor
+from restaurant_db import NO_RESULTS, SLOTS, RestaurantDB, additional_code
+from restaurant_table import is_missing
+from transition_table import UTILS_TABLE
 
+# The database shared by the module level functions, built on first use for
+# the database (Table or dataframe) they were given.
+_db = None
 
-def transition(state_info, dialog_act):
-    match state_info["current_state"]:
-        case "Welcome":
-            state_info = handle_welcome(dialog_act, state_info)
-        case "RequestPreferences":
-            state_info = handle_request_preferences(dialog_act, state_info)
-        case "AskFoodType":
-            state_info = handle_ask_food_type(dialog_act, state_info)
-        case "AskPriceRange":
-            state_info = handle_ask_price_range(dialog_act, state_info)
-        case "AskArea":
-            state_info = handle_ask_area(dialog_act, state_info)
-        case "AskForFurtherPreferences":
-            state_info = handle_ask_for_further_preferences(dialog_act, state_info)
-        case "TellLookupResults":
-            state_info = handle_tell_lookup_results(dialog_act, state_info)
-        case "OfferFurtherInformation":
-            state_info = handle_offer_further_information(dialog_act, state_info)
-        case "AskForAcceptance":
-            state_info = handle_ask_for_acceptance(dialog_act, state_info)
 
+def transition(state_info, dialog_act):
+    # The rule of the dialog policy (transition_table.py) for the state and
+    # the dialog act, compiled into a function (see make_rule).
+    RULES.get(state_info["current_state"], NO_RULES)[dialog_act](state_info)
     return state_info
 
 
-def act(data, state_info):
+def choose(state_info):
+    """
+    Set the state with choose_transition.
+    """
+    state_info["current_state"] = choose_transition(state_info["current_state"],
+                                                    state_info["preferences"],
+                                                    state_info["additional_preferences"])
+
+
+def suggest_next(state_info):
+    """
+    Suggest the next restaurant, or ask to accept the current suggestion if
+    there are no more restaurants.
+    """
+    if len(state_info["results"]) - (state_info["current_suggestion"] + 1) > 0:
+        state_info["current_suggestion"] += 1
+        state_info["current_state"] = "TellLookupResults"
+    else:
+        state_info["current_state"] = "AskForAcceptance"
+
+
+def reset_suggestion(state_info):
+    """
+    Start again with the first suggestion and no additional preferences.
+    """
+    state_info["current_suggestion"] = 0
+    state_info["additional_preferences"] = {"touristic": False,
+                                            "assigned seats": False,
+                                            "children": False,
+                                            "romantic": False}
+
+
+def make_rule(next_state, actions, update):
+    """
+    Returns the function of a rule of the dialog policy, which does the
+    actions and then sets the next state of the state dictionary.
+    next_state: the next state, or None to keep the state (or leave it to
+    the actions).
+    actions: tuple of the functions of the actions.
+    update: whether the system utterance is updated (always in utils.py).
+    """
+    if next_state is None and len(actions) == 1:
+        return actions[0]
+    if len(actions) == 0:
+        if next_state is None:
+            return lambda state_info: None
+
+        def set_state(state_info):
+            state_info["current_state"] = next_state
+        return set_state
+
+    def rule(state_info):
+        for action in actions:
+            action(state_info)
+        if next_state is not None:
+            state_info["current_state"] = next_state
+    return rule
+
+
+def make_guard(without_results, with_results):
+    """
+    Returns the function of a rule that depends on whether there are results.
+    without_results: the function of the rule without results.
+    with_results: the function of the rule with results.
+    """
+    def rule(state_info):
+        if len(state_info.get("results", NO_RESULTS)) > 0:
+            with_results(state_info)
+        else:
+            without_results(state_info)
+    return rule
+
+
+# The rules of the dialog policy compiled into functions, by state and
+# dialog act.
+RULES, NO_RULES = UTILS_TABLE.bind_rules({"choose": choose, "suggest_next": suggest_next,
+                                          "reset_suggestion": reset_suggestion}, make_rule, make_guard)
+
+
+def get_db(data, extractor=None):
+    """
+    Returns the RestaurantDB of the database. The database of a Table or
+    dataframe is built once and reused while the same one is given.
+    data: the database (Table or dataframe) with restaurants, or a RestaurantDB.
+    extractor: the preference extractor for the database, or None to use
+    the shared extractor.
+    """
+    global _db
+    if isinstance(data, RestaurantDB):
+        return data
+    if data is None:
+        raise ValueError("no database given: pass the restaurants (Table or dataframe) or a RestaurantDB")
+    if _db is None or _db.data is not data:
+        _db = RestaurantDB(data, extractor if extractor is not None else get_extractor())
+    return _db
+
+
+def act(data, state_info, extractor=None, ask=None, say=None):
+    """
+    Show the system utterance of the state and get the user input. Returns
+    the state dictionary and the user input.
+    data: the database (Table or dataframe) with restaurants, or a RestaurantDB.
+    state_info: the state dictionary.
+    extractor: the preference extractor, or None to use the shared extractor.
+    ask: function that shows the system utterance and returns the user input,
+    or None for input (a simulated user can be given instead).
+    say: function that shows the last system utterance, or None for print.
+    """
+    if ask is None:
+        ask = input
+    if say is None:
+        say = print
+    db = get_db(data, extractor)
     if state_info["current_state"] == "Welcome":
         state_info = set_initial_state_info(state_info["formalOn"])
     if state_info["current_state"] == "TellLookupResults":
-        state_info["results"] = lookup(data, state_info)
-    if state_info["current_state"] == "OfferFurtherInformation":
-        state_info["current_info"] = retrieve_restaurant_info(state_info)
+        state_info["results"] = lookup(db, state_info)
     if state_info["current_state"] == "Exit":
-        print(get_text(state_info))
+        say(get_text(state_info, db))
         state_info["end_conversation"] = True
         return state_info, ""
 
-    state_info["utterance"] = get_text(state_info)
-    user_input = input(state_info["utterance"])
+    state_info["utterance"] = get_text(state_info, db)
+    user_input = ask(state_info["utterance"])
 
     if user_input == "quit":
         state_info["end_conversation"] = True
         return state_info, ""
 
-    state_info = extract_information(state_info, user_input)
+    state_info = extract_information(state_info, user_input, extractor)
 
     return state_info, user_input
 
@@ -62,36 +161,38 @@ def set_initial_state_info(formalOn):
                                          "romantic": False},
             "utterance": "",
             "formalOn": formalOn,
-            "results": pd.DataFrame(),
-            "current_info": pd.Series(),
+            # The row numbers of the restaurants found in the database.
+            "results": NO_RESULTS,
             "current_suggestion": 0,
             "end_conversation": False}
 
     return info
 
 
-def extract_information(state_info, user_input):
-    for pref in state_info["additional_preferences"].keys():
-        if pref in user_input:
-            state_info["additional_preferences"][pref] = True
-            user_input = user_input.replace(pref, "")
+def extract_information(state_info, user_input, extractor=None):
+    if extractor is None:
+        extractor = get_extractor()
+
+    found, user_input = extractor.find_additional_prefs(user_input)
+    for pref in found:
+        state_info["additional_preferences"][pref] = True
 
     if state_info["current_state"] == "AskFoodType":
-        _, food, _ = extract_prefs(user_input, "food")
+        _, food, _ = extractor.extract_prefs(user_input, "food")
         if food != "":
             state_info["preferences"]["food"] = food
 
     elif state_info["current_state"] == "AskPriceRange":
-        _, _, price = extract_prefs(user_input, "pricerange")
+        _, _, price = extractor.extract_prefs(user_input, "pricerange")
         if price != "":
             state_info["preferences"]["pricerange"] = price
 
     elif state_info["current_state"] == "AskArea":
-        area, _, _ = extract_prefs(user_input, "area")
+        area, _, _ = extractor.extract_prefs(user_input, "area")
         if area != "":
             state_info["preferences"]["area"] = area
 
-    output = extract_prefs(user_input)
+    output = extractor.extract_prefs(user_input)
     for key, val in zip(["area", "food", "pricerange"], output):
         if val != "":
             state_info["preferences"][key] = val
@@ -99,7 +200,12 @@ def extract_information(state_info, user_input):
     return state_info
 
 
-def get_text(state_info):
+def get_text(state_info, data):
+    """
+    Returns the system utterance of the state.
+    state_info: the state dictionary.
+    data: the database (Table or dataframe) with restaurants, or a RestaurantDB.
+    """
     match state_info["current_state"]:
         case "Welcome":
             line = ["Welcome to the system, enter your preferences for a restaurant. ",
@@ -117,20 +223,20 @@ def get_text(state_info):
             line = ["Any other preferences? ", "Do you have additional preferences? "][state_info["formalOn"]]
         case "TellLookupResults":
             if len(state_info["results"]) > 0:
-                name = state_info["results"].iloc[state_info["current_suggestion"]].restaurantname
-                food = state_info["results"].iloc[state_info["current_suggestion"]].food
-                area = state_info["results"].iloc[state_info["current_suggestion"]].area
-                pricerange = state_info["results"].iloc[state_info["current_suggestion"]].pricerange
+                restaurant = get_db(data).restaurant(state_info["results"][state_info["current_suggestion"]])
+                name = restaurant.restaurantname
+                food = restaurant.food
+                area = restaurant.area
+                pricerange = restaurant.pricerange
                 utterance = f"{name} is a restaurant which"
-                if not pd.isna(food):
+                if not is_missing(food):
                     utterance += f" serves {food} food"
-                if not pd.isna(pricerange):
+                if not is_missing(pricerange):
                     utterance += f" has {pricerange} prices"
-                if not pd.isna(area):
+                if not is_missing(area):
                     utterance += f" and is in the {area} of town"
                 utterance += ". This is all known information about food type, price range and area."
-                line = utterance + get_string_for_additional_requirements(
-                    state_info["results"].iloc[state_info["current_suggestion"]], state_info)
+                line = utterance + get_string_for_additional_requirements(restaurant, state_info)
             else:
                 line = ["No restaurant meets your preferences. Change them. ",
                         "Sorry, but there is no restaurant that meets your preferences. "
@@ -138,7 +244,7 @@ def get_text(state_info):
         case "OfferFurtherInformation":
             utterance = ["This is all the info known:\n",
                  "The following information about the restaurant is known:\n"][state_info["formalOn"]]
-            for cat, val in state_info["current_info"].items():
+            for cat, val in retrieve_restaurant_info(data, state_info):
                 utterance += f"{cat}: {val}\n"
             utterance += ["Anything else I can do? ",
                   "How can I help you further? "][state_info["formalOn"]]
@@ -151,40 +257,24 @@ def get_text(state_info):
                     "Okay,thank you for making use of this DMS. Have a nice day!"][state_info["formalOn"]]
     return line
 
-def retrieve_restaurant_info(state_info):
-    info = state_info["results"].iloc[state_info["current_suggestion"]][["phone", "addr", "postcode"]]
-    for cat, val in info.items():
-        if pd.isna(val):
-            info[cat] = "unknown"
-
-    return info
+def retrieve_restaurant_info(data, state_info):
+    """
+    Returns the phone number, address and postcode of the current suggestion
+    as a list of (category, value) tuples.
+    data: the database (Table or dataframe) with restaurants, or a RestaurantDB.
+    state_info: the state dictionary.
+    """
+    return get_db(data).contact_info(state_info["results"][state_info["current_suggestion"]])
 
 
 def lookup(data, state_info):
     """
-    Lookup the restaurants that satisfy the preferences of the user.
+    Lookup the restaurants that satisfy the preferences of the user. Returns
+    their row numbers in the database.
     """
-    results = data.copy()
-    masks = [results[column] == value for column, value in state_info["preferences"].items() if value != "any"]
-    if len(masks) > 0:
-        combined_mask = pd.concat(masks, axis=1).all(axis=1)
-        return filter_on_additional_requirements(results[combined_mask], state_info)
-    else:
-        return results
-
-
-def filter_on_additional_requirements(df, state_info):
-
-    if state_info["additional_preferences"]["touristic"]:
-        return df[((df["pricerange"] == "cheap") & (df["quality"] == "good")) | (df["food"].isin(["chinese", "italian", "european", "indian", "british", "asian oriental"]))]
-    elif state_info["additional_preferences"]["assigned seats"]:
-        return df[df["crowdedness"] == "busy"]
-    elif state_info["additional_preferences"]["children"]:
-        return df[df["stay"] == "short"]
-    elif state_info["additional_preferences"]["romantic"]:
-        return df[(df["stay"] == "long") | (df["crowdedness"] == "not busy")]
-    else:
-        return df
+    db = get_db(data)
+    preferences = [db.encode(column, state_info["preferences"][column]) for column in SLOTS]
+    return db.lookup(preferences, additional_code(state_info["additional_preferences"]))
 
 
 def get_string_for_additional_requirements(df, state_info):